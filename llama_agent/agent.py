@@ -1,6 +1,10 @@
+import asyncio
+import contextvars
 import os
-from typing import Literal, Optional, Tuple, Union
-from llama_stack_client import LlamaStackClient
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack
+from typing import Any, Literal, Optional, Sequence, Tuple, Union
+from llama_stack_client import AsyncLlamaStackClient, LlamaStackClient
 from llama_models.llama3.api.chat_format import ChatFormat
 from llama_models.llama3.api.tokenizer import Tokenizer
 from llama_models.llama3.api.datatypes import StopReason
@@ -9,14 +13,36 @@ from llama_models.llama3.api.tool_utils import (
     parse_python_list_for_function_calls,
 )
 import re
-from llama_agent.utils.file_tree import list_files_in_repo
+from llama_agent.aio import as_async_client, run_exec
+from llama_agent.best_of_n import (
+    ATTEMPT_TEMPERATURES,
+    QUALIFYING_SCORE,
+    Attempt,
+    Scorer,
+    apply_changes,
+    best_attempt,
+    collect_changes,
+    syntax_scorer,
+    working_copy,
+)
+from llama_agent.streaming import stream_completion_async
+from llama_agent.tracing import span
+from llama_agent.conversation import Conversation, chat_message, encode, header
+from llama_agent.context import ContextBudget
+from llama_agent.file_view import parse_line_range
+from llama_agent.edits import Edit, apply_edits, atomic_write
+from llama_agent.search import SEARCH_MAX_LINE_CHARS, SEARCH_PAGE_SIZE
+from llama_agent.symbols import SYMBOL_RESULTS_LIMIT
+from llama_agent.workspace import Workspace
 from llama_agent import REPO_DIR
 from ansi import red, yellow, magenta, blue
-from subprocess import run
 
 # Currently only supports 3.3-70B-Instruct at the moment since it depends on the 3.3/3.2 tool prompt format
 MODEL_ID = "meta-llama/Llama-3.3-70B-Instruct"
 ITERATIONS = 15
+# Tools that only read the repository, so they can run concurrently with each other
+READ_ONLY_TOOLS = {"list_files", "view_file", "search_code", "find_definition", "find_references"}
+TOOL_WORKERS = 8
 
 SANDBOX_DIR = os.path.join(REPO_DIR, "sandbox")
 # We give the agent a virtual working directory so it doesn't have to worry about long absolute paths
@@ -26,19 +52,105 @@ formatter = ChatFormat(Tokenizer.get_instance())
 
 
 def run_agent(
-    client: LlamaStackClient, repo: str, issue_title: str, issue_body: str
+    client: LlamaStackClient,
+    repo: str,
+    issue_title: str,
+    issue_body: str,
+    stream: bool = False,
+    use_stop_sequences: bool = False,
+    context_budget: Optional[ContextBudget] = None,
+    workspace: Optional[Workspace] = None,
+    attempts: int = 1,
+    temperatures: Optional[Sequence[float]] = None,
+    scorer: Optional[Scorer] = None,
+) -> Tuple[Literal["changes_made", "no_changes_made"], str, Optional[str]]:
+    """
+    Synchronous wrapper around run_agent_async. Takes the same arguments, but `client` may also be a synchronous
+    client, whose calls are then made on worker threads. Can't be called from a running event loop
+    """
+    return asyncio.run(
+        run_agent_async(
+            as_async_client(client),
+            repo,
+            issue_title,
+            issue_body,
+            stream=stream,
+            use_stop_sequences=use_stop_sequences,
+            context_budget=context_budget,
+            workspace=workspace,
+            attempts=attempts,
+            temperatures=temperatures,
+            scorer=scorer,
+        )
+    )
+
+
+async def run_agent_async(
+    client: AsyncLlamaStackClient,
+    repo: str,
+    issue_title: str,
+    issue_body: str,
+    stream: bool = False,
+    use_stop_sequences: bool = False,
+    context_budget: Optional[ContextBudget] = None,
+    workspace: Optional[Workspace] = None,
+    attempts: int = 1,
+    temperatures: Optional[Sequence[float]] = None,
+    scorer: Optional[Scorer] = None,
+    sampling_params: Optional[dict[str, Any]] = None,
+    attempts_dir: Optional[str] = None,
 ) -> Tuple[Literal["changes_made", "no_changes_made"], str, Optional[str]]:
     """
+    Run the agent on an issue. Inference and git calls are awaited, and tool calls run on worker threads,
+    so many agents can share one event loop.
+
+    Args:
+        client (AsyncLlamaStackClient): The client to run inference with. Anything with an async
+            `inference.completion`, e.g., a sync client wrapped with llama_agent.aio.as_async_client
+        stream (bool): Stream completions and stop generating as soon as the tool call block is complete.
+            Also reports time to first token and time to tool call for each iteration.
+        use_stop_sequences (bool): When streaming, also pass </tool> as a stop sequence to the server
+        context_budget (Optional[ContextBudget]): Token budget for the prompt. Old tool observations are compacted
+            once the prompt goes over it. Defaults to ContextBudget()
+        workspace (Optional[Workspace]): The sandbox the repo lives in. Defaults to the shared SANDBOX_DIR
+        attempts (int): Run this many attempts at once, each in its own working copy, and keep the best one.
+            See run_best_of_n_async
+        temperatures (Optional[Sequence[float]]): The sampling temperature of each attempt. Defaults to ATTEMPT_TEMPERATURES
+        scorer (Optional[Scorer]): How to score attempts. Defaults to syntax_scorer
+        sampling_params (Optional[dict[str, Any]]): Sampling params for the tool calling completions. Defaults to the server's
+        attempts_dir (Optional[str]): Where to put the attempts' working copies. Defaults to a directory in the workspace
+
     Returns:
         Tuple[Literal["changes_made", "no_changes_made"], str, Optional[str]]:
             ("changes_made", pr_title, pr_body): "changes_made", the PR title, and the PR body
             or ("no_changes_made", reasoning, None): "no_changes_made", the reason why no changes were made, and None
     """
 
+    if workspace is None:
+        workspace = Workspace(SANDBOX_DIR)
+    if attempts > 1:
+        return await run_best_of_n_async(
+            client,
+            repo,
+            issue_title,
+            issue_body,
+            attempts,
+            temperatures=temperatures,
+            scorer=scorer,
+            stream=stream,
+            use_stop_sequences=use_stop_sequences,
+            context_budget=context_budget,
+            workspace=workspace,
+            attempts_dir=attempts_dir,
+        )
+    repo_path = os.path.join(workspace.sandbox_dir, repo)
+
+    conversation = Conversation()
+    if context_budget is None:
+        context_budget = ContextBudget()
+
     # System prompt
-    message = "<|begin_of_text|>"
-    message += header("system")
-    message += """
+    conversation.append("system", """
     You are an expert software engineer.
     You will be given a problem statement in <problem_statement>
 
@@ -88,9 +200,23 @@ def run_agent(
                 }
             }
         },
+        {
+            "name": "edit_files",
+            "description": "Make several edits to one or more files at once. Either every edit is made or, if any edit fails, no file is changed. Each edit either replaces old_str with new_str, where old_str must appear exactly once in the file, or replaces the lines from start_line to end_line with new_str. Edits to the same file are made in order, so line numbers must account for earlier edits in the list.",
+            "parameters": {
+                "type": "dict",
+                "required": ["edits"],
+                "properties": {
+                    "edits": {
+                        "type": "list",
+                        "description": "The edits to make, e.g. `[{'path': '/workspace/django/file.py', 'old_str': 'x = 1', 'new_str': 'x = 2'}, {'path': '/workspace/django/other.py', 'start_line': 10, 'end_line': 12, 'new_str': 'y = 3'}]`"
+                    }
+                }
+            }
+        },
         {
             "name": "view_file",
-            "description": "View a file",
+            "description": "View a file. Large files are shown a page of lines at a time, use start_line and end_line to view the rest.",
             "parameters": {
                 "type": "dict",
                 "required": ["path"],
@@ -98,6 +224,80 @@ def run_agent(
                     "path": {
                         "type": "string",
                         "description": "The absolute path to the file to view, e.g. `/workspace/django/file.py` or `/workspace/django`."
+                    },
+                    "start_line": {
+                        "type": "integer",
+                        "description": "The first line to view, starting from 1. If not specified, starts at the beginning of the file."
+                    },
+                    "end_line": {
+                        "type": "integer",
+                        "description": "The last line to view, inclusive. If not specified, views a page of lines from start_line."
+                    }
+                }
+            }
+        },
+        {
+            "name": "search_code",
+            "description": "Search the contents of the files in a directory, e.g. to find where a function is defined or used. Returns matching lines as `path:line_number: line`, a page of results at a time.",
+            "parameters": {
+                "type": "dict",
+                "required": ["path", "query"],
+                "properties": {
+                    "path": {
+                        "type": "string",
+                        "description": "Absolute path to the directory to search in, e.g. `/workspace/django` or `/workspace/django/django/db`."
+                    },
+                    "query": {
+                        "type": "string",
+                        "description": "The text to search for, e.g. `def get_queryset`."
+                    },
+                    "regex": {
+                        "type": "boolean",
+                        "description": "If true, query is a Python regular expression, e.g. `class \\w+Admin\\(`. Defaults to false."
+                    },
+                    "case_sensitive": {
+                        "type": "boolean",
+                        "description": "Defaults to true."
+                    },
+                    "page": {
+                        "type": "integer",
+                        "description": "The page of results to return, starting from 1. Defaults to 1."
+                    }
+                }
+            }
+        },
+        {
+            "name": "find_definition",
+            "description": "Find where a Python class, function, method or module level variable is defined. Returns `path:line_number: kind qualified_name` for each definition.",
+            "parameters": {
+                "type": "dict",
+                "required": ["path", "name"],
+                "properties": {
+                    "path": {
+                        "type": "string",
+                        "description": "Absolute path to the directory to search in, e.g. `/workspace/django`."
+                    },
+                    "name": {
+                        "type": "string",
+                        "description": "The name to find, optionally qualified with its class or module, e.g. `get_queryset`, `ModelAdmin.get_queryset` or `django.contrib.admin.options.ModelAdmin`."
+                    }
+                }
+            }
+        },
+        {
+            "name": "find_references",
+            "description": "Find the lines of Python code that use a name, e.g. calls to a function or uses of a class. Matches on the name only, so uses of other symbols with the same name are included. Returns `path:line_number: line`.",
+            "parameters": {
+                "type": "dict",
+                "required": ["path", "name"],
+                "properties": {
+                    "path": {
+                        "type": "string",
+                        "description": "Absolute path to the directory to search in, e.g. `/workspace/django`."
+                    },
+                    "name": {
+                        "type": "string",
+                        "description": "The name to find uses of, e.g. `get_queryset`."
                     }
                 }
             }
@@ -110,18 +310,14 @@ def run_agent(
     ]
 
     Please explain your reasoning before you make any edits in a <thinking> tag.
-
-    <|eot_id|>
-    """.strip()
+    """.strip())
 
     # User prompt
-    message += header("user")
-    files_in_repo = "\n".join(
-        list_files_in_repo(os.path.join(SANDBOX_DIR, repo), depth=2)
-    )
-    message += f"""
+    # Builds the file index on the first call, which reads the whole repo
+    files_in_repo = "\n".join(await asyncio.to_thread(workspace.list_files, repo_path, depth=2))
+    conversation.append("user", f"""
     <working_directory>
-    {os.path.join(SANDBOX_DIR, repo)}
+    {repo_path}
     </working_directory>
 
     <file_tree>
@@ -135,8 +331,8 @@ def run_agent(
 
     You are in the working directory as specified in <working_directory>. Please specify paths in absolute paths only.
     I have included the top level files and directories in the repository in <file_tree>.
-    Please start by listing out and viewing files in the repository to understand the problem.<|eot_id|>
-    """.strip()
+    Please start by listing out and viewing files in the repository to understand the problem.
+    """.strip())
 
     finished = False
     for i in range(ITERATIONS):
@@ -147,129 +343,309 @@ def run_agent(
         if finished:
             break
 
-        message += header("assistant")
-        response = client.inference.completion(
-            model_id=MODEL_ID,
-            content=message,
-        )
-
-        # Display thinking alongside with tool calls
-        thinking_match = re.search(
-            r"<thinking>(.*?)</thinking>", response.content, re.DOTALL
-        )
-        if thinking_match:
-            print(f"Thinking: {magenta(thinking_match.group(1).strip())}")
-        else:
-            # Check for any text outside of tool tags
-            non_tool_content = re.sub(
-                r"<tool>.*?</tool>", "", response.content, flags=re.DOTALL
-            ).strip()
-            if non_tool_content:
-                print(f"Thinking: {magenta(non_tool_content)}")
-
-        message += response.content
-        message += f"<|eot_id|>"
-
-        # Evaluate tool calls
-        tool_calls = parse_tool_calls(response.content)
-        for tool_call in tool_calls:
-
-            if tool_call[0] == "error":
-                _, error_message = tool_call
-                msg = f"ERROR - Could not parse tool call: {error_message}"
-                print(red(msg))
-                message += chat_message("tool", msg)
-                continue
+        with span("iteration", iteration=i + 1):
+            saved = context_budget.enforce(conversation)
+            if saved:
+                print(yellow(f"Compacted old tool results to stay under the context budget: saved {saved} tokens"))
+            print(f"Prompt tokens: {conversation.prompt_token_count('assistant')}")
+            prompt = conversation.prompt("assistant")
+            with span("inference", prompt_tokens=conversation.prompt_token_count("assistant"), stream=stream) as inference:
+                if stream:
+                    response = await stream_completion_async(
+                        client,
+                        MODEL_ID,
+                        prompt,
+                        use_stop_sequences=use_stop_sequences,
+                        sampling_params=sampling_params,
+                    )
+                    print(f"Timings: {response.timings()}")
+                    inference.set(time_to_first_token=response.time_to_first_token, stopped_early=response.stopped_early)
+                else:
+                    response = await client.inference.completion(
+                        model_id=MODEL_ID,
+                        content=prompt,
+                        **({"sampling_params": sampling_params} if sampling_params else {}),
+                    )
+                # Tokenized when it's appended, so the count is free
+                inference.set(completion_tokens=conversation.append("assistant", response.content).token_count)
 
-            tool_name, tool_params = tool_call
-            msg = (
-                f"Executing tool call: "
-                + blue(f"[{tool_name}{display_tool_params(tool_params)}]")
+            # Display thinking alongside with tool calls
+            thinking_match = re.search(
+                r"<thinking>(.*?)</thinking>", response.content, re.DOTALL
             )
-            message += header("tool")
-            message += msg + "\n"
-            print(msg)
-
-            try:
-                result, result_msg = execute_tool_call(tool_name, tool_params)
-            except Exception as e:
-                result, result_msg = ("error", f"ERROR - Calling tool: {tool_name} {e}")
+            if thinking_match:
+                print(f"Thinking: {magenta(thinking_match.group(1).strip())}")
+            else:
+                # Check for any text outside of tool tags
+                non_tool_content = re.sub(
+                    r"<tool>.*?</tool>", "", response.content, flags=re.DOTALL
+                ).strip()
+                if non_tool_content:
+                    print(f"Thinking: {magenta(non_tool_content)}")
+
+            # Evaluate tool calls
+            tool_calls = parse_tool_calls(response.content)
+            results = iter(
+                await asyncio.to_thread(
+                    execute_tool_calls,
+                    [tool_call for tool_call in tool_calls if tool_call[0] != "error"],
+                    workspace=workspace,
+                )
+            )
+            for tool_call in tool_calls:
+
+                if tool_call[0] == "error":
+                    _, error_message = tool_call
+                    msg = f"ERROR - Could not parse tool call: {error_message}"
+                    print(red(msg))
+                    conversation.append("tool", msg)
+                    continue
+
+                tool_name, tool_params = tool_call
+                msg = (
+                    f"Executing tool call: "
+                    + blue(f"[{tool_name}{display_tool_params(tool_params)}]")
+                )
+                print(msg)
 
-            message += f"Result: {result_msg}\n"
+                result, result_msg = next(results)
 
-            if result == "success":
-                # Truncate the result message to 200 characters since it can be long
-                print("Result: " + result_msg[:200] + "...")
-            else:
-                print("Result: " + result_msg)
+                conversation.append(
+                    "tool",
+                    msg + "\n" + f"Result: {result_msg}\n",
+                    {"tool_name": tool_name, "tool_params": tool_params, "result": result},
+                )
 
-            message += f"<|eot_id|>"
+                if result == "success":
+                    # Truncate the result message to 200 characters since it can be long
+                    print("Result: " + result_msg[:200] + "...")
+                else:
+                    print("Result: " + result_msg)
 
-            if result == "success" and tool_name == "finish":
-                finished = True
+                if result == "success" and tool_name == "finish":
+                    finished = True
 
     if finished:
         print(blue("Agent marked as finished"))
     else:
         print(yellow("Max iterations reached"))
+    print(f"File cache: {workspace.file_cache.stats()}")
 
-    # Create a PR title
-    message += chat_message(
+    # The title and body are written from the same point in the conversation, so they can be requested at once
+    title_conversation = conversation.fork()
+    title_conversation.append(
         "user",
         "Please create a PR title that summarizes the changes you've made. Do not include any leading or trailing punctuation.",
     )
-    message += header("assistant")
-    response = client.inference.completion(
-        model_id=MODEL_ID,
-        content=message,
+    body_conversation = conversation.fork()
+    body_conversation.append(
+        "user",
+        (
+            "Summarizing all of the changes and thinking you've done,"
+            "please write a PR body that explains the changes you've made."
+            "Please write it in GitHub Flavored Markdown."
+        ),
     )
-    pr_title = response.content
 
-    # Check if there are any changes
-    # If there are no changes, ask the agent to explain why
-    diff_cmd = run(f"cd {os.path.join(SANDBOX_DIR, repo)} && git diff", shell=True, capture_output=True)
-    if not diff_cmd.stdout:
-        print(f"No changes were made - agent explaining why...")
-        message += chat_message(
-            "user",
-            (
-                "No changes were made."
-                "Could you explain your reasoning for not making any changes?"
-                "Please write it in GitHub Flavored Markdown."
-                "Also provide some next steps to fix the issue."
-            ),
+    # The agent can only change files through its tools, so if none of them wrote to the repo there is nothing to diff.
+    # Otherwise ask for the title and body while git checks that the writes changed something
+    if workspace.wrote_to(repo_path):
+        title_task = asyncio.create_task(
+            completion_text(client, title_conversation.prompt("assistant"))
         )
-        message += header("assistant")
-        response = client.inference.completion(
-            model_id=MODEL_ID,
-            content=message,
+        body_task = asyncio.create_task(
+            completion_text(
+                client,
+                # Llama sometimes includes an unnecessary "## PR body" title so we add it here to make sure it's not included
+                body_conversation.prompt("assistant", prefill="## PR Body\n\n"),
+            )
         )
-        reasoning = response.content
-        return ("no_changes_made", reasoning, None)
+        # Exits with 1 if there are changes
+        diff_cmd = await run_exec("git", "diff", "--quiet", cwd=repo_path)
+        if diff_cmd.returncode == 1:
+            pr_title, pr_body = await asyncio.gather(title_task, body_task)
+            return "changes_made", pr_title, pr_body
+
+        # The edits put everything back the way it was
+        title_task.cancel()
+        body_task.cancel()
+        await asyncio.gather(title_task, body_task, return_exceptions=True)
 
-    # Create a PR body
-    message += chat_message(
+    # If there are no changes, ask the agent to explain why
+    print(f"No changes were made - agent explaining why...")
+    conversation.append(
         "user",
         (
-            "Summarizing all of the changes and thinking you've done,"
-            "please write a PR body that explains the changes you've made."
+            "No changes were made."
+            "Could you explain your reasoning for not making any changes?"
             "Please write it in GitHub Flavored Markdown."
+            "Also provide some next steps to fix the issue."
         ),
     )
-    message += header("assistant")
-    # Llama sometimes includes an unnecessary "## PR body" title so we add it here to make sure it's not included
-    message += "## PR Body\n\n"
-    response = client.inference.completion(
-        model_id=MODEL_ID,
-        content=message,
-    )
-    pr_body = response.content
+    reasoning = await completion_text(client, conversation.prompt("assistant"))
+    return ("no_changes_made", reasoning, None)
+
+
+async def completion_text(client: AsyncLlamaStackClient, content: str) -> str:
+    with span("inference") as current:
+        response = await client.inference.completion(
+            model_id=MODEL_ID,
+            content=content,
+        )
+        if current.recording:
+            current.set(prompt_tokens=len(encode(content)), completion_tokens=len(encode(response.content)))
+    return response.content
+
+
+async def run_best_of_n_async(
+    client: AsyncLlamaStackClient,
+    repo: str,
+    issue_title: str,
+    issue_body: str,
+    attempts: int,
+    temperatures: Optional[Sequence[float]] = None,
+    scorer: Optional[Scorer] = None,
+    stream: bool = False,
+    use_stop_sequences: bool = False,
+    context_budget: Optional[ContextBudget] = None,
+    workspace: Optional[Workspace] = None,
+    attempts_dir: Optional[str] = None,
+) -> Tuple[Literal["changes_made", "no_changes_made"], str, Optional[str]]:
+    """
+    Run several attempts at the issue at once, each in its own git worktree of the repo and with its own
+    sampling temperature. Finished attempts are scored, and the first to reach QUALIFYING_SCORE wins straight away:
+    the others are cancelled. Otherwise the highest scoring attempt wins once they have all finished.
+    The winner's changes are applied to the repo in `workspace`, and its result is returned.
+
+    Takes the same arguments as run_agent_async
+    """
+    if workspace is None:
+        workspace = Workspace(SANDBOX_DIR)
+    temperatures = temperatures or ATTEMPT_TEMPERATURES
+    scorer = scorer or syntax_scorer
+    repo_path = os.path.join(workspace.sandbox_dir, repo)
+
+    async def run_attempt(attempt: Attempt) -> Attempt:
+        attempt.result = await run_agent_async(
+            client,
+            repo,
+            issue_title,
+            issue_body,
+            stream=stream,
+            use_stop_sequences=use_stop_sequences,
+            context_budget=context_budget,
+            # Attempts at the same commit can share cached indexes
+            workspace=Workspace(attempt.sandbox_dir, index_cache=workspace.index_cache),
+            sampling_params=attempt.sampling_params(),
+        )
+        await collect_changes(attempt)
+        attempt.score = await scorer(attempt)
+        return attempt
+
+    async with AsyncExitStack() as stack:
+        tasks = {}
+        for i in range(attempts):
+            # One at a time, since git locks the repo while adding a worktree
+            sandbox_dir = await stack.enter_async_context(working_copy(repo_path, attempts_dir))
+            attempt = Attempt(i + 1, sandbox_dir, os.path.join(sandbox_dir, repo), temperatures[i % len(temperatures)])
+            tasks[asyncio.create_task(run_attempt(attempt))] = attempt
+        print(f"Running {attempts} attempts at temperatures {', '.join(str(a.temperature) for a in tasks.values())}")
+
+        finished = []
+        errors = []
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                        print(red(f"Attempt {tasks[task].number} failed: {task.exception()}"))
+                        continue
+                    finished.append(task.result())
+                    print(f"Attempt {tasks[task].number} finished with score {tasks[task].score}")
+                if any(attempt.score >= QUALIFYING_SCORE for attempt in finished):
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        winner = next(
+            (attempt for attempt in finished if attempt.score >= QUALIFYING_SCORE), None
+        ) or best_attempt(finished)
+        if winner is None:
+            raise errors[0]
+        if pending:
+            print(f"Cancelled {len(pending)} attempts")
+        print(blue(f"Attempt {winner.number} won with score {winner.score}"))
+        await apply_changes(winner, repo_path)
+        for path in winner.changed_files:
+            workspace.file_written(os.path.join(repo_path, path))
+        return winner.result
+
+
+def execute_tool_calls(
+    tool_calls: list[tuple[str, dict[str, str]]],
+    max_workers: int = TOOL_WORKERS,
+    workspace: Optional[Workspace] = None,
+) -> list[Union[Tuple[Literal["success"], str], Tuple[Literal["error"], str]]]:
+    """
+    Execute several tool calls from one response and return their results in the original order.
+
+    Consecutive read-only tool calls run concurrently on a thread pool. Any other tool call (e.g., edit_file)
+    acts as a barrier: it waits for the reads before it and runs on its own, so reads after it see its changes.
+
+    Args:
+        tool_calls (list[tuple[str, dict[str, str]]]): The (tool_name, tool_params) to execute
+        max_workers (int): The maximum number of tool calls to run at once
+        workspace (Optional[Workspace]): The sandbox to run the tool calls in
+    """
+    if len(tool_calls) <= 1 or max_workers <= 1:
+        return [
+            safe_execute_tool_call(name, params, workspace)
+            for name, params in tool_calls
+        ]
+
+    results = [None] * len(tool_calls)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = []
+        for i, (tool_name, tool_params) in enumerate(tool_calls):
+            if tool_name in READ_ONLY_TOOLS:
+                pending.append(
+                    # In a copy of this thread's context, so the tool's span has the iteration as its parent
+                    (i, executor.submit(
+                            contextvars.copy_context().run,
+                            safe_execute_tool_call, tool_name, tool_params, workspace
+                        ))
+                )
+                continue
+
+            for j, future in pending:
+                results[j] = future.result()
+            pending = []
+            results[i] = safe_execute_tool_call(tool_name, tool_params, workspace)
+
+        for j, future in pending:
+            results[j] = future.result()
+    return results
 
-    return "changes_made", pr_title, pr_body
+
+def safe_execute_tool_call(
+    tool_name: str, tool_params: dict[str, str], workspace: Optional[Workspace] = None
+) -> Union[Tuple[Literal["success"], str], Tuple[Literal["error"], str]]:
+    """Same as execute_tool_call, but returns an error result instead of raising"""
+    with span("tool", tool=tool_name) as current:
+        try:
+            result = execute_tool_call(tool_name, tool_params, workspace)
+        except Exception as e:
+            result = ("error", f"ERROR - Calling tool: {tool_name} {e}")
+        current.set(result=result[0], result_bytes=len(result[1]))
+        return result
 
 
 def execute_tool_call(
-    tool_name: str, tool_params: dict[str, str]
+    tool_name: str, tool_params: dict[str, str], workspace: Optional[Workspace] = None
 ) -> Union[Tuple[Literal["success"], str], Tuple[Literal["error"], str]]:
     """
     Execute a tool call and return a message indicating the result of the tool call.
@@ -277,61 +653,166 @@ def execute_tool_call(
     Args:
         tool_name (str): The name of the tool to execute.
         tool_params (dict[str, str]): The parameters to pass to the tool.
+        workspace (Optional[Workspace]): The sandbox /workspace/ maps to. Defaults to the shared SANDBOX_DIR
 
     Returns:
         Union[Tuple[Literal["success"], str], Tuple[Literal["error"], str]]:
             ("success", result): The result of the tool call.
             ("error", error_message): The error message if the tool call failed.
     """
+    if workspace is None:
+        workspace = Workspace(SANDBOX_DIR)
+    sandbox_dir = workspace.sandbox_dir
+
     if tool_name == "list_files":
         if (error := validate_param_exists("path", tool_params)
-            or validate_not_symlink(tool_params["path"])
-            or validate_path_in_sandbox(tool_params["path"])
-            or validate_directory_exists(tool_params["path"])):
+            or validate_not_symlink(tool_params["path"], sandbox_dir)
+            or validate_path_in_sandbox(tool_params["path"], sandbox_dir)
+            or validate_directory_exists(tool_params["path"], sandbox_dir)):
             return ("error", error)
 
-        path = translate_path(tool_params["path"])
-        files = list_files_in_repo(path, depth=1)
+        path = translate_path(tool_params["path"], sandbox_dir)
+        files = workspace.list_files(path, depth=1)
         return ("success", "\n".join(files))
 
     elif tool_name == "edit_file":
         if (
             error := validate_param_exists("path", tool_params)
-            or validate_path_in_sandbox(tool_params["path"])
+            or validate_path_in_sandbox(tool_params["path"], sandbox_dir)
             or validate_param_exists("new_str", tool_params)
-            or validate_not_symlink(tool_params["path"])
-            or validate_file_exists(tool_params["path"])
-            or validate_not_a_directory(tool_params["path"])
+            or validate_not_symlink(tool_params["path"], sandbox_dir)
+            or validate_file_exists(tool_params["path"], sandbox_dir)
+            or validate_not_a_directory(tool_params["path"], sandbox_dir)
         ):
             return ("error", error)
 
-        path = translate_path(tool_params["path"])
+        path = translate_path(tool_params["path"], sandbox_dir)
         if "old_str" in tool_params:
             with open(f"{path}", "r") as f:
                 file_content = f.read()
-            with open(f"{path}", "w") as f:
-                old_str = tool_params["old_str"]
-                new_str = tool_params["new_str"]
-                new_content = file_content.replace(old_str, new_str)
-                f.write(new_content)
+            old_str = tool_params["old_str"]
+            new_str = tool_params["new_str"]
+            atomic_write(path, file_content.replace(old_str, new_str))
         else:
-            with open(f"{path}", "w") as f:
-                f.write(tool_params["new_str"])
+            atomic_write(path, tool_params["new_str"])
+        workspace.file_written(path)
         return ("success", "File successfully updated")
 
+    elif tool_name == "edit_files":
+        if error := validate_param_exists("edits", tool_params):
+            return ("error", error)
+        edits, error = parse_edits(tool_params["edits"], sandbox_dir)
+        if error:
+            return ("error", error)
+
+        try:
+            files = apply_edits(edits)
+        except (ValueError, OSError) as e:
+            return ("error", f"ERROR - {e}. No files were changed")
+        for file in files:
+            workspace.file_written(file)
+        return ("success", f"Successfully made {len(edits)} edits to {len(files)} files")
+
 
     elif tool_name == "view_file":
         if (error := validate_param_exists("path", tool_params)
-            or validate_not_symlink(tool_params["path"])
-            or validate_path_in_sandbox(tool_params["path"])
-            or validate_file_exists(tool_params["path"])
-            or validate_not_a_directory(tool_params["path"])):
+            or validate_not_symlink(tool_params["path"], sandbox_dir)
+            or validate_path_in_sandbox(tool_params["path"], sandbox_dir)
+            or validate_file_exists(tool_params["path"], sandbox_dir)
+            or validate_not_a_directory(tool_params["path"], sandbox_dir)):
             return ("error", error)
 
-        path = translate_path(tool_params["path"])
-        with open(f"{path}", "r") as f:
-            file_content = f.read()
-        return ("success", file_content)
+        start_line, end_line, error = parse_line_range(
+            tool_params.get("start_line"), tool_params.get("end_line")
+        )
+        if error:
+            return ("error", error)
+
+        path = translate_path(tool_params["path"], sandbox_dir)
+        return workspace.view_file(path, start_line, end_line)
+
+    elif tool_name == "search_code":
+        if (error := validate_param_exists("path", tool_params)
+            or validate_param_exists("query", tool_params)
+            or validate_not_symlink(tool_params["path"], sandbox_dir)
+            or validate_path_in_sandbox(tool_params["path"], sandbox_dir)
+            or validate_directory_exists(tool_params["path"], sandbox_dir)):
+            return ("error", error)
+        query = str(tool_params["query"])
+        if not query:
+            return ("error", "ERROR - query must not be empty")
+        try:
+            page = int(tool_params.get("page", 1))
+        except (TypeError, ValueError):
+            return ("error", f"ERROR - page must be an integer, got: {tool_params['page']}")
+        if page < 1:
+            return ("error", f"ERROR - page must be at least 1, got: {page}")
+        regex = param_is_true(tool_params.get("regex", False))
+        if regex:
+            # Before the search index is built, so a bad pattern doesn't cost a full build
+            try:
+                re.compile(query)
+            except re.error as e:
+                return ("error", f"ERROR - Invalid regex {query}: {e}")
+
+        path = translate_path(tool_params["path"], sandbox_dir)
+        if not os.path.isdir(path):
+            return ("error", f"ERROR - {tool_params['path']} is not a directory")
+        try:
+            matches, more = workspace.search_code(
+                path,
+                query,
+                regex=regex,
+                case_sensitive=param_is_true(tool_params.get("case_sensitive", True)),
+                limit=SEARCH_PAGE_SIZE,
+                offset=(page - 1) * SEARCH_PAGE_SIZE,
+            )
+        except ValueError as e:
+            return ("error", f"ERROR - {e}")
+
+        if not matches:
+            return ("success", "No matches found" if page == 1 else f"No more matches after page {page - 1}")
+        first = (page - 1) * SEARCH_PAGE_SIZE + 1
+        summary = f"Matches {first}-{first + len(matches) - 1}"
+        if more:
+            summary += f". There are more matches, use page={page + 1} to see them"
+        lines = [f"{AGENT_WORKING_DIR}{match}" for match in matches]
+        return ("success", summary + "\n" + "\n".join(lines))
+
+    elif tool_name in ("find_definition", "find_references"):
+        if (error := validate_param_exists("path", tool_params)
+            or validate_param_exists("name", tool_params)
+            or validate_not_symlink(tool_params["path"], sandbox_dir)
+            or validate_path_in_sandbox(tool_params["path"], sandbox_dir)
+            or validate_directory_exists(tool_params["path"], sandbox_dir)):
+            return ("error", error)
+        name = str(tool_params["name"]).strip()
+        if not name:
+            return ("error", "ERROR - name must not be empty")
+
+        path = translate_path(tool_params["path"], sandbox_dir)
+        if not os.path.isdir(path):
+            return ("error", f"ERROR - {tool_params['path']} is not a directory")
+        kind = "definitions" if tool_name == "find_definition" else "references"
+        try:
+            symbols = workspace.find_symbols(path, name, kind)
+        except ValueError as e:
+            return ("error", f"ERROR - {e}")
+
+        if not symbols:
+            return ("success", f"No {kind} of {name} found")
+        lines = []
+        for symbol in symbols[:SYMBOL_RESULTS_LIMIT]:
+            location = f"{AGENT_WORKING_DIR}{symbol.path}:{symbol.line_number}"
+            if kind == "definitions":
+                lines.append(f"{location}: {symbol.kind} {symbol.name}")
+            else:
+                lines.append(f"{location}: {source_line(workspace, symbol.path, symbol.line_number)}")
+        if len(symbols) > SYMBOL_RESULTS_LIMIT:
+            lines.append(
+                f"Showing the first {SYMBOL_RESULTS_LIMIT} of {len(symbols)} {kind}. Use a more specific path to see the rest"
+            )
+        return ("success", "\n".join(lines))
 
     elif tool_name == "finish":
         return ("success", "Task marked as finished")
@@ -340,11 +821,79 @@ def execute_tool_call(
         return ("error", f"ERROR - Unknown tool: {tool_name}")
 
 
-def translate_path(path: str) -> str:
+def parse_edits(
+    raw_edits: list[dict], sandbox_dir: Optional[str] = None
+) -> Tuple[list[Edit], Optional[str]]:
+    """
+    Validate the edits param of edit_files
+
+    Returns:
+        Tuple[list[Edit], Optional[str]]: The edits, and an error message if any of them is invalid
+    """
+    if not isinstance(raw_edits, list) or not raw_edits:
+        return [], f"ERROR - edits must be a non-empty list of edits, got: {raw_edits!r}"
+
+    edits = []
+    for i, raw_edit in enumerate(raw_edits):
+        if not isinstance(raw_edit, dict):
+            return [], f"ERROR - Edit {i + 1} must be a dict, got: {raw_edit!r}"
+        if error := (
+            validate_param_exists("path", raw_edit)
+            or validate_param_exists("new_str", raw_edit)
+            or validate_path_in_sandbox(raw_edit["path"], sandbox_dir)
+            or validate_not_symlink(raw_edit["path"], sandbox_dir)
+            or validate_file_exists(raw_edit["path"], sandbox_dir)
+            or validate_not_a_directory(raw_edit["path"], sandbox_dir)
+        ):
+            return [], f"ERROR - Edit {i + 1}: {error.removeprefix('ERROR - ')}"
+        if ("old_str" in raw_edit) == ("start_line" in raw_edit):
+            return [], f"ERROR - Edit {i + 1} must have either old_str or start_line"
+
+        start_line, end_line, error = parse_line_range(
+            raw_edit.get("start_line"), raw_edit.get("end_line")
+        )
+        if error:
+            return [], f"ERROR - Edit {i + 1}: {error.removeprefix('ERROR - ')}"
+        edits.append(
+            Edit(
+                raw_edit["path"],
+                # Normalized so different spellings of the same file are read and written once
+                os.path.abspath(translate_path(raw_edit["path"], sandbox_dir)),
+                str(raw_edit["new_str"]),
+                old_str=raw_edit.get("old_str"),
+                start_line=start_line,
+                end_line=end_line,
+            )
+        )
+    return edits, None
+
+
+def source_line(workspace: Workspace, path: str, line_number: int) -> str:
+    """A line of a file in the workspace, stripped and cut to a readable length. `path` is relative to the sandbox"""
+    try:
+        content = workspace.read_file(os.path.join(workspace.sandbox_dir, path))
+    except (OSError, UnicodeDecodeError):
+        return ""
+    lines = content.split("\n")
+    line = lines[line_number - 1].strip() if line_number <= len(lines) else ""
+    if len(line) > SEARCH_MAX_LINE_CHARS:
+        line = line[:SEARCH_MAX_LINE_CHARS] + "..."
+    return line
+
+
+def param_is_true(value) -> bool:
+    """Boolean tool params may come through as strings, e.g., 'false'"""
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1", "yes")
+    return bool(value)
+
+
+def translate_path(path: str, sandbox_dir: Optional[str] = None) -> str:
+    sandbox_dir = sandbox_dir or SANDBOX_DIR
     if path.startswith(AGENT_WORKING_DIR):
-        return os.path.join(SANDBOX_DIR, path[len(AGENT_WORKING_DIR) :])
+        return os.path.join(sandbox_dir, path[len(AGENT_WORKING_DIR) :])
     else:
-        return os.path.join(SANDBOX_DIR, path)
+        return os.path.join(sandbox_dir, path)
 
 
 def parse_tool_calls(
@@ -424,49 +973,43 @@ def validate_param_exists(
         return f"ERROR - {param_name} not found in tool params: {display_tool_params(tool_params)}"
     return None
 
-def validate_path_in_sandbox(path: str) -> Optional[str]:
+def validate_path_in_sandbox(path: str, sandbox_dir: Optional[str] = None) -> Optional[str]:
     """
     Validate that a path stays within the sandbox directory.
     
     Args:
         path (str): The path to validate
+        sandbox_dir (Optional[str]): The sandbox directory. Defaults to SANDBOX_DIR
 
     Returns:
         Optional[str]: Error message if path is invalid, None if valid
     """
     # Resolve the absolute path after translation to catch any ../ tricks
-    path = translate_path(path)
+    path = translate_path(path, sandbox_dir)
     resolved_path = os.path.abspath(path)
-    sandbox_path = os.path.abspath(SANDBOX_DIR)
+    sandbox_path = os.path.abspath(sandbox_dir or SANDBOX_DIR)
 
     if not resolved_path.startswith(sandbox_path):
         # From the agent's perspective, any paths not in the sandbox don't exist
         return f"ERROR - File {path} does not exist"
     return None
 
-def validate_not_symlink(path: str) -> Optional[str]:
-    if os.path.islink(translate_path(path)):
+def validate_not_symlink(path: str, sandbox_dir: Optional[str] = None) -> Optional[str]:
+    if os.path.islink(translate_path(path, sandbox_dir)):
         return f"ERROR - File {path} is a symlink. Simlinks not allowed"
     return None
 
-def validate_file_exists(path: str) -> Optional[str]:
-    if not os.path.exists(translate_path(path)):
+def validate_file_exists(path: str, sandbox_dir: Optional[str] = None) -> Optional[str]:
+    if not os.path.exists(translate_path(path, sandbox_dir)):
         return f"ERROR - File {path} does not exist. Please ensure the path is an absolute path and that the file exists."
     return None
 
-def validate_not_a_directory(path: str) -> Optional[str]:
-    if os.path.isdir(translate_path(path)):
+def validate_not_a_directory(path: str, sandbox_dir: Optional[str] = None) -> Optional[str]:
+    if os.path.isdir(translate_path(path, sandbox_dir)):
         return f"ERROR - File {path} is a directory. Please ensure the path references a file, not a directory."
     return None
 
-def validate_directory_exists(path: str) -> Optional[str]:
-    if not os.path.exists(translate_path(path)):
+def validate_directory_exists(path: str, sandbox_dir: Optional[str] = None) -> Optional[str]:
+    if not os.path.exists(translate_path(path, sandbox_dir)):
         return f"ERROR - Directory {path} does not exist. Please ensure the path is an absolute path and that the directory exists."
     return None
-
-def chat_message(role: Literal["user", "assistant", "system", "tool"], content: str):
-    return f"<|start_header_id|>{role}<|end_header_id|>\n\n{content}<|eot_id|>"
-
-
-def header(role: Literal["user", "assistant", "system", "tool"]):
-    return f"<|start_header_id|>{role}<|end_header_id|>\n\n"
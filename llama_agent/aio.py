@@ -0,0 +1,144 @@
+import asyncio
+import inspect
+import os
+import signal
+from subprocess import CalledProcessError, CompletedProcess
+from typing import Any, Optional
+from llama_agent.tracing import redact, span
+
+# Returned by next() in a worker thread once a sync stream is exhausted
+_END = object()
+
+
+def is_async_client(client: Any) -> bool:
+    """True if `client.inference.completion` is a coroutine function, e.g., AsyncLlamaStackClient"""
+    completion = getattr(getattr(client, "inference", None), "completion", None)
+    if completion is None:
+        return False
+    # The generated client wraps its methods in decorators, which hide that they are coroutine functions
+    return inspect.iscoroutinefunction(inspect.unwrap(completion))
+
+
+def as_async_client(client: Any) -> Any:
+    """`client` if it's already async, otherwise a ThreadedClient wrapping it"""
+    if client is None or is_async_client(client):
+        return client
+    return ThreadedClient(client)
+
+
+class ThreadedClient:
+    """
+    Makes a synchronous client (LlamaStackClient, CachingClient, ...) look like an AsyncLlamaStackClient
+    by running its blocking calls on the event loop's default thread pool.
+    """
+
+    def __init__(self, client: Any):
+        self.client = client
+        self.models = getattr(client, "models", None)
+        self.inference = self
+
+    async def completion(self, **kwargs):
+        response = await asyncio.to_thread(self.client.inference.completion, **kwargs)
+        if kwargs.get("stream"):
+            return ThreadedStream(response)
+        return response
+
+
+class ThreadedStream:
+    """An async iterator over a synchronous stream. Each chunk is read in a worker thread"""
+
+    def __init__(self, stream: Any):
+        self.stream = stream
+        self.iterator = iter(stream)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await asyncio.to_thread(next, self.iterator, _END)
+        if chunk is _END:
+            raise StopAsyncIteration
+        return chunk
+
+    async def close(self):
+        close = getattr(self.stream, "close", None)
+        if close is not None:
+            await asyncio.to_thread(close)
+
+
+async def close_stream(stream: Any) -> None:
+    """Close a sync or async stream, if it can be closed"""
+    close = getattr(stream, "close", None) or getattr(stream, "aclose", None)
+    if close is None:
+        return
+    result = close()
+    if inspect.isawaitable(result):
+        await result
+
+
+async def communicate(process: asyncio.subprocess.Process, input: Optional[bytes] = None) -> tuple[bytes, bytes]:
+    """
+    process.communicate(), but if the caller is cancelled or times out, the process and everything it started
+    are killed before the error propagates. The process must be started with start_new_session=True, so that
+    e.g. the test command run by a shell is in its process group too
+    """
+    try:
+        return await process.communicate(input)
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await process.wait()
+        raise
+
+
+async def run_shell(cmd: str, cwd: Optional[str] = None, check: bool = False) -> CompletedProcess:
+    """
+    Like subprocess.run(cmd, shell=True, cwd=cwd, capture_output=True), but waits on the event loop instead of blocking it
+
+    Raises:
+        CalledProcessError: If `check` is True and the command fails
+    """
+    with span("subprocess") as current:
+        if current.recording:
+            current.set(command=redact(cmd))
+        process = await asyncio.create_subprocess_shell(
+            cmd,
+            cwd=cwd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        stdout, stderr = await communicate(process)
+        current.set(returncode=process.returncode, stdout_bytes=len(stdout), stderr_bytes=len(stderr))
+    if check and process.returncode != 0:
+        raise CalledProcessError(process.returncode, cmd, stdout, stderr)
+    return CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+
+async def run_exec(
+    *args: str, cwd: Optional[str] = None, input: Optional[bytes] = None, check: bool = False
+) -> CompletedProcess:
+    """
+    Like subprocess.run(args, cwd=cwd, input=input, capture_output=True), but waits on the event loop
+
+    Raises:
+        CalledProcessError: If `check` is True and the command fails
+    """
+    with span("subprocess") as current:
+        if current.recording:
+            current.set(command=redact(args))
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            cwd=cwd,
+            stdin=asyncio.subprocess.PIPE if input is not None else None,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        stdout, stderr = await communicate(process, input)
+        current.set(returncode=process.returncode, stdout_bytes=len(stdout), stderr_bytes=len(stderr))
+    if check and process.returncode != 0:
+        raise CalledProcessError(process.returncode, list(args), stdout, stderr)
+    return CompletedProcess(list(args), process.returncode, stdout, stderr)
@@ -0,0 +1,588 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import nullcontext, redirect_stdout, redirect_stderr
+from contextvars import ContextVar
+from typing import Any, Iterable, Optional, TextIO
+from ansi import red, green, yellow, bold
+from dotenv import load_dotenv
+from llama_stack_client import AsyncLlamaStackClient, LlamaStackClient
+from llama_agent import REPO_DIR
+from llama_agent.context import CONTEXT_TOKEN_BUDGET
+from llama_agent.completion_cache import (
+    COMPLETION_CACHE_MODES,
+    COMPLETION_CACHE_PATH,
+    CachingClient,
+    CompletionCache,
+)
+from llama_agent.github import GitHubCache, GitHubClient, Issue
+from llama_agent.ingest import HandledIssues, STATE_PATH, fetch_open_issues, read_repos
+from llama_agent.aio import as_async_client, close_stream
+from llama_agent.main import check_model, solve_issue, solve_issue_async
+from llama_agent.sandbox import CLONE_STRATEGIES
+from llama_agent.tracing import tracing
+
+RESULTS_DIR = os.path.join(REPO_DIR, "results")
+
+# Set in each worker process by init_worker
+_worker_client: Optional[Any] = None
+# The log of the job the current asyncio task is running, see JobOutput
+_job_log: ContextVar[Optional[TextIO]] = ContextVar("job_log", default=None)
+
+
+class ConcurrencyLimitedClient:
+    """
+    Wraps a LlamaStackClient so that at most N inference requests are in flight at once.
+    The semaphore is shared by every worker process, so the cap is global to the batch.
+    """
+
+    def __init__(self, client: LlamaStackClient, semaphore: Any):
+        self.client = client
+        self.semaphore = semaphore
+        self.models = client.models
+        self.inference = self
+
+    def completion(self, **kwargs):
+        self.semaphore.acquire()
+        try:
+            response = self.client.inference.completion(**kwargs)
+        except BaseException:
+            self.semaphore.release()
+            raise
+
+        if kwargs.get("stream"):
+            # Hold the slot until the stream is consumed or closed
+            return SemaphoreStream(response, self.semaphore)
+        self.semaphore.release()
+        return response
+
+
+class SemaphoreStream:
+    """A streamed response that releases its concurrency slot once it has been read or closed"""
+
+    def __init__(self, stream: Any, semaphore: Any):
+        self.stream = stream
+        self.semaphore = semaphore
+        self.released = False
+
+    def __iter__(self):
+        try:
+            yield from self.stream
+        finally:
+            self.close()
+
+    def close(self):
+        if self.released:
+            return
+        self.released = True
+        try:
+            close = getattr(self.stream, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self.semaphore.release()
+
+
+class AsyncConcurrencyLimitedClient:
+    """
+    Wraps an async client so that at most N inference requests are in flight at once.
+    For agents sharing one event loop, so the semaphore is an asyncio.Semaphore
+    """
+
+    def __init__(self, client: Any, semaphore: asyncio.Semaphore):
+        self.client = client
+        self.semaphore = semaphore
+        self.models = getattr(client, "models", None)
+        self.inference = self
+
+    async def completion(self, **kwargs):
+        await self.semaphore.acquire()
+        try:
+            response = await self.client.inference.completion(**kwargs)
+        except BaseException:
+            self.semaphore.release()
+            raise
+
+        if kwargs.get("stream"):
+            # Hold the slot until the stream is consumed or closed
+            return AsyncSemaphoreStream(response, self.semaphore)
+        self.semaphore.release()
+        return response
+
+
+class AsyncSemaphoreStream:
+    """An async streamed response that releases its concurrency slot once it has been read or closed"""
+
+    def __init__(self, stream: Any, semaphore: asyncio.Semaphore):
+        self.stream = stream
+        self.semaphore = semaphore
+        self.released = False
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self.stream:
+                yield chunk
+        finally:
+            await self.close()
+
+    async def close(self):
+        if self.released:
+            return
+        self.released = True
+        try:
+            await close_stream(self.stream)
+        finally:
+            self.semaphore.release()
+
+
+class JobOutput:
+    """
+    Stands in for sys.stdout and sys.stderr while jobs share one process.
+    Writes go to the log of the job the current task is running, or to `fallback` outside of a job
+    """
+
+    def __init__(self, fallback: TextIO):
+        self.fallback = fallback
+
+    def current(self) -> TextIO:
+        return _job_log.get() or self.fallback
+
+    def write(self, text: str) -> int:
+        return self.current().write(text)
+
+    def flush(self) -> None:
+        self.current().flush()
+
+    def isatty(self) -> bool:
+        return False
+
+
+def read_issue_urls(
+    issue_urls: Iterable[str] = (), issues_file: Optional[str] = None
+) -> list[str]:
+    """
+    Combine issue urls from the command line and a file (one url per line, # for comments).
+    Duplicates are dropped, keeping the original order.
+    """
+    urls = list(issue_urls)
+    if issues_file:
+        with open(issues_file, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    urls.append(line)
+    return list(dict.fromkeys(urls))
+
+
+def job_id(issue_url: str) -> str:
+    issue = Issue(issue_url)
+    return f"{issue.owner}__{issue.repo}__{issue.issue_number}"
+
+
+def init_worker(
+    semaphore: Any,
+    llama_stack_url: Optional[str],
+    completion_cache: str = "passthrough",
+    completion_cache_path: str = COMPLETION_CACHE_PATH,
+) -> None:
+    global _worker_client
+    client = None
+    if llama_stack_url:
+        client = ConcurrencyLimitedClient(LlamaStackClient(base_url=llama_stack_url), semaphore)
+    if completion_cache != "passthrough":
+        # Outside the concurrency limit, so cached completions don't wait for a slot
+        client = CachingClient(client, CompletionCache(completion_cache_path), completion_cache)
+    _worker_client = client
+
+
+def run_job(
+    issue_url: str,
+    results_dir: str = RESULTS_DIR,
+    issue_data: Optional[dict] = None,
+    trace: bool = False,
+    **options,
+) -> dict:
+    """
+    Solve one issue in its own worktree. Output goes to `<results_dir>/<job_id>.log`
+    and the outcome to `<results_dir>/<job_id>.json`. Never raises: failures are recorded in the result.
+    `issue_data` is the already fetched issue, if any. With `trace`, the job's spans go to `<results_dir>/<job_id>.trace.jsonl`
+    """
+    result = {"issue_url": issue_url, "ok": False}
+    start = time.time()
+    try:
+        result["job_id"] = job_id(issue_url)
+    except ValueError as e:
+        result["error"] = str(e)
+        return result
+
+    os.makedirs(results_dir, exist_ok=True)
+    log_path = os.path.join(results_dir, f"{result['job_id']}.log")
+    try:
+        with open(log_path, "w") as log, redirect_stdout(log), redirect_stderr(log), trace_job(result, results_dir, trace):
+            outcome = solve_issue(
+                _worker_client,
+                os.getenv("GITHUB_API_KEY"),
+                issue_url,
+                issue_data=issue_data,
+                **options,
+            )
+        result.update(outcome)
+        result["ok"] = True
+    except Exception as e:
+        record_failure(result, e, log_path)
+    finally:
+        result["duration"] = time.time() - start
+
+    save_result(result, results_dir)
+    return result
+
+
+async def run_job_async(
+    issue_url: str,
+    client: Any,
+    github: GitHubClient,
+    results_dir: str = RESULTS_DIR,
+    issue_data: Optional[dict] = None,
+    trace: bool = False,
+    **options,
+) -> dict:
+    """
+    Same as run_job, for jobs sharing one event loop. Output is sent to the job's log through JobOutput,
+    so sys.stdout must be a JobOutput while it runs
+    """
+    result = {"issue_url": issue_url, "ok": False}
+    start = time.time()
+    try:
+        result["job_id"] = job_id(issue_url)
+    except ValueError as e:
+        result["error"] = str(e)
+        return result
+
+    os.makedirs(results_dir, exist_ok=True)
+    log_path = os.path.join(results_dir, f"{result['job_id']}.log")
+    try:
+        with open(log_path, "w") as log, trace_job(result, results_dir, trace):
+            # Tasks and worker threads started from here inherit the log and the tracer
+            token = _job_log.set(log)
+            try:
+                outcome = await solve_issue_async(
+                    client,
+                    os.getenv("GITHUB_API_KEY"),
+                    issue_url,
+                    github=github,
+                    issue_data=issue_data,
+                    **options,
+                )
+            finally:
+                _job_log.reset(token)
+        result.update(outcome)
+        result["ok"] = True
+    except Exception as e:
+        record_failure(result, e, log_path)
+    finally:
+        result["duration"] = time.time() - start
+
+    save_result(result, results_dir)
+    return result
+
+
+def trace_job(result: dict, results_dir: str, trace: bool):
+    return tracing(os.path.join(results_dir, f"{result['job_id']}.trace.jsonl")) if trace else nullcontext()
+
+
+def record_failure(result: dict, error: Exception, log_path: str) -> None:
+    result["error"] = f"{type(error).__name__}: {error}"
+    with open(log_path, "a") as log:
+        traceback.print_exc(file=log)
+
+
+def save_result(result: dict, results_dir: str) -> None:
+    with open(os.path.join(results_dir, f"{result['job_id']}.json"), "w") as f:
+        json.dump(result, f, indent=2)
+
+
+def run_batch(
+    issue_urls: list[str],
+    workers: int = 4,
+    max_concurrent_llm: int = 4,
+    results_dir: str = RESULTS_DIR,
+    completion_cache: str = "passthrough",
+    completion_cache_path: str = COMPLETION_CACHE_PATH,
+    issues: Optional[dict[str, dict]] = None,
+    state: Optional[HandledIssues] = None,
+    **options,
+) -> list[dict]:
+    """
+    Solve many issues on a pool of worker processes
+
+    Args:
+        issue_urls (list[str]): The issues to solve
+        workers (int): Number of issues to work on at once
+        max_concurrent_llm (int): Maximum number of inference requests in flight across all workers
+        results_dir (str): Where to write the per job results and logs
+        completion_cache (str): One of COMPLETION_CACHE_MODES. The cache is shared by every worker
+        completion_cache_path (str): The completion cache database
+        issues (Optional[dict[str, dict]]): Already fetched issues by url, so their jobs don't fetch them again
+        state (Optional[HandledIssues]): Where to record the issues that were handled
+        **options: Passed through to solve_issue
+
+    Returns:
+        list[dict]: The result of each job, in the order they were given
+    """
+    llama_stack_url = check_environment(completion_cache)
+    os.makedirs(results_dir, exist_ok=True)
+    issues = issues or {}
+
+    context = multiprocessing.get_context()
+    semaphore = context.BoundedSemaphore(max_concurrent_llm)
+
+    results = {}
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=init_worker,
+        initargs=(semaphore, llama_stack_url, completion_cache, completion_cache_path),
+    ) as executor:
+        futures = {
+            executor.submit(
+                run_job,
+                issue_url,
+                results_dir=results_dir,
+                issue_data=issues.get(issue_url),
+                **options,
+            ): issue_url
+            for issue_url in issue_urls
+        }
+        for future in as_completed(futures):
+            issue_url = futures[future]
+            results[issue_url] = future.result()
+            if state is not None:
+                state.record(results[issue_url])
+            print_progress(results[issue_url], len(results), len(futures))
+
+    return summarize([results[issue_url] for issue_url in issue_urls], results_dir)
+
+
+async def run_batch_async(
+    issue_urls: list[str],
+    workers: int = 50,
+    max_concurrent_llm: int = 4,
+    results_dir: str = RESULTS_DIR,
+    completion_cache: str = "passthrough",
+    completion_cache_path: str = COMPLETION_CACHE_PATH,
+    issues: Optional[dict[str, dict]] = None,
+    state: Optional[HandledIssues] = None,
+    **options,
+) -> list[dict]:
+    """
+    Solve many issues with agents sharing one event loop in this process, instead of a pool of processes.
+    Agents spend most of their time waiting on inference, so one process can keep many of them in flight
+
+    Args:
+        issue_urls (list[str]): The issues to solve
+        workers (int): Number of issues to work on at once
+        max_concurrent_llm (int): Maximum number of inference requests in flight across all agents
+        results_dir (str): Where to write the per job results and logs
+        completion_cache (str): One of COMPLETION_CACHE_MODES
+        completion_cache_path (str): The completion cache database
+        issues (Optional[dict[str, dict]]): Already fetched issues by url, so their jobs don't fetch them again
+        state (Optional[HandledIssues]): Where to record the issues that were handled
+        **options: Passed through to solve_issue_async
+
+    Returns:
+        list[dict]: The result of each job, in the order they were given
+    """
+    llama_stack_url = check_environment(completion_cache)
+    os.makedirs(results_dir, exist_ok=True)
+    issues = issues or {}
+
+    if completion_cache == "passthrough":
+        client = AsyncLlamaStackClient(base_url=llama_stack_url)
+    else:
+        # The cache is synchronous, so its calls (and the server calls it makes) run on worker threads
+        client = as_async_client(
+            CachingClient(
+                LlamaStackClient(base_url=llama_stack_url) if llama_stack_url else None,
+                CompletionCache(completion_cache_path),
+                completion_cache,
+            )
+        )
+    if completion_cache != "replay":
+        client = AsyncConcurrencyLimitedClient(client, asyncio.Semaphore(max_concurrent_llm))
+
+    # Each agent uses at most one worker thread at a time, for tool calls, git setup or a cached completion
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=workers + 4))
+    slots = asyncio.Semaphore(workers)
+    results = {}
+
+    async def run(issue_url: str, github: GitHubClient) -> None:
+        async with slots:
+            results[issue_url] = await run_job_async(
+                issue_url,
+                client,
+                github,
+                results_dir=results_dir,
+                issue_data=issues.get(issue_url),
+                **options,
+            )
+        if state is not None:
+            state.record(results[issue_url])
+        print_progress(results[issue_url], len(results), len(issue_urls))
+
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = JobOutput(stdout), JobOutput(stderr)
+    try:
+        # One client for every job, so they share its pooled connections
+        async with GitHubClient(os.getenv("GITHUB_API_KEY"), cache=GitHubCache()) as github:
+            await asyncio.gather(*(run(issue_url, github) for issue_url in issue_urls))
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+
+    return summarize([results[issue_url] for issue_url in issue_urls], results_dir)
+
+
+def check_environment(completion_cache: str = "passthrough") -> Optional[str]:
+    """
+    Check that the GitHub token and inference server are configured
+
+    Returns:
+        Optional[str]: The Llama Stack url, or None when replaying since that doesn't need an inference server
+    """
+    github_api_key = os.getenv("GITHUB_API_KEY")
+    if not github_api_key:
+        raise ValueError("GITHUB_API_KEY is not set in the environment variables")
+
+    if completion_cache == "replay":
+        return None
+    llama_stack_url = os.getenv("LLAMA_STACK_URL")
+    if not llama_stack_url:
+        raise ValueError("LLAMA_STACK_URL is not set in the environment variables")
+    check_model(LlamaStackClient(base_url=llama_stack_url))
+    return llama_stack_url
+
+
+def print_progress(result: dict, done: int, total: int) -> None:
+    if result["ok"]:
+        print(f"[{done}/{total}] {green('done')} {result['issue_url']}: {result['pr_url']}")
+    else:
+        print(f"[{done}/{total}] {red('failed')} {result['issue_url']}: {result['error']}")
+
+
+def summarize(ordered: list[dict], results_dir: str) -> list[dict]:
+    """Write summary.json and print how many jobs succeeded"""
+    with open(os.path.join(results_dir, "summary.json"), "w") as f:
+        json.dump(ordered, f, indent=2)
+
+    succeeded = sum(1 for result in ordered if result["ok"])
+    print()
+    print(bold(f"{succeeded}/{len(ordered)} issues completed. Results in {results_dir}"))
+    if succeeded < len(ordered):
+        print(yellow(f"{len(ordered) - succeeded} issues failed. See the .log files for details"))
+    return ordered
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run the agent on many issues at once")
+    parser.add_argument(
+        "--issue-urls",
+        type=str,
+        nargs="*",
+        default=[],
+        help="The issue urls to solve",
+    )
+    parser.add_argument(
+        "--issues-file",
+        type=str,
+        help="A file with one issue url per line. Lines starting with # are ignored",
+    )
+    parser.add_argument(
+        "--repos",
+        type=str,
+        nargs="*",
+        default=[],
+        help="Also solve the open issues of these repos (owner/name)",
+    )
+    parser.add_argument(
+        "--repos-file",
+        type=str,
+        help="A file with one repo (owner/name) per line. Lines starting with # are ignored",
+    )
+    parser.add_argument(
+        "--label",
+        type=str,
+        action="append",
+        help="Only take the repos' issues with this label. Can be given more than once, to take issues with any of them",
+    )
+    parser.add_argument(
+        "--state-file",
+        type=str,
+        help=f"Skip the issues handled in an earlier run, and record the ones handled in this one. Defaults to {STATE_PATH} with --repos",
+    )
+    parser.add_argument("--workers", type=int, default=4, help="Number of issues to work on at once")
+    parser.add_argument(
+        "--asyncio",
+        action="store_true",
+        help="Run every agent on one event loop in this process instead of a process per worker. Scales to many more workers",
+    )
+    parser.add_argument(
+        "--max-concurrent-llm",
+        type=int,
+        default=4,
+        help="Maximum number of inference requests in flight across all workers",
+    )
+    parser.add_argument("--results-dir", type=str, default=RESULTS_DIR)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--max-context-tokens", type=int, default=CONTEXT_TOKEN_BUDGET)
+    parser.add_argument("--clone-strategy", choices=CLONE_STRATEGIES, default="full")
+    parser.add_argument("--completion-cache", choices=COMPLETION_CACHE_MODES, default="passthrough")
+    parser.add_argument("--completion-cache-path", type=str, default=COMPLETION_CACHE_PATH)
+    parser.add_argument("--attempts", type=int, default=1, help="Attempts per issue, the best one is submitted")
+    parser.add_argument("--trace", action="store_true", help="Write each job's spans to <results-dir>/<job_id>.trace.jsonl")
+    args = parser.parse_args()
+
+    issue_urls = read_issue_urls(args.issue_urls, args.issues_file)
+    repos = read_repos(args.repos, args.repos_file)
+    if not issue_urls and not repos:
+        parser.error("No issues given. Use --issue-urls, --issues-file or --repos")
+    issues = {}
+    if repos:
+        issues = fetch_open_issues(os.getenv("GITHUB_API_KEY"), repos, args.label)
+        issue_urls = list(dict.fromkeys(issue_urls + list(issues)))
+
+    state = None
+    if args.state_file or repos:
+        state = HandledIssues(args.state_file or STATE_PATH)
+        skipped = len(issue_urls)
+        issue_urls = state.unhandled(issue_urls)
+        skipped -= len(issue_urls)
+        if skipped:
+            print(f"Skipping {skipped} issues that were already handled")
+    if not issue_urls:
+        print("No issues left to solve")
+        sys.exit(0)
+
+    options = dict(
+        workers=args.workers,
+        max_concurrent_llm=args.max_concurrent_llm,
+        results_dir=args.results_dir,
+        stream=args.stream,
+        max_context_tokens=args.max_context_tokens,
+        clone_strategy=args.clone_strategy,
+        completion_cache=args.completion_cache,
+        completion_cache_path=args.completion_cache_path,
+        attempts=args.attempts,
+        trace=args.trace,
+        issues=issues,
+        state=state,
+    )
+    if args.asyncio:
+        asyncio.run(run_batch_async(issue_urls, **options))
+    else:
+        run_batch(issue_urls, **options)
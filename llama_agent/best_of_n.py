@@ -0,0 +1,141 @@
+import asyncio
+import os
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+from llama_agent.aio import run_exec, run_shell
+
+# Each attempt gets its own sandbox in this directory next to the repo, holding a git worktree of it
+ATTEMPTS_DIR_NAME = ".attempts"
+# Sampling temperature of each attempt, cycled if there are more attempts. The first attempt is greedy
+ATTEMPT_TEMPERATURES = (0.0, 0.7, 1.0)
+# An attempt with at least this score wins straight away and the others are cancelled
+QUALIFYING_SCORE = 1.0
+
+
+class Attempt:
+    """One of the concurrent runs of the agent on an issue"""
+
+    number: int
+    # The attempt's Workspace sandbox. The repo is checked out at `sandbox_dir/<repo>`
+    sandbox_dir: str
+    repo_path: str
+    temperature: float
+    # The run_agent result, once the attempt has finished
+    result: Optional[tuple]
+    # Binary diff of every change the attempt made, relative to HEAD
+    diff: bytes
+    changed_files: list[str]
+    score: Optional[float]
+
+    def __init__(self, number: int, sandbox_dir: str, repo_path: str, temperature: float):
+        self.number = number
+        self.sandbox_dir = sandbox_dir
+        self.repo_path = repo_path
+        self.temperature = temperature
+        self.result = None
+        self.diff = b""
+        self.changed_files = []
+        self.score = None
+
+    def sampling_params(self) -> dict[str, Any]:
+        if self.temperature <= 0:
+            return {"strategy": {"type": "greedy"}}
+        return {"strategy": {"type": "top_p", "temperature": self.temperature, "top_p": 0.95}}
+
+
+# Scores a finished attempt. Higher is better, and QUALIFYING_SCORE or more is good enough to stop early
+Scorer = Callable[[Attempt], Awaitable[float]]
+
+
+async def diff_scorer(attempt: Attempt) -> float:
+    """1 if the attempt changed anything"""
+    return 1.0 if attempt.diff else 0.0
+
+
+async def syntax_scorer(attempt: Attempt) -> float:
+    """0 without changes, 0.5 if a changed Python file doesn't parse, otherwise 1"""
+    if not attempt.diff:
+        return 0.0
+    for path in attempt.changed_files:
+        if not path.endswith(".py"):
+            continue
+        full_path = os.path.join(attempt.repo_path, path)
+        if not os.path.exists(full_path):
+            continue
+        try:
+            await asyncio.to_thread(compile_file, full_path)
+        except (SyntaxError, ValueError):
+            return 0.5
+    return 1.0
+
+
+def compile_file(path: str) -> None:
+    with open(path, "rb") as f:
+        compile(f.read(), path, "exec")
+
+
+def command_scorer(command: str, timeout: float = 600) -> Scorer:
+    """
+    A scorer that runs a shell command (e.g., the tests) in the attempt's repo.
+    0 without changes, 0.5 if the command fails or times out, 1 if it passes
+    """
+
+    async def score(attempt: Attempt) -> float:
+        if not attempt.diff:
+            return 0.0
+        try:
+            cmd = await asyncio.wait_for(run_shell(command, cwd=attempt.repo_path), timeout)
+        except asyncio.TimeoutError:
+            return 0.5
+        return 1.0 if cmd.returncode == 0 else 0.5
+
+    return score
+
+
+SCORERS: dict[str, Scorer] = {"diff": diff_scorer, "syntax": syntax_scorer}
+
+
+@asynccontextmanager
+async def working_copy(repo_path: str, attempts_dir: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Check out HEAD of the repo at `repo_path` into a new sandbox, as a git worktree so no objects are copied.
+    Yields the sandbox dir; the repo is at `<sandbox>/<repo name>`. The worktree is removed afterwards.
+    Sandboxes go in `attempts_dir`, by default ATTEMPTS_DIR_NAME in the sandbox holding the repo
+    """
+    if attempts_dir is None:
+        attempts_dir = os.path.join(os.path.dirname(os.path.normpath(repo_path)), ATTEMPTS_DIR_NAME)
+    os.makedirs(attempts_dir, exist_ok=True)
+    sandbox_dir = tempfile.mkdtemp(dir=attempts_dir)
+    path = os.path.join(sandbox_dir, os.path.basename(os.path.normpath(repo_path)))
+    try:
+        await run_exec("git", "worktree", "add", "--detach", path, "HEAD", cwd=repo_path, check=True)
+        yield sandbox_dir
+    finally:
+        await run_exec("git", "worktree", "remove", "--force", path, cwd=repo_path)
+        shutil.rmtree(sandbox_dir, ignore_errors=True)
+
+
+async def collect_changes(attempt: Attempt) -> None:
+    """Record the diff and changed files of everything the attempt did to its working copy"""
+    await run_exec("git", "add", "--all", cwd=attempt.repo_path, check=True)
+    diff = await run_exec("git", "diff", "--cached", "--binary", cwd=attempt.repo_path, check=True)
+    names = await run_exec("git", "diff", "--cached", "--name-only", "-z", cwd=attempt.repo_path, check=True)
+    attempt.diff = diff.stdout
+    attempt.changed_files = [name for name in names.stdout.decode().split("\0") if name]
+
+
+async def apply_changes(attempt: Attempt, repo_path: str) -> None:
+    """Apply the attempt's changes to the repo at `repo_path`"""
+    if attempt.diff:
+        await run_exec("git", "apply", "--binary", "-", cwd=repo_path, input=attempt.diff, check=True)
+
+
+def best_attempt(finished: list[Attempt]) -> Optional[Attempt]:
+    """The highest scoring attempt. Ties go to whichever finished first"""
+    best = None
+    for attempt in finished:
+        if best is None or attempt.score > best.score:
+            best = attempt
+    return best
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+from contextlib import closing
+from typing import Any, Literal, Optional, Tuple
+from llama_agent import SANDBOX_DIR
+from llama_agent.streaming import chunk_text
+
+COMPLETION_CACHE_PATH = os.path.join(SANDBOX_DIR, "completion_cache.sqlite")
+
+# record:      call the server for every completion and save the response, replacing any saved one
+# replay:      only answer from saved responses. A completion that wasn't recorded raises CompletionCacheMiss
+# passthrough: call the server and leave the cache alone
+CompletionCacheMode = Literal["record", "replay", "passthrough"]
+COMPLETION_CACHE_MODES = ("record", "replay", "passthrough")
+
+
+class CompletionCacheMiss(Exception):
+    pass
+
+
+def completion_key(kwargs: dict) -> str:
+    """
+    Hash of everything that determines a completion: the model, the prompt and the sampling params.
+    Whether it's streamed doesn't change the text, so a recorded completion can be replayed either way
+    """
+    request = {name: value for name, value in kwargs.items() if name != "stream"}
+    encoded = json.dumps(request, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class CompletionCache:
+    """Completions saved to a SQLite database, keyed by completion_key. Responses are stored compressed"""
+
+    path: str
+
+    def __init__(self, path: str = COMPLETION_CACHE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS completions (
+                    key TEXT PRIMARY KEY,
+                    model_id TEXT NOT NULL,
+                    content BLOB NOT NULL,
+                    stop_reason TEXT,
+                    created REAL NOT NULL
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=60)
+
+    def get(self, key: str) -> Optional[Tuple[str, Optional[str]]]:
+        """The saved (content, stop_reason), or None"""
+        with closing(self._connect()) as db:
+            row = db.execute(
+                "SELECT content, stop_reason FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return zlib.decompress(row[0]).decode(), row[1]
+
+    def put(self, key: str, model_id: str, content: str, stop_reason: Optional[str] = None) -> None:
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?)",
+                (key, model_id, zlib.compress(content.encode()), stop_reason, time.time()),
+            )
+
+    def __len__(self) -> int:
+        with closing(self._connect()) as db:
+            return db.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+
+class CachedCompletion:
+    """A completion response read from the cache. Has the same fields the agent reads from a real response"""
+
+    content: str
+    stop_reason: Optional[str]
+
+    def __init__(self, content: str, stop_reason: Optional[str] = None):
+        self.content = content
+        self.stop_reason = stop_reason
+
+
+class CachedChunk:
+    """A streamed chunk holding the whole of a cached completion"""
+
+    delta: str
+    stop_reason: Optional[str]
+
+    def __init__(self, delta: str, stop_reason: Optional[str] = None):
+        self.delta = delta
+        self.stop_reason = stop_reason
+
+
+class CachingClient:
+    """
+    Wraps a LlamaStackClient so completions are recorded to, or replayed from, a CompletionCache.
+    In replay mode no server is needed, so `client` can be None.
+    """
+
+    client: Any
+    cache: CompletionCache
+    mode: CompletionCacheMode
+    hits: int
+    misses: int
+
+    def __init__(self, client: Any, cache: CompletionCache, mode: CompletionCacheMode = "record"):
+        if mode not in COMPLETION_CACHE_MODES:
+            raise ValueError(
+                f"Unknown completion cache mode: {mode}. Expected one of {', '.join(COMPLETION_CACHE_MODES)}"
+            )
+        if client is None and mode != "replay":
+            raise ValueError(f"The {mode} completion cache mode needs a client")
+        self.client = client
+        self.cache = cache
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self.models = getattr(client, "models", None)
+        self.inference = self
+
+    def completion(self, **kwargs):
+        if self.mode == "passthrough":
+            return self.client.inference.completion(**kwargs)
+
+        key = completion_key(kwargs)
+        if self.mode == "replay":
+            cached = self.cache.get(key)
+            if cached is None:
+                self.misses += 1
+                raise CompletionCacheMiss(
+                    f"No recorded completion for this request to {kwargs.get('model_id')}. Record it first with --completion-cache record"
+                )
+            self.hits += 1
+            content, stop_reason = cached
+            if kwargs.get("stream"):
+                return iter([CachedChunk(content, stop_reason)])
+            return CachedCompletion(content, stop_reason)
+
+        self.misses += 1
+        response = self.client.inference.completion(**kwargs)
+        if kwargs.get("stream"):
+            return RecordingStream(response, self.cache, key, kwargs.get("model_id", ""))
+        self.cache.put(key, kwargs.get("model_id", ""), response.content, stop_reason_value(response))
+        return response
+
+
+class RecordingStream:
+    """
+    A streamed response that saves the text that was read once the stream ends or is closed.
+    The agent closes streams as soon as the tool call is complete, so what's saved is exactly what the agent used
+    """
+
+    def __init__(self, stream: Any, cache: CompletionCache, key: str, model_id: str):
+        self.stream = stream
+        self.cache = cache
+        self.key = key
+        self.model_id = model_id
+        self.text = ""
+        self.stop_reason = None
+        self.failed = False
+        self.saved = False
+
+    def __iter__(self):
+        try:
+            for chunk in self.stream:
+                self.text += chunk_text(chunk)
+                self.stop_reason = stop_reason_value(chunk) or self.stop_reason
+                yield chunk
+        except Exception:
+            # Don't save half a response from a broken connection
+            self.failed = True
+            raise
+        self.save()
+
+    def close(self):
+        close = getattr(self.stream, "close", None)
+        if close is not None:
+            close()
+        self.save()
+
+    def save(self):
+        if self.saved or self.failed:
+            return
+        self.saved = True
+        self.cache.put(self.key, self.model_id, self.text, self.stop_reason)
+
+
+def stop_reason_value(response: Any) -> Optional[str]:
+    stop_reason = getattr(response, "stop_reason", None)
+    if stop_reason is None:
+        return None
+    return getattr(stop_reason, "value", str(stop_reason))
@@ -0,0 +1,196 @@
+import json
+import re
+from typing import Optional
+from llama_agent.conversation import Conversation, Segment
+
+# Llama 3.3 70B has a 128k context window. Leave room for the response
+CONTEXT_TOKEN_BUDGET = 100_000
+
+RESULT_PREFIX = "\nResult: "
+# Tools whose results are only observations of the repository, so they can be re-fetched if elided
+COMPACTABLE_TOOLS = {"view_file", "list_files", "search_code", "find_definition", "find_references"}
+# Results that are a list of lines are elided to their first and last lines: what they list, and how to get it back
+LISTED = {
+    "list_files": ("entries", "List the directory again to see them"),
+    "search_code": ("matches", "Run the search again to see them"),
+    "find_definition": ("definitions", "Run find_definition again to see them"),
+    "find_references": ("references", "Run find_references again to see them"),
+}
+
+# Lines that give a rough outline of a source file
+OUTLINE_PATTERN = re.compile(
+    r"^\s*(?:async\s+def|def|class|function|func|fn|interface|struct|enum|impl|trait|type|module|export)\b"
+)
+
+
+class ContextBudget:
+    """
+    Keeps the prompt under a token budget by compacting old tool observations.
+
+    Once the prompt is over budget, older successful results of COMPACTABLE_TOOLS are compacted, oldest first:
+        1. Repeated calls with the same arguments (e.g., views of the same file, or the same search)
+           are folded into a reference to the latest one
+        2. Long file bodies are elided down to an outline plus the first and last lines
+        3. Long directory listings, search results and symbol lists are elided down to their first and last lines
+    The most recent `keep_recent` tool results are never compacted since the model is likely still using them.
+    """
+
+    max_tokens: int
+    keep_recent: int
+    head_lines: int
+    tail_lines: int
+    max_outline_lines: int
+
+    def __init__(
+        self,
+        max_tokens: int = CONTEXT_TOKEN_BUDGET,
+        keep_recent: int = 3,
+        head_lines: int = 20,
+        tail_lines: int = 10,
+        max_outline_lines: int = 50,
+    ):
+        self.max_tokens = max_tokens
+        self.keep_recent = keep_recent
+        self.head_lines = head_lines
+        self.tail_lines = tail_lines
+        self.max_outline_lines = max_outline_lines
+
+    def over_budget(self, conversation: Conversation) -> bool:
+        return conversation.prompt_token_count("assistant") > self.max_tokens
+
+    def enforce(self, conversation: Conversation) -> int:
+        """
+        Compact the conversation in place until it fits in the budget (or there is nothing left to compact)
+
+        Returns:
+            int: The number of tokens saved
+        """
+        if not self.over_budget(conversation):
+            return 0
+
+        before = conversation.token_count
+        candidates = self.compactable_indexes(conversation)
+
+        # Fold repeated calls first: it loses no information
+        latest = {}
+        for index, segment in enumerate(conversation.segments):
+            if (
+                segment.metadata.get("tool_name") in COMPACTABLE_TOOLS
+                and segment.metadata.get("result") == "success"
+            ):
+                latest[call_key(segment)] = index
+        for index in candidates:
+            if not self.over_budget(conversation):
+                break
+            segment = conversation.segments[index]
+            if latest[call_key(segment)] != index:
+                conversation.replace(
+                    index,
+                    compacted_segment(
+                        segment,
+                        "[File contents omitted - the same file is viewed again later in the conversation]"
+                        if segment.metadata["tool_name"] == "view_file"
+                        else "[Result omitted - the same call is made again later in the conversation]",
+                    ),
+                )
+
+        # Then elide the oldest bodies until we fit
+        for index in candidates:
+            if not self.over_budget(conversation):
+                break
+            segment = conversation.segments[index]
+            if segment.metadata.get("compacted"):
+                continue
+            result = result_text(segment)
+            if segment.metadata["tool_name"] == "view_file":
+                elided = self.elide_file(result)
+            else:
+                elided = self.elide_listing(result, *LISTED[segment.metadata["tool_name"]])
+            if elided is not None:
+                conversation.replace(index, compacted_segment(segment, elided))
+
+        return before - conversation.token_count
+
+    def compactable_indexes(self, conversation: Conversation) -> list[int]:
+        tool_indexes = [
+            i
+            for i, segment in enumerate(conversation.segments)
+            if segment.role == "tool"
+            and segment.metadata.get("result") == "success"
+            and segment.metadata.get("tool_name") in COMPACTABLE_TOOLS
+        ]
+        if self.keep_recent > 0:
+            tool_indexes = tool_indexes[: -self.keep_recent]
+        return [
+            i
+            for i in tool_indexes
+            if not conversation.segments[i].metadata.get("compacted")
+        ]
+
+    def elide_file(self, content: str) -> Optional[str]:
+        """Elide a file body down to its first lines, an outline and its last lines. None if it's already short"""
+        lines = content.split("\n")
+        if len(lines) <= self.head_lines + self.tail_lines:
+            return None
+
+        middle = range(self.head_lines, len(lines) - self.tail_lines)
+        outline = [
+            f"{i + 1}: {lines[i].rstrip()}"
+            for i in middle
+            if OUTLINE_PATTERN.match(lines[i])
+        ][: self.max_outline_lines]
+
+        return "\n".join(
+            [
+                f"[File body elided to save context. It has {len(lines)} lines. View the file again to see it in full]",
+                *lines[: self.head_lines],
+                "...",
+                *(["Outline:", *outline, "..."] if outline else []),
+                *lines[-self.tail_lines :],
+            ]
+        )
+
+    def elide_listing(
+        self, content: str, entries: str = "entries", again: str = "List the directory again to see them"
+    ) -> Optional[str]:
+        lines = content.split("\n")
+        if len(lines) <= self.head_lines + self.tail_lines:
+            return None
+        omitted = len(lines) - self.head_lines - self.tail_lines
+        return "\n".join(
+            [
+                *lines[: self.head_lines],
+                f"... ({omitted} {entries} elided to save context. {again})",
+                *lines[-self.tail_lines :],
+            ]
+        )
+
+
+def call_key(segment: Segment) -> str:
+    """Tool calls with the same key return the same result, e.g., the same search with the same page"""
+    tool_name = segment.metadata["tool_name"]
+    params = segment.metadata["tool_params"]
+    if tool_name == "view_file":
+        # Views of different line ranges of the same file show different content
+        return f"view_file:{params.get('path', '')}:{params.get('start_line', '')}-{params.get('end_line', '')}"
+    return f"{tool_name}:{json.dumps(params, sort_keys=True, default=str)}"
+
+
+def result_text(segment: Segment) -> str:
+    content = segment.content
+    start = content.find(RESULT_PREFIX)
+    if start == -1:
+        return content
+    return content[start + len(RESULT_PREFIX) :].removesuffix("\n")
+
+
+def compacted_segment(segment: Segment, result: str) -> Segment:
+    """A copy of a tool segment with its result replaced"""
+    content = segment.content
+    start = content.find(RESULT_PREFIX)
+    call = content[:start] if start != -1 else ""
+    return Segment(
+        segment.role,
+        call + RESULT_PREFIX + result + "\n",
+        {**segment.metadata, "compacted": True},
+    )
@@ -0,0 +1,177 @@
+import hashlib
+from typing import Iterator, Literal, Optional
+from llama_models.llama3.api.tokenizer import Tokenizer
+
+Role = Literal["user", "assistant", "system", "tool"]
+
+BEGIN_OF_TEXT = "<|begin_of_text|>"
+# Chained hash for an empty conversation. Each segment's prefix hash is sha256(previous prefix hash + segment hash)
+EMPTY_PREFIX_HASH = hashlib.sha256(BEGIN_OF_TEXT.encode()).hexdigest()
+
+
+def chat_message(role: Role, content: str):
+    return f"<|start_header_id|>{role}<|end_header_id|>\n\n{content}<|eot_id|>"
+
+
+def header(role: Role):
+    return f"<|start_header_id|>{role}<|end_header_id|>\n\n"
+
+
+def encode(text: str) -> list[int]:
+    """
+    Tokenize raw prompt text. Special tokens (headers, <|eot_id|>) are encoded as single tokens,
+    the same way the server tokenizes a raw completion prompt
+    """
+    return Tokenizer.get_instance().encode(
+        text, bos=False, eos=False, allowed_special="all"
+    )
+
+
+def chain_hash(prefix_hash: str, segment: "Segment") -> str:
+    return hashlib.sha256((prefix_hash + segment.hash).encode()).hexdigest()
+
+
+class Segment:
+    """
+    A single immutable message in the conversation: <|start_header_id|>role<|end_header_id|>\\n\\ncontent<|eot_id|>
+    The rendered text, token ids and content hash are computed once on creation.
+    """
+
+    __slots__ = ("_role", "_content", "_metadata", "_text", "_tokens", "_hash")
+
+    def __init__(self, role: Role, content: str, metadata: Optional[dict] = None):
+        text = chat_message(role, content)
+        object.__setattr__(self, "_role", role)
+        object.__setattr__(self, "_content", content)
+        object.__setattr__(self, "_metadata", dict(metadata or {}))
+        object.__setattr__(self, "_text", text)
+        object.__setattr__(self, "_tokens", tuple(encode(text)))
+        object.__setattr__(
+            self, "_hash", hashlib.sha256(text.encode("utf-8")).hexdigest()
+        )
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Segment is immutable")
+
+    @property
+    def role(self) -> Role:
+        return self._role
+
+    @property
+    def content(self) -> str:
+        return self._content
+
+    @property
+    def metadata(self) -> dict:
+        """Extra information about the segment, e.g., the tool call that produced it. Not rendered"""
+        return dict(self._metadata)
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    @property
+    def tokens(self) -> tuple[int, ...]:
+        return self._tokens
+
+    @property
+    def token_count(self) -> int:
+        return len(self._tokens)
+
+    @property
+    def hash(self) -> str:
+        return self._hash
+
+    def __repr__(self):
+        return f"Segment({self.role}, {self.token_count} tokens)"
+
+
+class Conversation:
+    """
+    A prompt made up of immutable segments.
+
+    Appending is O(len(content)) - the new segment is tokenized once and the running token count
+    and prefix hash are updated - so the prompt size is always known without re-tokenizing.
+    The raw prompt is only rendered when it is sent to the model.
+    """
+
+    segments: list[Segment]
+
+    def __init__(self):
+        self.segments = []
+        self._token_count = len(encode(BEGIN_OF_TEXT))
+        self._prefix_hashes = [EMPTY_PREFIX_HASH]
+
+    def append(
+        self, role: Role, content: str, metadata: Optional[dict] = None
+    ) -> Segment:
+        return self.append_segment(Segment(role, content, metadata))
+
+    def append_segment(self, segment: Segment) -> Segment:
+        self.segments.append(segment)
+        self._token_count += segment.token_count
+        self._prefix_hashes.append(chain_hash(self._prefix_hashes[-1], segment))
+        return segment
+
+    def replace(self, index: int, segment: Segment) -> Segment:
+        """
+        Replace the segment at `index`, e.g., with a compacted version of it.
+        Prefix hashes from `index` onwards change, so a prefix cache can only reuse the work before it.
+        """
+        old = self.segments[index]
+        self.segments[index] = segment
+        self._token_count += segment.token_count - old.token_count
+        del self._prefix_hashes[index + 1 :]
+        for later in self.segments[index:]:
+            self._prefix_hashes.append(chain_hash(self._prefix_hashes[-1], later))
+        return segment
+
+    def fork(self) -> "Conversation":
+        """A copy that can be appended to separately. Segments are immutable, so they are shared rather than copied"""
+        fork = Conversation()
+        fork.segments = list(self.segments)
+        fork._token_count = self._token_count
+        fork._prefix_hashes = list(self._prefix_hashes)
+        return fork
+
+    def __len__(self) -> int:
+        return len(self.segments)
+
+    def __iter__(self) -> Iterator[Segment]:
+        return iter(self.segments)
+
+    @property
+    def token_count(self) -> int:
+        """Number of tokens in the rendered conversation, including <|begin_of_text|>"""
+        return self._token_count
+
+    def prompt_token_count(self, role: Optional[Role] = "assistant") -> int:
+        """Number of tokens in the prompt returned by `prompt(role)`, excluding any prefill"""
+        if role is None:
+            return self._token_count
+        return self._token_count + len(encode(header(role)))
+
+    def prefix_hash(self, num_segments: Optional[int] = None) -> str:
+        """
+        Stable hash of the first `num_segments` segments (all of them by default).
+        Two prompts that share a prefix hash share the same rendered prefix, so a server
+        that does prefix/KV caching can reuse work for it.
+        """
+        if num_segments is None:
+            num_segments = len(self.segments)
+        return self._prefix_hashes[num_segments]
+
+    def render(self) -> str:
+        return BEGIN_OF_TEXT + "".join(segment.text for segment in self.segments)
+
+    def prompt(self, role: Optional[Role] = "assistant", prefill: str = "") -> str:
+        """
+        Render the conversation as a raw completion prompt, opening a new turn for `role`
+
+        Args:
+            role (Optional[Role]): The role that should respond next. None to leave the prompt without an open turn
+            prefill (str): Text to start the response with
+        """
+        if role is None:
+            return self.render() + prefill
+        return self.render() + header(role) + prefill
@@ -0,0 +1,147 @@
+import os
+import re
+import stat
+import tempfile
+from typing import Optional
+from llama_agent.tracing import current_span
+
+
+class Edit:
+    """
+    One change to a file: either replace `old_str` with `new_str`,
+    or replace lines `start_line` to `end_line` (1-indexed, inclusive) with `new_str`.
+    """
+
+    path: str
+    file: str
+    new_str: str
+    old_str: Optional[str]
+    start_line: Optional[int]
+    end_line: Optional[int]
+
+    def __init__(
+        self,
+        path: str,
+        file: str,
+        new_str: str,
+        old_str: Optional[str] = None,
+        start_line: Optional[int] = None,
+        end_line: Optional[int] = None,
+    ):
+        """
+        Args:
+            path (str): The path the agent gave, used in error messages
+            file (str): The file on disk
+        """
+        self.path = path
+        self.file = file
+        self.new_str = new_str
+        self.old_str = old_str
+        self.start_line = start_line
+        self.end_line = end_line
+
+    def apply(self, content: str) -> str:
+        """The content with this edit made. Raises ValueError if the edit doesn't match the content"""
+        if self.old_str is not None:
+            count = content.count(self.old_str)
+            if count == 0:
+                raise ValueError(f"old_str not found in {self.path}: {self.old_str!r}")
+            if count > 1:
+                raise ValueError(
+                    f"old_str appears {count} times in {self.path}, include more lines around it so it is unique: {self.old_str!r}"
+                )
+            return content.replace(self.old_str, self.new_str)
+
+        lines = split_lines(content)
+        start = self.start_line
+        end = self.end_line if self.end_line is not None else start
+        if not 1 <= start <= end <= len(lines):
+            raise ValueError(
+                f"Lines {start}-{end} are out of range for {self.path}, which has {len(lines)} lines"
+            )
+        new_str = self.new_str
+        if new_str and not new_str.endswith("\n") and lines[end - 1].endswith("\n"):
+            new_str += "\n"
+        return "".join(lines[: start - 1]) + new_str + "".join(lines[end:])
+
+
+def split_lines(content: str) -> list[str]:
+    """Lines of `content`, keeping their newlines. Only \n ends a line, like view_file"""
+    return re.findall(r"[^\n]*\n|[^\n]+$", content)
+
+
+def apply_edits(edits: list[Edit]) -> list[str]:
+    """
+    Make all the edits, or none of them. Each file is read once, all of its edits are made in memory in order,
+    and then every file is written with write_files. Edits to the same file see the earlier edits in the list.
+
+    Raises:
+        ValueError: If any edit doesn't match. No file has been changed
+        OSError: If writing failed. Files already written have been restored
+
+    Returns:
+        list[str]: The files that were changed, in the order they were first edited
+    """
+    originals: dict[str, str] = {}
+    contents: dict[str, str] = {}
+    for edit in edits:
+        if edit.file not in contents:
+            with open(edit.file, "r") as f:
+                originals[edit.file] = contents[edit.file] = f.read()
+                current_span().add("bytes_read", os.fstat(f.fileno()).st_size)
+        contents[edit.file] = edit.apply(contents[edit.file])
+
+    write_files(contents, originals)
+    return list(contents)
+
+
+def write_files(contents: dict[str, str], originals: dict[str, str]) -> None:
+    """
+    Write several files so that either all of them change or none of them do.
+    Everything is written to temp files first, then moved over the originals.
+    If a move fails, the files already moved are put back to `originals`.
+    """
+    temps: dict[str, str] = {}
+    try:
+        for path, content in contents.items():
+            temps[path] = write_temp(path, content)
+    except BaseException:
+        for temp in temps.values():
+            os.unlink(temp)
+        raise
+
+    replaced = []
+    try:
+        for path, temp in temps.items():
+            os.replace(temp, path)
+            replaced.append(path)
+    except BaseException:
+        for path in replaced:
+            atomic_write(path, originals[path])
+        for path, temp in temps.items():
+            if path not in replaced and os.path.exists(temp):
+                os.unlink(temp)
+        raise
+
+
+def atomic_write(path: str, content: str) -> None:
+    """Write a file so readers only ever see the old or the new content, never a half written file"""
+    os.replace(write_temp(path, content), path)
+
+
+def write_temp(path: str, content: str) -> str:
+    """Write `content` to a temp file next to `path`, with the same permissions, and return its path"""
+    # Same directory, so the rename stays on one filesystem and is atomic
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+            current_span().add("bytes_written", os.fstat(f.fileno()).st_size)
+        if os.path.exists(path):
+            os.chmod(temp, stat.S_IMODE(os.stat(path).st_mode))
+    except BaseException:
+        os.unlink(temp)
+        raise
+    return temp
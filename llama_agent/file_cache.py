@@ -0,0 +1,94 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Tuple
+from llama_agent.tracing import current_span
+
+# Enough for a few dozen large source files per run
+FILE_CACHE_BYTES = 32 * 1024 * 1024
+
+
+class FileCache:
+    """
+    Contents of recently viewed files, so viewing the same file again in a run doesn't read it from disk again.
+
+    Entries are keyed by resolved path and validated against the file's mtime and size on every lookup,
+    so a file changed behind our back is re-read. Writes through the tools should call invalidate() right away.
+    The least recently used files are evicted once the cached contents go over `max_bytes`.
+    """
+
+    max_bytes: int
+    hits: int
+    misses: int
+
+    def __init__(self, max_bytes: int = FILE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        # path -> ((mtime_ns, size), content)
+        self._entries: OrderedDict[str, Tuple[Tuple[int, int], str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        """Bytes of file content currently cached"""
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def read(self, path: str) -> str:
+        """The text content of the file at `path`, from the cache if it hasn't changed since it was cached"""
+        key = os.path.realpath(path)
+        stat = os.stat(key)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        with open(key, "r") as f:
+            # Use the version of what we actually read, in case the file changed since the stat above
+            stat = os.fstat(f.fileno())
+            content = f.read()
+        current_span().add("bytes_read", stat.st_size)
+        self._put(key, (stat.st_mtime_ns, stat.st_size), content)
+        return content
+
+    def invalidate(self, path: str) -> None:
+        key = os.path.realpath(path)
+        with self._lock:
+            self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> str:
+        return (
+            f"{self.hits} hits, {self.misses} misses, "
+            f"{len(self)} files ({self.size / 1e6:.1f} MB) cached"
+        )
+
+    def _put(self, key: str, version: Tuple[int, int], content: str) -> None:
+        size = version[1]
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (version, content)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, ((_, evicted_size), _) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[0][1]
@@ -0,0 +1,98 @@
+import mmap
+import os
+from array import array
+from typing import Optional, Tuple
+
+# Files bigger than this are shown a page at a time instead of in full
+VIEW_MAX_BYTES = 256 * 1024
+# How many lines of a big file to show when no line range is given
+VIEW_PAGE_LINES = 500
+# How much of a file to look at when deciding if it is binary
+SNIFF_BYTES = 8192
+
+
+def is_binary(path: str) -> bool:
+    """Same heuristic as git: a file with a NUL byte near the start is binary"""
+    with open(path, "rb") as f:
+        return b"\0" in f.read(SNIFF_BYTES)
+
+
+class LineIndex:
+    """
+    Byte offsets of the start of each line of a file, found by scanning an mmap of it.
+    Any range of lines can then be read without loading the rest of the file into memory.
+    """
+
+    path: str
+    version: Tuple[int, int]
+    size: int
+    offsets: array
+
+    def __init__(self, path: str, version: Tuple[int, int], offsets: array):
+        self.path = path
+        self.version = version
+        self.size = version[1]
+        self.offsets = offsets
+
+    @classmethod
+    def from_file(cls, path: str) -> "LineIndex":
+        offsets = array("Q", [0])
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            # mmap can't map an empty file
+            if stat.st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    pos = mm.find(b"\n")
+                    while pos != -1:
+                        offsets.append(pos + 1)
+                        pos = mm.find(b"\n", pos + 1)
+        return cls(path, (stat.st_mtime_ns, stat.st_size), offsets)
+
+    @property
+    def line_count(self) -> int:
+        # A trailing newline doesn't start another line
+        if self.offsets[-1] == self.size:
+            return len(self.offsets) - 1
+        return len(self.offsets)
+
+    def read_lines(self, start: int, end: int) -> str:
+        """Lines `start` to `end`, 1-indexed and inclusive"""
+        start_offset = self.offsets[start - 1]
+        end_offset = self.offsets[end] if end < len(self.offsets) else self.size
+        with open(self.path, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mm:
+            return mm[start_offset:end_offset].decode("utf-8", errors="replace")
+
+
+def parse_line_range(
+    start_line: Optional[str], end_line: Optional[str]
+) -> Tuple[Optional[int], Optional[int], Optional[str]]:
+    """
+    Parse the optional start_line and end_line tool params
+
+    Returns:
+        Tuple[Optional[int], Optional[int], Optional[str]]: start, end and an error message if they're invalid
+    """
+    try:
+        start = int(start_line) if start_line is not None else None
+        end = int(end_line) if end_line is not None else None
+    except (TypeError, ValueError):
+        return None, None, f"ERROR - start_line and end_line must be integers, got: {start_line}, {end_line}"
+    if start is not None and start < 1:
+        return None, None, f"ERROR - start_line must be at least 1, got: {start}"
+    if start is not None and end is not None and end < start:
+        return None, None, f"ERROR - end_line ({end}) is before start_line ({start})"
+    return start, end, None
+
+
+def page_header(start: int, end: int, line_count: int) -> str:
+    return f"Showing lines {start}-{end} of {line_count}. Use start_line and end_line to view other lines.\n"
+
+
+def clamp_range(
+    start: Optional[int], end: Optional[int], line_count: int, page_lines: int
+) -> Tuple[int, int]:
+    start = start or 1
+    end = end if end is not None else start + page_lines - 1
+    return start, min(end, line_count)
@@ -1,3 +1,24 @@
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import time
+import zlib
+from contextlib import closing
+from typing import Any, Optional, Tuple
+import httpx
+from llama_agent import SANDBOX_DIR
+
+GITHUB_API_URL = "https://api.github.com"
+GITHUB_CACHE_PATH = os.path.join(SANDBOX_DIR, "github_cache.sqlite")
+# Responses that are worth retrying after a backoff, on top of rate limits
+RETRY_STATUSES = {500, 502, 503, 504}
+# GitHub asks clients to wait at least a minute after a secondary rate limit that doesn't say how long to wait
+SECONDARY_RATE_LIMIT_WAIT = 60
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
 class Issue:
     repo: str
     owner: str
@@ -34,3 +55,244 @@ class Issue:
             self.issue_number = int(parts[4])  # Issue number
         except ValueError:
             raise ValueError(f"Expected an integer issue number: {parts[4]}")
+
+
+class GitHubCache:
+    """
+    Responses to GET requests saved to a SQLite database with their ETag, keyed by url.
+    Sending the ETag back as If-None-Match gets a 304 when nothing changed, which doesn't count against the rate limit
+    """
+
+    path: str
+
+    def __init__(self, path: str = GITHUB_CACHE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT NOT NULL,
+                    content BLOB NOT NULL,
+                    created REAL NOT NULL
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=60)
+
+    def get(self, url: str) -> Optional[Tuple[str, bytes]]:
+        """The saved (etag, content), or None"""
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT etag, content FROM responses WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        return row[0], zlib.decompress(row[1])
+
+    def put(self, url: str, etag: str, content: bytes) -> None:
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (url, etag, zlib.compress(content), time.time()),
+            )
+
+
+class GitHubClient:
+    """
+    Async GitHub REST API client. Connections are pooled and kept alive between requests, so a batch of runs
+    doesn't pay for a new TLS handshake on every call.
+
+    Rate limited (403/429) and server error (5xx) responses are retried with exponential backoff, waiting as long
+    as Retry-After or X-RateLimit-Reset say to. Requests that fail to connect are retried too, and ones that time out
+    are retried unless they may have created something (e.g., a POST).
+    GETs made with `cached=True` are conditional on the ETag of the last response, see GitHubCache.
+    """
+
+    token: str
+    cache: Optional[GitHubCache]
+    max_retries: int
+    max_backoff: float
+    # The rate limit as of the last response, None until a response has said
+    rate_limit_remaining: Optional[int]
+    rate_limit_reset: Optional[float]
+
+    def __init__(
+        self,
+        token: str,
+        base_url: Optional[str] = None,
+        cache: Optional[GitHubCache] = None,
+        max_retries: int = 5,
+        max_backoff: float = 300,
+        timeout: float = 30,
+        max_connections: int = 64,
+    ):
+        """
+        Args:
+            token (str): The GitHub token to authenticate with
+            base_url (Optional[str]): The API url, e.g., a local stand-in for tests.
+                Defaults to $GITHUB_API_URL, or api.github.com if that isn't set
+            cache (Optional[GitHubCache]): Where to keep ETags and responses of cached GETs. None to not cache
+            max_retries (int): How many times to retry a request before returning its last response or raising
+            max_backoff (float): The longest to wait before a retry, in seconds
+            timeout (float): Seconds to wait to connect, and for each read from the server
+            max_connections (int): The most connections to keep open to the server at once
+        """
+        self.token = token
+        self.cache = cache
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.rate_limit_remaining = None
+        self.rate_limit_reset = None
+        self.http = httpx.AsyncClient(
+            base_url=base_url or os.getenv("GITHUB_API_URL") or GITHUB_API_URL,
+            headers={
+                "Authorization": f"Bearer {token}",
+                "Accept": "application/vnd.github+json",
+                "X-GitHub-Api-Version": "2022-11-28",
+                "User-Agent": "llama-agent",
+            },
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections, max_keepalive_connections=max_connections
+            ),
+        )
+
+    async def __aenter__(self) -> "GitHubClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
+
+    async def request(
+        self, method: str, path: str, cached: bool = False, idempotent: Optional[bool] = None, **kwargs
+    ) -> httpx.Response:
+        """
+        Send a request, retrying rate limits and transient failures.
+        Server errors and dropped connections are only retried for idempotent requests: GitHub may have
+        acted on a POST before failing, and sending it again would e.g. create the PR twice
+
+        Args:
+            method (str): The HTTP method
+            path (str): The path under the API url, e.g., /repos/owner/repo/issues/1
+            cached (bool): Make a GET conditional on the cached ETag, and answer a 304 from the cache
+            idempotent (Optional[bool]): Whether the request is safe to send twice. Defaults to whether
+                `method` is one of IDEMPOTENT_METHODS
+            **kwargs: Passed through to httpx, e.g., json=...
+
+        Returns:
+            httpx.Response: The last response, whatever its status
+        """
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        saved = None
+        if cached and self.cache is not None and method == "GET":
+            saved = self.cache.get(path)
+            if saved is not None:
+                kwargs["headers"] = {**kwargs.get("headers", {}), "If-None-Match": saved[0]}
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = await self.http.request(method, path, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                # The request never reached the server
+                if last_attempt:
+                    raise
+                await asyncio.sleep(self.backoff(attempt))
+                continue
+            except httpx.TransportError:
+                if last_attempt or not idempotent:
+                    raise
+                await asyncio.sleep(self.backoff(attempt))
+                continue
+
+            self.update_rate_limit(response)
+            wait = self.retry_wait(response, attempt, idempotent)
+            if wait is None or last_attempt:
+                break
+            await asyncio.sleep(wait)
+
+        if saved is not None and response.status_code == 304:
+            return httpx.Response(200, content=saved[1], request=response.request)
+        if cached and self.cache is not None and response.status_code == 200 and "ETag" in response.headers:
+            self.cache.put(path, response.headers["ETag"], response.content)
+        return response
+
+    async def get(self, path: str, cached: bool = False, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, cached=cached, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, **kwargs)
+
+    async def get_issue(self, owner: str, repo: str, issue_number: int) -> dict:
+        """The issue's data, e.g., its title and body. Unchanged issues are answered from the cache"""
+        response = await self.get(f"/repos/{owner}/{repo}/issues/{issue_number}", cached=True)
+        if response.status_code != 200:
+            raise ValueError(f"Failed to fetch issue: {response_error(response)}")
+        return response.json()
+
+    async def graphql(self, query: str, variables: Optional[dict[str, Any]] = None) -> dict:
+        """
+        Run a GraphQL query and return its data
+
+        Raises:
+            ValueError: If the request fails or the query returns errors
+        """
+        # Queries only read, so they are as safe to retry as a GET
+        response = await self.post("/graphql", idempotent=True, json={"query": query, "variables": variables or {}})
+        if response.status_code != 200:
+            raise ValueError(f"GraphQL query failed: {response_error(response)}")
+        result = response.json()
+        if result.get("errors"):
+            raise ValueError(
+                f"GraphQL query failed: {'; '.join(error.get('message', str(error)) for error in result['errors'])}"
+            )
+        return result["data"]
+
+    def update_rate_limit(self, response: httpx.Response) -> None:
+        if "X-RateLimit-Remaining" in response.headers:
+            self.rate_limit_remaining = int(response.headers["X-RateLimit-Remaining"])
+        if "X-RateLimit-Reset" in response.headers:
+            self.rate_limit_reset = float(response.headers["X-RateLimit-Reset"])
+
+    def retry_wait(self, response: httpx.Response, attempt: int, idempotent: bool = True) -> Optional[float]:
+        """
+        Seconds to wait before retrying `response`, or None if it shouldn't be retried.
+        Rate limited requests weren't acted on, so they are retried either way
+        """
+        status = response.status_code
+        if status in RETRY_STATUSES:
+            return self.backoff(attempt) if idempotent else None
+        if status not in (403, 429):
+            return None
+
+        if "Retry-After" in response.headers:
+            wait = float(response.headers["Retry-After"])
+        elif response.headers.get("X-RateLimit-Remaining") == "0" and "X-RateLimit-Reset" in response.headers:
+            # Primary rate limit: it resets at a unix timestamp
+            wait = float(response.headers["X-RateLimit-Reset"]) - time.time() + 1
+        elif status == 429 or "rate limit" in response.text.lower():
+            # Secondary rate limit without a hint
+            wait = max(SECONDARY_RATE_LIMIT_WAIT, self.backoff(attempt))
+        else:
+            # A plain 403, e.g., a token without permission
+            return None
+        return min(max(wait, 0), self.max_backoff)
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with jitter: about 1s, 2s, 4s, ... up to max_backoff"""
+        return min(self.max_backoff, 2**attempt) * random.uniform(0.5, 1)
+
+
+def response_error(response: httpx.Response) -> Any:
+    """The error GitHub sent back, for error messages"""
+    try:
+        return response.json()
+    except json.JSONDecodeError:
+        return f"{response.status_code} {response.text}"
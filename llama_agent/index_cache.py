@@ -0,0 +1,161 @@
+import gc
+import os
+import pickle
+import re
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+from subprocess import run
+from typing import Any, Iterator, Optional, Tuple
+from llama_agent import SANDBOX_DIR
+
+INDEX_CACHE_PATH = os.path.join(SANDBOX_DIR, "index_cache.sqlite")
+INDEX_CACHE_BYTES = 2 * 1024 * 1024 * 1024
+
+
+class IndexCache:
+    """
+    Repository indexes (file tree, code search, symbols) saved to a SQLite database, so runs against a repo
+    at a commit that was already indexed load them instead of rebuilding them.
+
+    Entries are keyed by (owner/repo, HEAD commit, index kind, index version). Bump an index's CACHE_VERSION
+    whenever its format changes. The least recently used entries are evicted once the cache goes over `max_bytes`.
+    Safe to share between threads and processes: each operation uses its own connection.
+    """
+
+    path: str
+    max_bytes: int
+    hits: int
+    misses: int
+
+    def __init__(self, path: str = INDEX_CACHE_PATH, max_bytes: int = INDEX_CACHE_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as db, db:
+            # WAL lets batch workers read while another one writes
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS indexes (
+                    repo TEXT NOT NULL,
+                    sha TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (repo, sha, kind, version)
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=60)
+
+    def get(self, repo: str, sha: str, kind: str, version: int) -> Optional[Any]:
+        key = (repo, sha, kind, version)
+        with closing(self._connect()) as db, db:
+            row = db.execute(
+                "SELECT data FROM indexes WHERE repo = ? AND sha = ? AND kind = ? AND version = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            db.execute(
+                "UPDATE indexes SET last_used = ? WHERE repo = ? AND sha = ? AND kind = ? AND version = ?",
+                (time.time(), *key),
+            )
+        self.hits += 1
+        with gc_paused():
+            return pickle.loads(row[0])
+
+    def put(self, repo: str, sha: str, kind: str, version: int, index: Any) -> None:
+        with gc_paused():
+            data = pickle.dumps(index, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "INSERT OR REPLACE INTO indexes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (repo, sha, kind, version, data, len(data), time.time()),
+            )
+            self._evict(db)
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        (total,) = db.execute("SELECT COALESCE(SUM(size), 0) FROM indexes").fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = db.execute(
+            "SELECT repo, sha, kind, version, size FROM indexes ORDER BY last_used"
+        ).fetchall()
+        for repo, sha, kind, version, size in rows:
+            if total <= self.max_bytes:
+                break
+            db.execute(
+                "DELETE FROM indexes WHERE repo = ? AND sha = ? AND kind = ? AND version = ?",
+                (repo, sha, kind, version),
+            )
+            total -= size
+
+    def size(self) -> int:
+        """Bytes of index data in the cache"""
+        with closing(self._connect()) as db:
+            return db.execute("SELECT COALESCE(SUM(size), 0) FROM indexes").fetchone()[0]
+
+    def __len__(self) -> int:
+        with closing(self._connect()) as db:
+            return db.execute("SELECT COUNT(*) FROM indexes").fetchone()[0]
+
+
+@contextmanager
+def gc_paused() -> Iterator[None]:
+    """
+    Pause the garbage collector. Unpickling an index creates millions of objects, which otherwise
+    sets off collection after collection and makes loading several times slower than building
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def repo_state(repo_path: str) -> Optional[Tuple[str, str]]:
+    """
+    (owner/repo, HEAD commit) of the repo at `repo_path`. None if its tracked files differ from HEAD,
+    since indexes built from them would be wrong for anyone else at the same commit.
+    """
+    head = run(["git", "rev-parse", "HEAD"], cwd=repo_path, capture_output=True, text=True)
+    if head.returncode != 0:
+        return None
+    status = run(
+        ["git", "status", "--porcelain", "--untracked-files=no"],
+        cwd=repo_path,
+        capture_output=True,
+        text=True,
+    )
+    if status.returncode != 0 or status.stdout.strip():
+        return None
+    remote = run(
+        ["git", "config", "--get", "remote.origin.url"],
+        cwd=repo_path,
+        capture_output=True,
+        text=True,
+    )
+    return repo_name(remote.stdout.strip(), repo_path), head.stdout.strip()
+
+
+def repo_name(remote_url: str, repo_path: str) -> str:
+    """owner/repo from a GitHub remote url, without any token in it. Other remotes are keyed by their url"""
+    match = re.search(r"github\.com[:/]([^/]+)/([^/]+?)(?:\.git)?/?$", remote_url)
+    if match:
+        return f"{match.group(1)}/{match.group(2)}"
+    if remote_url:
+        return re.sub(r"//[^/@]*@", "//", remote_url)
+    return os.path.basename(os.path.abspath(repo_path))
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import os
+import time
+from typing import Iterable, Optional
+from llama_agent import REPO_DIR
+from llama_agent.edits import atomic_write
+from llama_agent.github import GitHubClient
+
+# Issues that have already been handled, so queue-driven runs don't open a second PR for them
+STATE_PATH = os.path.join(REPO_DIR, "results", "handled_issues.json")
+# The most issues GitHub returns per page
+ISSUES_PAGE_SIZE = 100
+# Repos fetched in one query. Each adds up to ISSUES_PAGE_SIZE issues to the response
+REPOS_PER_QUERY = 10
+# Labels returned with each issue
+LABELS_PER_ISSUE = 20
+
+ISSUE_FIELDS = f"""
+    nodes {{
+        number
+        url
+        title
+        body
+        labels(first: {LABELS_PER_ISSUE}) {{ nodes {{ name }} }}
+    }}
+    pageInfo {{ hasNextPage endCursor }}
+"""
+
+
+def issues_query(repos: int) -> str:
+    """
+    A query for a page of open issues from each of `repos` repos, aliased r0, r1, ...
+    The owner, name and cursor of repo i are the variables owner{i}, name{i} and after{i}
+    """
+    variables = ["$labels: [String!]", "$pageSize: Int!"]
+    fields = []
+    for i in range(repos):
+        variables += [f"$owner{i}: String!", f"$name{i}: String!", f"$after{i}: String"]
+        fields.append(
+            f"""
+    r{i}: repository(owner: $owner{i}, name: $name{i}) {{
+        issues(
+            first: $pageSize
+            after: $after{i}
+            states: OPEN
+            labels: $labels
+            orderBy: {{ field: CREATED_AT, direction: ASC }}
+        ) {{{ISSUE_FIELDS}}}
+    }}"""
+        )
+    return f"query({', '.join(variables)}) {{{''.join(fields)}\n}}"
+
+
+async def fetch_issues(
+    github: GitHubClient,
+    repos: Iterable[str],
+    labels: Optional[list[str]] = None,
+    page_size: int = ISSUES_PAGE_SIZE,
+    repos_per_query: int = REPOS_PER_QUERY,
+) -> list[dict]:
+    """
+    Fetch the open issues of many repos, with their bodies and labels, in a few GraphQL queries.
+    Each query gets a page of issues from up to `repos_per_query` repos, and only repos with more pages are queried again.
+
+    Args:
+        github (GitHubClient): The client to query with
+        repos (Iterable[str]): The repos, as owner/name
+        labels (Optional[list[str]]): Only fetch issues with any of these labels. None for every open issue
+        page_size (int): Issues per repo per query, at most 100
+
+    Returns:
+        list[dict]: The issues in repo order, oldest first, without duplicates. Each has
+            url, owner, repo, number, title, body and labels
+    """
+    # repo -> cursor of its next page
+    pending = {parse_repo(repo): None for repo in repos}
+    issues = {}
+    while pending:
+        batch = list(pending.items())[:repos_per_query]
+        variables = {"labels": labels or None, "pageSize": page_size}
+        for i, ((owner, name), cursor) in enumerate(batch):
+            variables.update({f"owner{i}": owner, f"name{i}": name, f"after{i}": cursor})
+        data = await github.graphql(issues_query(len(batch)), variables)
+
+        for i, ((owner, name), _) in enumerate(batch):
+            repository = data.get(f"r{i}")
+            if repository is None:
+                raise ValueError(f"Repository not found: {owner}/{name}")
+            page = repository["issues"]
+            for node in page["nodes"]:
+                issues.setdefault(node["url"], issue_from_node(owner, name, node))
+            if page["pageInfo"]["hasNextPage"]:
+                pending[(owner, name)] = page["pageInfo"]["endCursor"]
+            else:
+                del pending[(owner, name)]
+    return list(issues.values())
+
+
+def fetch_open_issues(
+    github_api_key: str, repos: list[str], labels: Optional[list[str]] = None
+) -> dict[str, dict]:
+    """Synchronous wrapper around fetch_issues, with the issues keyed by url"""
+
+    async def fetch() -> list[dict]:
+        async with GitHubClient(github_api_key) as github:
+            return await fetch_issues(github, repos, labels)
+
+    return {issue["url"]: issue for issue in asyncio.run(fetch())}
+
+
+def issue_from_node(owner: str, repo: str, node: dict) -> dict:
+    return {
+        "url": node["url"],
+        "owner": owner,
+        "repo": repo,
+        "number": node["number"],
+        "title": node["title"],
+        "body": node["body"],
+        "labels": [label["name"] for label in node["labels"]["nodes"]],
+    }
+
+
+def parse_repo(repo: str) -> tuple[str, str]:
+    """owner/name (or a github.com url of the repo) as (owner, name)"""
+    path = repo.strip().removeprefix("https://").removeprefix("github.com/").strip("/")
+    parts = path.split("/")
+    if len(parts) != 2 or not all(parts):
+        raise ValueError(f"Expected a repo as owner/name: {repo}")
+    return parts[0], parts[1]
+
+
+def read_repos(repos: Iterable[str] = (), repos_file: Optional[str] = None) -> list[str]:
+    """Combine repos from the command line and a file (one owner/name per line, # for comments)"""
+    combined = list(repos)
+    if repos_file:
+        with open(repos_file, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    combined.append(line)
+    return list(dict.fromkeys(combined))
+
+
+class HandledIssues:
+    """
+    A JSON file of the issues that have been handled, keyed by url, with the outcome of each.
+    Written by the process running the batch only, atomically so a crash never leaves half a file
+    """
+
+    path: str
+    issues: dict[str, dict]
+
+    def __init__(self, path: str = STATE_PATH):
+        self.path = os.path.abspath(path)
+        self.issues = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                self.issues = json.load(f)
+
+    def __contains__(self, issue_url: str) -> bool:
+        return issue_url in self.issues
+
+    def __len__(self) -> int:
+        return len(self.issues)
+
+    def unhandled(self, issue_urls: Iterable[str]) -> list[str]:
+        return [issue_url for issue_url in issue_urls if issue_url not in self.issues]
+
+    def record(self, result: dict) -> None:
+        """Mark a job's issue as handled if the job succeeded"""
+        if not result.get("ok"):
+            return
+        self.issues[result["issue_url"]] = {
+            "status": result.get("status"),
+            "pr_url": result.get("pr_url"),
+            "handled_at": time.time(),
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        atomic_write(self.path, json.dumps(self.issues, indent=2))
@@ -1,66 +1,293 @@
 import argparse
+import asyncio
 import os
 import json
-from typing import Tuple
-import requests
+from contextlib import AsyncExitStack, nullcontext
+from typing import Optional, Tuple
 from ansi import bold, red, green, yellow, blue, magenta, cyan
 from dotenv import load_dotenv
-from llama_agent.agent import run_agent, MODEL_ID
+from llama_agent.agent import run_agent_async, MODEL_ID
+from llama_agent.aio import as_async_client, run_shell
+from llama_agent.best_of_n import SCORERS, Scorer, command_scorer
+from llama_agent.context import ContextBudget, CONTEXT_TOKEN_BUDGET
 import shutil
 import time
-from llama_stack_client import LlamaStackClient
-from llama_agent.github import Issue
+from llama_stack_client import AsyncLlamaStackClient, LlamaStackClient
+from llama_agent.github import GitHubCache, GitHubClient, Issue, response_error
+from llama_agent.workspace import Workspace
+from llama_agent.index_cache import IndexCache
+from llama_agent.completion_cache import (
+    COMPLETION_CACHE_MODES,
+    COMPLETION_CACHE_PATH,
+    CachingClient,
+    CompletionCache,
+)
+from llama_agent.sandbox import WorktreePool, CLONE_STRATEGIES, clone
 from llama_agent import SANDBOX_DIR
-from subprocess import run
+from llama_agent.tracing import run, span, trace_path, tracing
 
 
-def main(issue_url: str):
+def main(
+    issue_url: str,
+    stream: bool = False,
+    use_stop_sequences: bool = False,
+    max_context_tokens: int = CONTEXT_TOKEN_BUDGET,
+    use_worktrees: bool = True,
+    clone_strategy: str = "full",
+    reference_repo: Optional[str] = None,
+    completion_cache: str = "passthrough",
+    completion_cache_path: str = COMPLETION_CACHE_PATH,
+    attempts: int = 1,
+    scorer: str = "syntax",
+    test_command: Optional[str] = None,
+    trace: bool = False,
+    trace_summary: bool = False,
+):
     github_api_key = os.getenv("GITHUB_API_KEY")
     if not github_api_key:
         raise ValueError("GITHUB_API_KEY is not set in the environment variables")
 
-    llama_stack_url = os.getenv("LLAMA_STACK_URL")
+    client = make_client(os.getenv("LLAMA_STACK_URL"), completion_cache, completion_cache_path)
+
+    issue = Issue(issue_url)
+    trace_file = trace_path(f"{issue.owner}__{issue.repo}__{issue.issue_number}") if trace else None
+    with tracing(trace_file) if trace or trace_summary else nullcontext() as tracer:
+        solve_issue(
+            client,
+            github_api_key,
+            issue_url,
+            sandbox_dir=None if use_worktrees else SANDBOX_DIR,
+            stream=stream,
+            use_stop_sequences=use_stop_sequences,
+            max_context_tokens=max_context_tokens,
+            clone_strategy=clone_strategy,
+            reference_repo=reference_repo,
+            attempts=attempts,
+            scorer=command_scorer(test_command) if test_command else SCORERS[scorer],
+        )
+
+    if isinstance(client, CachingClient):
+        print(f"Completion cache ({client.mode}): {client.hits} hits, {client.misses} misses")
+    if trace_file:
+        print(f"Trace written to {trace_file}")
+    if trace_summary:
+        print(tracer.summary())
+
+
+def make_client(
+    llama_stack_url: Optional[str],
+    completion_cache: str = "passthrough",
+    completion_cache_path: str = COMPLETION_CACHE_PATH,
+):
+    """
+    The inference client, wrapped in a CachingClient unless `completion_cache` is "passthrough".
+    Replaying doesn't talk to the server at all, so it doesn't need LLAMA_STACK_URL
+    """
+    if completion_cache == "replay":
+        return CachingClient(None, CompletionCache(completion_cache_path), "replay")
+
     if not llama_stack_url:
         raise ValueError("LLAMA_STACK_URL is not set in the environment variables")
-
     client = LlamaStackClient(base_url=llama_stack_url)
+    check_model(client)
+    if completion_cache == "passthrough":
+        return client
+    return CachingClient(client, CompletionCache(completion_cache_path), completion_cache)
+
 
+def check_model(client: LlamaStackClient) -> None:
     models = client.models.list()
     if MODEL_ID not in [model.identifier for model in models]:
         raise ValueError(
             f"Model {MODEL_ID} not found in LlamaStack. Llama Stack Coding Agent only supports {MODEL_ID} at the moment."
         )
 
-    issue = Issue(issue_url)
-    print(
-        f"Issue {'#' + str(issue.issue_number)} in {f'{issue.owner}/{issue.repo}'}"
-    )
-    print()
 
-    response = requests.get(
-        f"https://api.github.com/repos/{issue.owner}/{issue.repo}/issues/{issue.issue_number}",
-        headers={"Authorization": f"Bearer {github_api_key}"},
+def solve_issue(
+    client: LlamaStackClient,
+    github_api_key: str,
+    issue_url: str,
+    sandbox_dir: Optional[str] = None,
+    stream: bool = False,
+    use_stop_sequences: bool = False,
+    max_context_tokens: int = CONTEXT_TOKEN_BUDGET,
+    clone_strategy: str = "full",
+    reference_repo: Optional[str] = None,
+    attempts: int = 1,
+    scorer: Optional[Scorer] = None,
+    issue_data: Optional[dict] = None,
+    index_cache: Optional[IndexCache] = None,
+) -> dict:
+    """
+    Synchronous wrapper around solve_issue_async. `client` may be a synchronous or an async client
+    """
+    return asyncio.run(
+        solve_issue_async(
+            as_async_client(client),
+            github_api_key,
+            issue_url,
+            sandbox_dir=sandbox_dir,
+            stream=stream,
+            use_stop_sequences=use_stop_sequences,
+            max_context_tokens=max_context_tokens,
+            clone_strategy=clone_strategy,
+            reference_repo=reference_repo,
+            attempts=attempts,
+            scorer=scorer,
+            issue_data=issue_data,
+            index_cache=index_cache,
+        )
     )
-    issue_data = response.json()
-    print(f"Title: {cyan(issue_data['title'])}")
-    print(f"Body: {magenta(issue_data['body'])}")
-    print()
 
+
+async def solve_issue_async(
+    client: AsyncLlamaStackClient,
+    github_api_key: str,
+    issue_url: str,
+    sandbox_dir: Optional[str] = None,
+    stream: bool = False,
+    use_stop_sequences: bool = False,
+    max_context_tokens: int = CONTEXT_TOKEN_BUDGET,
+    clone_strategy: str = "full",
+    reference_repo: Optional[str] = None,
+    attempts: int = 1,
+    scorer: Optional[Scorer] = None,
+    github: Optional[GitHubClient] = None,
+    issue_data: Optional[dict] = None,
+    index_cache: Optional[IndexCache] = None,
+) -> dict:
+    """
+    Run the agent on a single issue and open a PR with the result
+
+    Args:
+        client (AsyncLlamaStackClient): The async client to run inference with
+        github_api_key (str): The GitHub token to fetch the issue, push the branch and create the PR with
+        issue_url (str): The issue to solve
+        sandbox_dir (Optional[str]): The directory to clone the repo into. By default a worktree is taken
+            from the repo's WorktreePool instead, which is faster and safe to use from concurrent runs
+        clone_strategy (str): How to clone the repo the first time. One of CLONE_STRATEGIES
+        reference_repo (Optional[str]): Local clone of the repo to borrow objects from with the "reference" strategy
+        attempts (int): Number of attempts to run at once. The best one is submitted, see run_best_of_n_async
+        scorer (Optional[Scorer]): How to pick the best attempt. Defaults to syntax_scorer
+        github (Optional[GitHubClient]): The client to call the GitHub API with. Share one between
+            concurrent runs to reuse connections. Defaults to a new client for this run
+        issue_data (Optional[dict]): The issue's title and body if they were already fetched, e.g. by
+            llama_agent.ingest. Fetched from the API otherwise
+        index_cache (Optional[IndexCache]): Where to load and save the repo's indexes. Defaults to the
+            shared cache at INDEX_CACHE_PATH
+
+    Returns:
+        dict: The outcome of the run
+            - status: "changes_made" or "no_changes_made"
+            - pr_url: The url of the created PR
+            - branch: The branch that was pushed
+    """
+    if index_cache is None:
+        index_cache = IndexCache()
+    async with AsyncExitStack() as stack:
+        if github is None:
+            github = await stack.enter_async_context(
+                GitHubClient(github_api_key, cache=GitHubCache())
+            )
+
+        issue = Issue(issue_url)
+        print(
+            f"Issue {'#' + str(issue.issue_number)} in {f'{issue.owner}/{issue.repo}'}"
+        )
+        print()
+
+        if issue_data is None:
+            with span("fetch_issue"):
+                issue_data = await github.get_issue(issue.owner, issue.repo, issue.issue_number)
+        print(f"Title: {cyan(issue_data['title'])}")
+        print(f"Body: {magenta(issue_data['body'])}")
+        print()
+
+        # Cloning and checking out are mostly waiting on git, but the worktree pool's locks
+        # are blocking, so they run on a worker thread
+        with span("setup_repo", worktree=sandbox_dir is None):
+            if sandbox_dir is None:
+                print("Setting up worktree...")
+                pool = WorktreePool(
+                    issue.owner,
+                    issue.repo,
+                    clone_url(issue, github_api_key),
+                    clone_strategy=clone_strategy,
+                    reference=reference_repo,
+                )
+                acquired = pool.acquire()
+                worktree = await asyncio.to_thread(acquired.__enter__)
+                stack.push_async_callback(asyncio.to_thread, acquired.__exit__, None, None, None)
+                sandbox_dir = worktree.sandbox_dir
+                repo_path, default_branch = worktree.path, worktree.default_branch
+            else:
+                repo_path, default_branch = await asyncio.to_thread(
+                    setup_repo, issue, github_api_key, sandbox_dir, clone_strategy, reference_repo
+                )
+
+        # Run the agent
+        with span("agent", attempts=attempts):
+            agent_response = await run_agent_async(
+                client,
+                issue.repo,
+                issue_data["title"],
+                issue_data["body"],
+                stream=stream,
+                use_stop_sequences=use_stop_sequences,
+                context_budget=ContextBudget(max_tokens=max_context_tokens),
+                workspace=Workspace(sandbox_dir, index_cache=index_cache),
+                attempts=attempts,
+                scorer=scorer,
+            )
+
+        with span("submit", status=agent_response[0]):
+            return await submit_result_async(
+                github, issue, issue_data, repo_path, default_branch, agent_response
+            )
+
+
+def clone_url(issue: Issue, github_api_key: str) -> str:
+    """
+    The url to clone and push to. $GITHUB_GIT_URL points this at another host, e.g., a directory of local
+    bare repos named <owner>/<repo>.git for benchmarking without GitHub
+    """
+    git_url = os.getenv("GITHUB_GIT_URL")
+    if git_url:
+        return f"{git_url.rstrip('/')}/{issue.owner}/{issue.repo}.git"
+    return f"https://{github_api_key}@github.com/{issue.owner}/{issue.repo}.git"
+
+
+def setup_repo(
+    issue: Issue,
+    github_api_key: str,
+    sandbox_dir: str,
+    clone_strategy: str = "full",
+    reference_repo: Optional[str] = None,
+) -> Tuple[str, str]:
+    """
+    Clone the repo into the sandbox, or reset it to a clean checkout of the default branch if it already exists
+
+    Returns:
+        Tuple[str, str]: The path to the repo and the name of its default branch
+    """
     # Make sure the sandbox directory exists
-    os.makedirs(SANDBOX_DIR, exist_ok=True)
+    os.makedirs(sandbox_dir, exist_ok=True)
 
-    repo_path = os.path.join(SANDBOX_DIR, issue.repo)
+    repo_path = os.path.join(sandbox_dir, issue.repo)
 
     # git clone the repo
-    # Check if repo already exists and remove it if it does
     if not os.path.exists(repo_path):
-        print("Cloning repo...")
-        os.system(
-            f"cd sandbox && git clone https://{github_api_key}@github.com/{issue.owner}/{issue.repo}.git"
+        print(f"Cloning repo ({clone_strategy})...")
+        clone(
+            clone_url(issue, github_api_key),
+            repo_path,
+            strategy=clone_strategy,
+            reference=reference_repo,
         )
 
+        # A fresh clone is on the default branch
         cmd = run(
-            f"cd {repo_path} && git checkout -f {default_branch}",
+            f"cd {repo_path} && git symbolic-ref --short HEAD",
             shell=True,
             check=True,
             capture_output=True,
@@ -77,7 +304,7 @@ def main(issue_url: str):
 
         # If we have a different token, we need to update the remote url
         run(
-            f"cd {repo_path} && git remote set-url origin https://{github_api_key}@github.com/{issue.owner}/{issue.repo}.git",
+            f"cd {repo_path} && git remote set-url origin {clone_url(issue, github_api_key)}",
             shell=True,
             check=True,
             capture_output=True,
@@ -98,33 +325,37 @@ def main(issue_url: str):
             capture_output=True,
         )
 
-    # Run the agent
-    agent_response = run_agent(
-        client, issue.repo, issue_data["title"], issue_data["body"]
-    )
+    return repo_path, default_branch
+
 
+async def submit_result_async(
+    github: GitHubClient,
+    issue: Issue,
+    issue_data: dict,
+    repo_path: str,
+    default_branch: str,
+    agent_response: tuple,
+) -> dict:
+    """Push a branch with the agent's changes and open a PR for it"""
     branch_name = f"llama-agent-{issue.issue_number}-{int(time.time())}"
 
     changes_made = agent_response[0]
     if changes_made == "no_changes_made":
         reasoning = agent_response[1]
 
-        run(
-            f"cd {repo_path} && "
+        await run_shell(
             f"touch .keep && "
             f"git checkout -b {branch_name} && "
             f"git add . && "
             f"git commit -m 'Initial commit' && "
             f"git push origin {branch_name}",
-            shell=True,
+            cwd=repo_path,
             check=True,
-            capture_output=True,
         )
 
         # Create an issue comment explaining the reasoning
-        response = requests.post(
-            f"https://api.github.com/repos/{issue.owner}/{issue.repo}/pulls",
-            headers={"Authorization": f"Bearer {github_api_key}"},
+        response = await github.post(
+            f"/repos/{issue.owner}/{issue.repo}/pulls",
             json={
                 "title": f"Agent attempted to solve: #{issue.issue_number} - {issue_data['title']}",
                 "body": f"Agent attempted to resolve #{issue.issue_number}, but no changes were made. Here's it's explanation:\n\n{reasoning}",
@@ -134,35 +365,37 @@ def main(issue_url: str):
         )
 
         if response.status_code != 201:
-            raise ValueError(f"Failed to create PR: {response.json()}")
+            raise ValueError(f"Failed to create PR: {response_error(response)}")
 
         print()
         print(
             f"Agent attempted to solve the issue, but no changes were made. It's explanation is on the PR:\n\n"
             f"\t{yellow(response.json()['html_url'])}"
         )
+        return {
+            "status": changes_made,
+            "pr_url": response.json()["html_url"],
+            "branch": branch_name,
+        }
     else:
         pr_title = agent_response[1]
         pr_body = agent_response[2]
 
         # Commit changes and create a new branch
 
-        cmd = run(
-            f"cd {repo_path} && "
+        cmd = await run_shell(
             f"git checkout -b {branch_name} && "
             f"git add . && "
             f"git commit -m 'Testing new PR' && "
             f"git push origin {branch_name}",
-            shell=True,
-            capture_output=True,
+            cwd=repo_path,
         )
         if cmd.returncode != 0:
             raise ValueError(f"Failed to create new branch: {cmd.stderr.decode()}")
 
         # Create a new PR
-        response = requests.post(
-            f"https://api.github.com/repos/{issue.owner}/{issue.repo}/pulls",
-            headers={"Authorization": f"Bearer {github_api_key}"},
+        response = await github.post(
+            f"/repos/{issue.owner}/{issue.repo}/pulls",
             json={
                 "title": f"#{issue.issue_number} - {pr_title}",
                 "body": f"Resolves #{issue.issue_number}\n{pr_body}",
@@ -171,10 +404,15 @@ def main(issue_url: str):
             },
         )
         if response.status_code != 201:
-            raise ValueError(f"Failed to create new PR: {response.json()}")
+            raise ValueError(f"Failed to create new PR: {response_error(response)}")
 
         print()
         print(f"Created new PR: {green(response.json()['html_url'])}")
+        return {
+            "status": changes_made,
+            "pr_url": response.json()["html_url"],
+            "branch": branch_name,
+        }
 
 
 if __name__ == "__main__":
@@ -186,6 +424,92 @@ if __name__ == "__main__":
         required=True,
         help="The issue url to solve. E.g., https://github.com/aidando73/bitbucket-syntax-highlighting/issues/67",
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream completions and stop generating once the tool call is complete",
+    )
+    parser.add_argument(
+        "--stop-sequences",
+        action="store_true",
+        help="When streaming, also send </tool> as a stop sequence. Requires server support",
+    )
+    parser.add_argument(
+        "--max-context-tokens",
+        type=int,
+        default=CONTEXT_TOKEN_BUDGET,
+        help="Prompt token budget. Old tool results are compacted once the prompt goes over it",
+    )
+    parser.add_argument(
+        "--no-worktrees",
+        action="store_true",
+        help=f"Clone the repo directly into {SANDBOX_DIR} instead of using a worktree of a shared mirror",
+    )
+    parser.add_argument(
+        "--clone-strategy",
+        choices=CLONE_STRATEGIES,
+        default="full",
+        help="How to clone a repo the first time. shallow and blobless skip history the agent doesn't need",
+    )
+    parser.add_argument(
+        "--reference-repo",
+        type=str,
+        help="Local clone of the repo to borrow objects from. Used by --clone-strategy reference",
+    )
+    parser.add_argument(
+        "--completion-cache",
+        choices=COMPLETION_CACHE_MODES,
+        default="passthrough",
+        help="record saves every completion, replay answers only from saved completions without an inference server",
+    )
+    parser.add_argument(
+        "--completion-cache-path",
+        type=str,
+        default=COMPLETION_CACHE_PATH,
+        help="The completion cache database",
+    )
+    parser.add_argument(
+        "--attempts",
+        type=int,
+        default=1,
+        help="Run this many attempts at once, each at a different temperature, and submit the best one",
+    )
+    parser.add_argument(
+        "--scorer",
+        choices=SCORERS,
+        default="syntax",
+        help="How to pick the best attempt. diff: any changes, syntax: changes and the changed Python files parse",
+    )
+    parser.add_argument(
+        "--test-command",
+        type=str,
+        help="Score attempts by running this shell command in the repo instead, e.g. 'python -m pytest -x -q'",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="Write a span for every inference request, tool call and git command to a JSONL file in sandbox/traces",
+    )
+    parser.add_argument(
+        "--trace-summary",
+        action="store_true",
+        help="Print a table of where the time, tokens and bytes went at the end of the run",
+    )
     args = parser.parse_args()
 
-    main(issue_url=args.issue_url)
+    main(
+        issue_url=args.issue_url,
+        stream=args.stream,
+        use_stop_sequences=args.stop_sequences,
+        max_context_tokens=args.max_context_tokens,
+        use_worktrees=not args.no_worktrees,
+        clone_strategy=args.clone_strategy,
+        reference_repo=args.reference_repo,
+        completion_cache=args.completion_cache,
+        completion_cache_path=args.completion_cache_path,
+        attempts=args.attempts,
+        scorer=args.scorer,
+        test_command=args.test_command,
+        trace=args.trace,
+        trace_summary=args.trace_summary,
+    )
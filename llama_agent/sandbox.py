@@ -0,0 +1,268 @@
+import fcntl
+import os
+from contextlib import ExitStack, contextmanager
+from typing import Iterator, Optional
+from llama_agent import SANDBOX_DIR
+from llama_agent.tracing import run
+
+# One bare repo per GitHub repo, fetched incrementally
+MIRRORS_DIR = os.path.join(SANDBOX_DIR, "mirrors")
+# Pre-created worktrees of each mirror, handed out to one run at a time
+WORKTREES_DIR = os.path.join(SANDBOX_DIR, "worktrees")
+
+# How to clone a repo for the first time. The agent only reads the working tree, so it rarely needs full history
+#   full:      every commit and blob
+#   shallow:   only the latest commit (--depth 1)
+#   blobless:  every commit, but blobs are only downloaded when they are checked out (--filter=blob:none)
+#   reference: borrow objects from a local clone of the same repo (--reference), only download what it is missing
+CLONE_STRATEGIES = ("full", "shallow", "blobless", "reference")
+
+
+def git(*args: str, cwd: Optional[str] = None) -> str:
+    cmd = run(["git", *args], cwd=cwd, capture_output=True, text=True)
+    if cmd.returncode != 0:
+        raise RuntimeError(f"git {' '.join(args)} failed: {cmd.stderr.strip()}")
+    return cmd.stdout.strip()
+
+
+def clone_args(strategy: str = "full", reference: Optional[str] = None) -> list[str]:
+    """The extra `git clone` arguments for a clone strategy"""
+    if strategy == "full":
+        return []
+    elif strategy == "shallow":
+        return ["--depth", "1", "--no-single-branch"]
+    elif strategy == "blobless":
+        return ["--filter=blob:none"]
+    elif strategy == "reference":
+        if not reference:
+            raise ValueError("The reference clone strategy needs a local repo to reference")
+        return ["--reference", reference]
+    raise ValueError(
+        f"Unknown clone strategy: {strategy}. Expected one of {', '.join(CLONE_STRATEGIES)}"
+    )
+
+
+def clone(
+    remote_url: str,
+    path: str,
+    strategy: str = "full",
+    reference: Optional[str] = None,
+    bare: bool = False,
+) -> None:
+    """
+    Clone `remote_url` into `path` using one of CLONE_STRATEGIES.
+    Note that git ignores --depth and --filter for plain local paths. Use a file:// url for local remotes.
+    """
+    git("clone", *(["--bare"] if bare else []), *clone_args(strategy, reference), remote_url, path)
+
+
+@contextmanager
+def file_lock(path: str, blocking: bool = True) -> Iterator[bool]:
+    """
+    Exclusive lock on `path` that also works across processes (e.g., batch workers).
+    Yields False if `blocking` is False and someone else holds the lock.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+class Mirror:
+    """
+    A bare clone of a remote repo. Fetches only download new objects,
+    and worktrees created from it share its object store so they cost no extra clone.
+    """
+
+    owner: str
+    repo: str
+    path: str
+    clone_strategy: str
+    reference: Optional[str]
+
+    def __init__(
+        self,
+        owner: str,
+        repo: str,
+        mirrors_dir: str = MIRRORS_DIR,
+        clone_strategy: str = "full",
+        reference: Optional[str] = None,
+    ):
+        self.owner = owner
+        self.repo = repo
+        self.path = os.path.join(mirrors_dir, owner, f"{repo}.git")
+        self.clone_strategy = clone_strategy
+        self.reference = reference
+
+    @property
+    def lock_path(self) -> str:
+        return self.path + ".lock"
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.path, "HEAD"))
+
+    def update(self, remote_url: str) -> None:
+        """Clone the mirror if it doesn't exist yet, otherwise fetch whatever is new. Caller must hold the lock"""
+        if not self.exists():
+            clone(
+                remote_url,
+                self.path,
+                strategy=self.clone_strategy,
+                reference=self.reference,
+                bare=True,
+            )
+            # Bare clones don't set up remote-tracking branches. We want them so that branches
+            # the agent creates in worktrees never collide with the remote's branches
+            git(
+                "config",
+                "remote.origin.fetch",
+                "+refs/heads/*:refs/remotes/origin/*",
+                cwd=self.path,
+            )
+        else:
+            # The token in the url may have changed since the mirror was created
+            git("remote", "set-url", "origin", remote_url, cwd=self.path)
+        # Keep shallow mirrors shallow, otherwise the first fetch would download the whole history
+        depth = ["--depth", "1"] if self.is_shallow() else []
+        git("fetch", "--prune", *depth, "origin", cwd=self.path)
+
+    def is_shallow(self) -> bool:
+        return git("rev-parse", "--is-shallow-repository", cwd=self.path) == "true"
+
+    def default_branch(self) -> str:
+        # HEAD of a bare clone points at the remote's default branch
+        return git("symbolic-ref", "--short", "HEAD", cwd=self.path)
+
+
+class Worktree:
+    """
+    A checkout handed out by a WorktreePool. The repo is checked out at `sandbox_dir/<repo>`,
+    so `sandbox_dir` can be used as the agent's Workspace.
+    """
+
+    sandbox_dir: str
+    path: str
+    default_branch: str
+    commit: str
+
+    def __init__(self, sandbox_dir: str, path: str, default_branch: str, commit: str):
+        self.sandbox_dir = sandbox_dir
+        self.path = path
+        self.default_branch = default_branch
+        self.commit = commit
+
+
+class WorktreePool:
+    """
+    Hands out clean git worktrees of one repo, backed by a shared bare mirror.
+
+    The first acquire clones the mirror. Later acquires only fetch new commits and reset a free worktree,
+    which takes seconds instead of re-cloning or re-checking out the whole tree. Worktrees are recycled when released.
+    A worktree is in use while its lock file is held, so pools in different processes can share the same worktrees.
+    """
+
+    mirror: Mirror
+    remote_url: str
+    root: str
+
+    def __init__(
+        self,
+        owner: str,
+        repo: str,
+        remote_url: str,
+        mirrors_dir: str = MIRRORS_DIR,
+        worktrees_dir: str = WORKTREES_DIR,
+        clone_strategy: str = "full",
+        reference: Optional[str] = None,
+    ):
+        """
+        Args:
+            owner (str): The owner of the GitHub repo
+            repo (str): The name of the GitHub repo
+            remote_url (str): The url to clone and fetch from
+            clone_strategy (str): How to clone the mirror the first time. One of CLONE_STRATEGIES
+            reference (Optional[str]): Local repo to borrow objects from with the "reference" strategy
+        """
+        self.mirror = Mirror(owner, repo, mirrors_dir, clone_strategy, reference)
+        self.remote_url = remote_url
+        self.root = os.path.join(worktrees_dir, f"{owner}__{repo}")
+
+    @contextmanager
+    def acquire(self, fetch: bool = True) -> Iterator[Worktree]:
+        """
+        Check out a clean worktree at the tip of the remote's default branch, and recycle it afterwards
+
+        Args:
+            fetch (bool): Fetch new commits from the remote first
+        """
+        os.makedirs(os.path.dirname(self.mirror.path), exist_ok=True)
+        os.makedirs(self.root, exist_ok=True)
+
+        with file_lock(self.mirror.lock_path):
+            if fetch or not self.mirror.exists():
+                self.mirror.update(self.remote_url)
+            default_branch = self.mirror.default_branch()
+            commit = git(
+                "rev-parse", f"refs/remotes/origin/{default_branch}", cwd=self.mirror.path
+            )
+
+        for slot in self.slots():
+            with file_lock(self.lock_path(slot), blocking=False) as locked:
+                if not locked:
+                    continue
+                if not os.path.exists(self.worktree_path(slot)):
+                    self.create(slot, commit)
+                else:
+                    self.reset(slot, commit)
+                yield Worktree(
+                    self.slot_dir(slot), self.worktree_path(slot), default_branch, commit
+                )
+                return
+
+        # Every existing worktree is in use, so add another one
+        with ExitStack() as stack:
+            with file_lock(self.mirror.lock_path):
+                slot = max(self.slots(), default=-1) + 1
+                os.makedirs(self.slot_dir(slot))
+                # Claim the slot before anyone else can see it's free
+                stack.enter_context(file_lock(self.lock_path(slot)))
+            self.create(slot, commit)
+            yield Worktree(
+                self.slot_dir(slot), self.worktree_path(slot), default_branch, commit
+            )
+
+    def slots(self) -> list[int]:
+        return sorted(int(name) for name in os.listdir(self.root) if name.isdigit())
+
+    def slot_dir(self, slot: int) -> str:
+        return os.path.join(self.root, str(slot))
+
+    def lock_path(self, slot: int) -> str:
+        return os.path.join(self.root, f"{slot}.lock")
+
+    def worktree_path(self, slot: int) -> str:
+        return os.path.join(self.slot_dir(slot), self.mirror.repo)
+
+    def create(self, slot: int, commit: str) -> None:
+        with file_lock(self.mirror.lock_path):
+            # Clean up after a worktree that was deleted by hand
+            git("worktree", "prune", cwd=self.mirror.path)
+            git(
+                "worktree", "add", "--force", "--detach", self.worktree_path(slot), commit,
+                cwd=self.mirror.path,
+            )
+
+    def reset(self, slot: int, commit: str) -> None:
+        """Throw away everything the last run did. Only touches files that differ from `commit`"""
+        path = self.worktree_path(slot)
+        git("checkout", "--force", "--detach", commit, cwd=path)
+        git("clean", "-fdx", cwd=path)
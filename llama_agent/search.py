@@ -0,0 +1,229 @@
+import os
+import re
+from typing import Iterable, List, Optional, Tuple
+from llama_agent.file_view import SNIFF_BYTES
+from llama_agent.utils.file_tree import iter_git_ls_files
+
+try:
+    import re._parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+# Files bigger than this are usually generated or data, so they aren't searched
+SEARCH_MAX_FILE_BYTES = 1024 * 1024
+SEARCH_PAGE_SIZE = 50
+# Long lines (e.g., minified code) are cut in results
+SEARCH_MAX_LINE_CHARS = 200
+
+Trigram = Tuple[int, int, int]
+NON_ASCII = re.compile(r"[^\x00-\x7f]+")
+
+
+def trigrams(data: bytes) -> set[Trigram]:
+    """The case-insensitive trigrams of `data`. Only ASCII is case folded, the same for files and queries"""
+    data = data.lower()
+    return set(zip(data, data[1:], data[2:]))
+
+
+class SearchMatch:
+    path: str
+    line_number: int
+    line: str
+
+    def __init__(self, path: str, line_number: int, line: str):
+        self.path = path
+        self.line_number = line_number
+        self.line = line
+
+    def __str__(self):
+        line = self.line.strip()
+        if len(line) > SEARCH_MAX_LINE_CHARS:
+            line = line[:SEARCH_MAX_LINE_CHARS] + "..."
+        return f"{self.path}:{self.line_number}: {line}"
+
+    def __repr__(self):
+        return f"SearchMatch({self.path!r}, {self.line_number}, {self.line!r})"
+
+    def __eq__(self, other):
+        return (self.path, self.line_number, self.line) == (other.path, other.line_number, other.line)
+
+
+class TrigramIndex:
+    """
+    An inverted index from every trigram to the files that contain it, over the files tracked at HEAD.
+
+    A query is narrowed down to the files that contain every trigram of the literal text it needs,
+    then only those files are read and matched. The index only ever has false positives, never false negatives,
+    so files updated with update_file() just get a new id and their old postings are ignored.
+    """
+
+    # Bump when the format changes, so cached copies are rebuilt
+    CACHE_VERSION = 1
+
+    path: str
+    max_file_bytes: int
+
+    def __init__(self, path: str, files: Iterable[str], max_file_bytes: int = SEARCH_MAX_FILE_BYTES):
+        self.path = path
+        self.max_file_bytes = max_file_bytes
+        # File id -> path relative to the repo. None once a file is updated and gets a new id
+        self._files: List[Optional[str]] = []
+        self._ids: dict[str, int] = {}
+        self._postings: dict[Trigram, List[int]] = {}
+        for file in files:
+            self.update_file(file)
+
+    @classmethod
+    def from_repo(cls, path: str, max_file_bytes: int = SEARCH_MAX_FILE_BYTES) -> "TrigramIndex":
+        return cls(path, iter_git_ls_files(path), max_file_bytes)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def update_file(self, file: str) -> None:
+        """(Re-)index a file, e.g., after the agent edits it. `file` is relative to the repo root"""
+        old_id = self._ids.pop(file, None)
+        if old_id is not None:
+            self._files[old_id] = None
+
+        data = self._read(file)
+        if data is None:
+            return
+        file_id = len(self._files)
+        self._files.append(file)
+        self._ids[file] = file_id
+        for trigram in trigrams(data):
+            postings = self._postings.get(trigram)
+            if postings is None:
+                self._postings[trigram] = [file_id]
+            else:
+                postings.append(file_id)
+
+    def candidates(self, required: Iterable[str], path_prefix: str = "") -> List[str]:
+        """The indexed files under `path_prefix` that may contain all of the `required` strings, sorted by path"""
+        query_trigrams = set()
+        for literal in required:
+            query_trigrams |= trigrams(literal.encode())
+
+        if query_trigrams:
+            postings = []
+            for trigram in query_trigrams:
+                ids = self._postings.get(trigram)
+                if not ids:
+                    return []
+                postings.append(ids)
+            postings.sort(key=len)
+            ids = set(postings[0])
+            for other in postings[1:]:
+                ids.intersection_update(other)
+                if not ids:
+                    return []
+            files = [self._files[i] for i in ids]
+        else:
+            files = list(self._files)
+
+        prefix = path_prefix.strip("/")
+        return sorted(
+            file
+            for file in files
+            if file is not None
+            and (not prefix or file == prefix or file.startswith(prefix + "/"))
+        )
+
+    def search(
+        self,
+        query: str,
+        regex: bool = False,
+        case_sensitive: bool = True,
+        path_prefix: str = "",
+        limit: int = SEARCH_PAGE_SIZE,
+        offset: int = 0,
+    ) -> Tuple[List[SearchMatch], bool]:
+        """
+        Find the lines that match `query`
+
+        Args:
+            query (str): A literal string, or a Python regex if `regex` is True
+            path_prefix (str): Only search files under this directory, relative to the repo root
+            limit (int): The maximum number of matches to return
+            offset (int): The number of matches to skip, for paging
+
+        Raises:
+            re.error: If `query` is not a valid regex
+
+        Returns:
+            Tuple[List[SearchMatch], bool]: The matches, one per line, and whether there are more after them
+        """
+        flags = re.MULTILINE | (0 if case_sensitive else re.IGNORECASE)
+        if regex:
+            pattern = re.compile(query, flags)
+            required = required_literals(query, flags)
+        else:
+            pattern = re.compile(re.escape(query), flags)
+            # Only ASCII is case folded the same way by the index and by re.IGNORECASE, see required_literals
+            required = [query] if case_sensitive else [run for run in NON_ASCII.split(query) if run]
+
+        matches = []
+        for file in self.candidates(required, path_prefix):
+            data = self._read(file)
+            if data is None:
+                continue
+            text = data.decode("utf-8", errors="replace")
+            line_number = 1
+            last_pos = 0
+            last_line = 0
+            for match in pattern.finditer(text):
+                line_number += text.count("\n", last_pos, match.start())
+                last_pos = match.start()
+                if line_number == last_line:
+                    continue
+                last_line = line_number
+                line_start = text.rfind("\n", 0, match.start()) + 1
+                line_end = text.find("\n", match.start())
+                matches.append(
+                    SearchMatch(file, line_number, text[line_start : line_end if line_end != -1 else len(text)])
+                )
+                # One extra to know if there is another page
+                if len(matches) > offset + limit:
+                    return matches[offset : offset + limit], True
+        return matches[offset : offset + limit], False
+
+    def _read(self, file: str) -> Optional[bytes]:
+        """The content of a searchable file, None for missing, big or binary files"""
+        path = os.path.join(self.path, file)
+        try:
+            if os.path.getsize(path) > self.max_file_bytes:
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if b"\0" in data[:SNIFF_BYTES]:
+            return None
+        return data
+
+
+def required_literals(pattern: str, flags: int = 0) -> List[str]:
+    """
+    Literal strings that every match of the regex `pattern` must contain, so the index can narrow the search.
+    Only looks at the top level of the pattern, e.g., `def \\w+_view\\(` needs "def " and "_view(".
+    An empty list means nothing is required and every file has to be searched.
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except re.error:
+        return []
+
+    literals = []
+    current = []
+    for op, value in parsed:
+        # Only ASCII is case folded the same way by the index and by re.IGNORECASE
+        if op is sre_parse.LITERAL and value < 128:
+            current.append(chr(value))
+            continue
+        if current:
+            literals.append("".join(current))
+            current = []
+    if current:
+        literals.append("".join(current))
+    return [literal for literal in literals if len(literal) >= 3]
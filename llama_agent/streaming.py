@@ -0,0 +1,206 @@
+import time
+from typing import Any, Optional
+from llama_stack_client import LlamaStackClient
+from llama_agent.aio import close_stream
+
+TOOL_CALL_START = "<tool>"
+TOOL_CALL_END = "</tool>"
+
+
+class StreamedCompletion:
+    content: str
+    # True if we stopped reading the stream ourselves once the tool block was complete
+    stopped_early: bool
+    # Seconds from sending the request until the first non-empty chunk arrived
+    time_to_first_token: Optional[float]
+    # Seconds from sending the request until a complete <tool>...</tool> block arrived
+    time_to_tool_call: Optional[float]
+    total_time: float
+
+    def __init__(
+        self,
+        content: str,
+        stopped_early: bool,
+        time_to_first_token: Optional[float],
+        time_to_tool_call: Optional[float],
+        total_time: float,
+    ):
+        self.content = content
+        self.stopped_early = stopped_early
+        self.time_to_first_token = time_to_first_token
+        self.time_to_tool_call = time_to_tool_call
+        self.total_time = total_time
+
+    def timings(self) -> str:
+        """Human readable summary of the timings for this completion"""
+        return (
+            f"time to first token: {format_seconds(self.time_to_first_token)}, "
+            f"time to tool call: {format_seconds(self.time_to_tool_call)}, "
+            f"total: {format_seconds(self.total_time)}"
+            + (" (stopped early)" if self.stopped_early else "")
+        )
+
+
+def stream_completion(
+    client: LlamaStackClient,
+    model_id: str,
+    content: str,
+    stop_at_tool_call: bool = True,
+    use_stop_sequences: bool = False,
+    sampling_params: Optional[dict[str, Any]] = None,
+) -> StreamedCompletion:
+    """
+    Stream a completion and stop reading as soon as a complete <tool>[...]</tool> block has arrived.
+    Closing the stream drops the connection, so the server stops generating tokens we would discard anyway.
+
+    Args:
+        client (LlamaStackClient): The client to run inference with
+        model_id (str): The model to use
+        content (str): The raw prompt
+        stop_at_tool_call (bool): Stop reading once the first tool block is closed
+        use_stop_sequences (bool): Also pass </tool> as a stop sequence to the server.
+            Not every Llama Stack distribution supports stop sequences, so this is opt-in.
+        sampling_params (Optional[dict[str, Any]]): Sampling params to pass through to the server
+
+    Returns:
+        StreamedCompletion: The content (truncated right after </tool> if we stopped early) and timings
+    """
+    kwargs = completion_kwargs(use_stop_sequences, sampling_params)
+    start = time.perf_counter()
+    stream = client.inference.completion(
+        model_id=model_id,
+        content=content,
+        stream=True,
+        **kwargs,
+    )
+
+    reader = ToolCallReader(start, stop_at_tool_call)
+    try:
+        for chunk in stream:
+            if reader.add(chunk_text(chunk)):
+                break
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+    return reader.finish(use_stop_sequences)
+
+
+async def stream_completion_async(
+    client: Any,
+    model_id: str,
+    content: str,
+    stop_at_tool_call: bool = True,
+    use_stop_sequences: bool = False,
+    sampling_params: Optional[dict[str, Any]] = None,
+) -> StreamedCompletion:
+    """
+    Same as stream_completion, for an async client (e.g., AsyncLlamaStackClient or llama_agent.aio.ThreadedClient).
+    Waiting for chunks yields to the event loop, so other agents keep running in the meantime
+    """
+    kwargs = completion_kwargs(use_stop_sequences, sampling_params)
+    start = time.perf_counter()
+    stream = await client.inference.completion(
+        model_id=model_id,
+        content=content,
+        stream=True,
+        **kwargs,
+    )
+
+    reader = ToolCallReader(start, stop_at_tool_call)
+    try:
+        async for chunk in stream:
+            if reader.add(chunk_text(chunk)):
+                break
+    finally:
+        await close_stream(stream)
+    return reader.finish(use_stop_sequences)
+
+
+def completion_kwargs(
+    use_stop_sequences: bool, sampling_params: Optional[dict[str, Any]]
+) -> dict[str, Any]:
+    if use_stop_sequences:
+        sampling_params = {
+            "strategy": {"type": "greedy"},
+            **(sampling_params or {}),
+            "stop": [TOOL_CALL_END],
+        }
+
+    kwargs = {}
+    if sampling_params:
+        kwargs["sampling_params"] = sampling_params
+    return kwargs
+
+
+class ToolCallReader:
+    """Accumulates streamed text and spots the end of the first complete <tool>...</tool> block"""
+
+    def __init__(self, start: float, stop_at_tool_call: bool = True):
+        self.start = start
+        self.stop_at_tool_call = stop_at_tool_call
+        self.text = ""
+        self.time_to_first_token = None
+        self.time_to_tool_call = None
+        self.stopped_early = False
+
+    def add(self, delta: str) -> bool:
+        """Add a chunk of text. Returns True once we should stop reading"""
+        if not delta:
+            return False
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.perf_counter() - self.start
+
+        # Only search the new text (plus enough of the old text to catch a tag split across chunks)
+        search_from = max(0, len(self.text) - len(TOOL_CALL_END) + 1)
+        self.text += delta
+
+        if not self.stop_at_tool_call:
+            return False
+        end = self.text.find(TOOL_CALL_END, search_from)
+        if end != -1 and TOOL_CALL_START in self.text[:end]:
+            self.time_to_tool_call = time.perf_counter() - self.start
+            self.text = self.text[: end + len(TOOL_CALL_END)]
+            self.stopped_early = True
+            return True
+        return False
+
+    def finish(self, use_stop_sequences: bool = False) -> StreamedCompletion:
+        # The server strips the stop sequence, so put it back to keep the tool block parseable
+        if (
+            use_stop_sequences
+            and not self.stopped_early
+            and self.text.rfind(TOOL_CALL_START) > self.text.rfind(TOOL_CALL_END)
+        ):
+            self.text += TOOL_CALL_END
+            self.time_to_tool_call = time.perf_counter() - self.start
+
+        return StreamedCompletion(
+            content=self.text,
+            stopped_early=self.stopped_early,
+            time_to_first_token=self.time_to_first_token,
+            time_to_tool_call=self.time_to_tool_call,
+            total_time=time.perf_counter() - self.start,
+        )
+
+
+def chunk_text(chunk: Any) -> str:
+    """
+    Get the text out of a streamed completion chunk.
+    Llama Stack sends `delta` for completion chunks, but fall back to `content` for servers that send whole responses
+    """
+    delta = getattr(chunk, "delta", None)
+    if delta is None:
+        delta = getattr(chunk, "content", None)
+    if delta is None:
+        return ""
+    if isinstance(delta, str):
+        return delta
+    # Chat style deltas are objects with a text field
+    return getattr(delta, "text", "") or ""
+
+
+def format_seconds(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "n/a"
+    return f"{seconds:.2f}s"
@@ -0,0 +1,258 @@
+import ast
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+from llama_agent.utils.file_tree import iter_git_ls_files
+
+# Most results find_definition and find_references show at once
+SYMBOL_RESULTS_LIMIT = 100
+# Below this many files, starting worker processes costs more than it saves
+PARALLEL_PARSE_MIN_FILES = 200
+PARSE_CHUNK_SIZE = 50
+# The index is built on tool worker threads while other threads hold locks, and forking a multithreaded
+# process can deadlock the child on a lock it copied. A fork server is forked once, from a single thread
+PARSE_START_METHOD = "forkserver"
+
+
+class Symbol:
+    """A definition of, or reference to, a name at a line of a file"""
+
+    # Big repos have millions of references
+    __slots__ = ("name", "path", "line_number", "kind")
+
+    name: str
+    path: str
+    line_number: int
+    kind: str
+
+    def __init__(self, name: str, path: str, line_number: int, kind: str):
+        """
+        Args:
+            name (str): The qualified name for definitions, e.g. `app.models.User.save`. The name as written for references
+            path (str): The file, relative to the repo root
+            kind (str): class, function or variable for definitions. reference for references
+        """
+        self.name = name
+        self.path = path
+        self.line_number = line_number
+        self.kind = kind
+
+    def __repr__(self):
+        return f"Symbol({self.name!r}, {self.path!r}, {self.line_number}, {self.kind!r})"
+
+    def __eq__(self, other):
+        return (self.name, self.path, self.line_number, self.kind) == (
+            other.name, other.path, other.line_number, other.kind
+        )
+
+
+def module_name(path: str) -> str:
+    """The dotted module name of a Python file, e.g. app/models/__init__.py -> app.models"""
+    parts = path[: -len(".py")].split("/")
+    if parts[-1] == "__init__" and len(parts) > 1:
+        parts.pop()
+    return ".".join(parts)
+
+
+class SymbolVisitor(ast.NodeVisitor):
+    """Collects the definitions and references in one module"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.scope = [module_name(path)]
+        # The kind of each scope in self.scope after the module, class or function
+        self.scope_kinds: List[str] = []
+        self.definitions: List[Symbol] = []
+        self.references: List[Symbol] = []
+
+    def define(self, name: str, line_number: int, kind: str) -> None:
+        self.definitions.append(Symbol(".".join(self.scope + [name]), self.path, line_number, kind))
+
+    def reference(self, name: str, line_number: int) -> None:
+        self.references.append(Symbol(name, self.path, line_number, "reference"))
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> None:
+        self.define(node.name, node.lineno, "class")
+        self.visit_scope(node, "class")
+
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
+        self.define(node.name, node.lineno, "function")
+        self.visit_scope(node, "function")
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_scope(self, node, kind: str) -> None:
+        # Decorators, bases and defaults are evaluated in the enclosing scope
+        for child in node.decorator_list:
+            self.visit(child)
+        for child in getattr(node, "bases", []) + getattr(node, "keywords", []):
+            self.visit(child)
+        if hasattr(node, "args"):
+            self.visit(node.args)
+        if getattr(node, "returns", None):
+            self.visit(node.returns)
+        self.scope.append(node.name)
+        self.scope_kinds.append(kind)
+        for child in node.body:
+            self.visit(child)
+        self.scope_kinds.pop()
+        self.scope.pop()
+
+    def visit_Assign(self, node: ast.Assign) -> None:
+        # Module and class attributes, not local variables
+        if not self.in_function():
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    self.define(target.id, node.lineno, "variable")
+        self.generic_visit(node)
+
+    def visit_AnnAssign(self, node: ast.AnnAssign) -> None:
+        if not self.in_function() and isinstance(node.target, ast.Name):
+            self.define(node.target.id, node.lineno, "variable")
+        self.generic_visit(node)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+        for alias in node.names:
+            if alias.name != "*":
+                self.reference(alias.name, node.lineno)
+
+    def visit_Name(self, node: ast.Name) -> None:
+        if isinstance(node.ctx, ast.Load):
+            self.reference(node.id, node.lineno)
+
+    def visit_Attribute(self, node: ast.Attribute) -> None:
+        if isinstance(node.ctx, ast.Load):
+            self.reference(node.attr, node.lineno)
+        self.generic_visit(node)
+
+    def in_function(self) -> bool:
+        return "function" in self.scope_kinds
+
+
+def parse_symbols(path: str, source: str) -> Tuple[List[Symbol], List[Symbol]]:
+    """
+    The definitions and references in a Python module
+
+    Raises:
+        SyntaxError: If the module can't be parsed
+    """
+    visitor = SymbolVisitor(path)
+    visitor.visit(ast.parse(source, filename=path))
+    return visitor.definitions, visitor.references
+
+
+def parse_file(repo_path: str, path: str) -> Tuple[str, List[Symbol], List[Symbol]]:
+    """parse_symbols for a file in a repo, run in worker processes. Files that can't be read or parsed have no symbols"""
+    try:
+        with open(os.path.join(repo_path, path), "rb") as f:
+            definitions, references = parse_symbols(path, f.read())
+    except (OSError, SyntaxError, ValueError):
+        return path, [], []
+    return path, definitions, references
+
+
+class SymbolIndex:
+    """
+    Where every class, function and module or class attribute of a Python repo is defined, and where names are used.
+
+    Definitions are looked up by qualified name, or any dotted suffix of it, e.g. `User.save` finds `app.models.User.save`.
+    References aren't resolved (that would need type inference), so they are every use of the last part of the name.
+    """
+
+    # Bump when the format changes, so cached copies are rebuilt
+    CACHE_VERSION = 1
+
+    path: str
+
+    def __init__(self, path: str, parsed: Iterable[Tuple[str, List[Symbol], List[Symbol]]]):
+        self.path = path
+        # Last part of the name -> file -> symbols, so a file's symbols can be replaced when it changes
+        self._definitions: dict[str, dict[str, List[Symbol]]] = {}
+        self._references: dict[str, dict[str, List[Symbol]]] = {}
+        # File -> the names it has definitions and references for
+        self._files: dict[str, Tuple[set[str], set[str]]] = {}
+        for file, definitions, references in parsed:
+            self._add(file, definitions, references)
+
+    @classmethod
+    def from_repo(cls, path: str, workers: Optional[int] = None) -> "SymbolIndex":
+        """
+        Parse every Python file tracked at HEAD
+
+        Args:
+            workers (Optional[int]): Number of processes to parse with. Defaults to the number of CPUs
+        """
+        files = [file for file in iter_git_ls_files(path) if file.endswith(".py")]
+        if len(files) < PARALLEL_PARSE_MIN_FILES or workers == 1:
+            return cls(path, (parse_file(path, file) for file in files))
+
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context(PARSE_START_METHOD)
+        ) as executor:
+            return cls(
+                path,
+                executor.map(parse_file, [path] * len(files), files, chunksize=PARSE_CHUNK_SIZE),
+            )
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def update_file(self, file: str) -> None:
+        """Re-parse a file, e.g., after the agent edits it. `file` is relative to the repo root"""
+        self._remove(file)
+        if file.endswith(".py"):
+            self._add(*parse_file(self.path, file))
+
+    def find_definitions(self, name: str, path_prefix: str = "") -> List[Symbol]:
+        """Definitions whose qualified name is `name` or ends with `.<name>`, sorted by file and line"""
+        name = name.strip().strip(".")
+        by_file = self._definitions.get(name.rsplit(".", 1)[-1], {})
+        return sorted(
+            (
+                symbol
+                for file, symbols in by_file.items()
+                if in_directory(file, path_prefix)
+                for symbol in symbols
+                if symbol.name == name or symbol.name.endswith("." + name)
+            ),
+            key=lambda symbol: (symbol.path, symbol.line_number),
+        )
+
+    def find_references(self, name: str, path_prefix: str = "") -> List[Symbol]:
+        """Uses of the last part of `name`, one per line, sorted by file and line"""
+        by_file = self._references.get(name.strip().strip(".").rsplit(".", 1)[-1], {})
+        references = {}
+        for file, symbols in by_file.items():
+            if in_directory(file, path_prefix):
+                for symbol in symbols:
+                    references.setdefault((symbol.path, symbol.line_number), symbol)
+        return [references[key] for key in sorted(references)]
+
+    def _add(self, file: str, definitions: List[Symbol], references: List[Symbol]) -> None:
+        names = (set(), set())
+        for symbols, index, file_names in (
+            (definitions, self._definitions, names[0]),
+            (references, self._references, names[1]),
+        ):
+            for symbol in symbols:
+                key = symbol.name.rsplit(".", 1)[-1]
+                index.setdefault(key, {}).setdefault(file, []).append(symbol)
+                file_names.add(key)
+        self._files[file] = names
+
+    def _remove(self, file: str) -> None:
+        names = self._files.pop(file, None)
+        if names is None:
+            return
+        for index, file_names in ((self._definitions, names[0]), (self._references, names[1])):
+            for key in file_names:
+                by_file = index[key]
+                del by_file[file]
+                if not by_file:
+                    del index[key]
+
+
+def in_directory(file: str, directory: str) -> bool:
+    directory = directory.strip("/")
+    return not directory or file == directory or file.startswith(directory + "/")
@@ -0,0 +1,195 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from subprocess import CompletedProcess, run as subprocess_run
+from typing import Any, Iterator, Optional, TextIO
+from llama_agent import SANDBOX_DIR
+
+TRACES_DIR = os.path.join(SANDBOX_DIR, "traces")
+
+# The tracer of the run the current task or thread belongs to. None when tracing is off
+_tracer: ContextVar[Optional["Tracer"]] = ContextVar("tracer", default=None)
+# The innermost open span, the parent of any span started inside it
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    A timed operation, e.g., one inference request or tool call. Written to the trace when it ends.
+    Attributes hold what it did: token counts, bytes read and written, the command it ran
+    """
+
+    __slots__ = ("tracer", "name", "span_id", "parent_id", "start", "duration", "attributes", "_start_time")
+
+    recording = True
+
+    def __init__(self, tracer: "Tracer", name: str, parent: Optional["Span"], attributes: dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration = None
+        self._start_time = time.perf_counter()
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def add(self, name: str, amount: int) -> None:
+        """Add to a counter attribute, e.g., bytes_read"""
+        self.attributes[name] = self.attributes.get(name, 0) + amount
+
+    def end(self) -> None:
+        self.duration = time.perf_counter() - self._start_time
+        self.tracer.record(self)
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            **({"attributes": self.attributes} if self.attributes else {}),
+        }
+
+
+class NoopSpan:
+    """What span() gives when tracing is off. Setting attributes on it does nothing"""
+
+    recording = False
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def add(self, name: str, amount: int) -> None:
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class Tracer:
+    """
+    Collects the spans of one run and appends each to a JSONL file as it ends, so a crashed run still leaves its trace.
+    Spans may end on any thread
+    """
+
+    path: Optional[str]
+    spans: list[Span]
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.spans = []
+        self.lock = threading.Lock()
+        self.file: Optional[TextIO] = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.file = open(path, "w")
+
+    def record(self, span: Span) -> None:
+        line = json.dumps(span.to_json(), default=str)
+        with self.lock:
+            self.spans.append(span)
+            if self.file is not None:
+                self.file.write(line + "\n")
+                self.file.flush()
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def summary(self) -> str:
+        """A table of the time spent in each kind of span, and the tokens and bytes they used"""
+        rows = {}
+        for span in self.spans:
+            row = rows.setdefault(span.name, {"count": 0, "total": 0.0, "max": 0.0, "counters": {}})
+            row["count"] += 1
+            row["total"] += span.duration
+            row["max"] = max(row["max"], span.duration)
+            for name in ("prompt_tokens", "completion_tokens", "bytes_read", "bytes_written"):
+                if isinstance(span.attributes.get(name), int):
+                    row["counters"][name] = row["counters"].get(name, 0) + span.attributes[name]
+
+        lines = [f"{'span':<16}{'count':>7}{'total s':>10}{'mean s':>9}{'max s':>9}  totals"]
+        for name, row in sorted(rows.items(), key=lambda item: -item[1]["total"]):
+            totals = ", ".join(f"{counter}={value}" for counter, value in row["counters"].items())
+            lines.append(
+                f"{name:<16}{row['count']:>7}{row['total']:>10.2f}{row['total'] / row['count']:>9.3f}"
+                f"{row['max']:>9.2f}  {totals}"
+            )
+        return "\n".join(lines)
+
+
+@contextmanager
+def tracing(path: Optional[str] = None) -> Iterator[Tracer]:
+    """Trace everything run inside this block, and the tasks and threads it starts, to `path`"""
+    tracer = Tracer(path)
+    token = _tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _tracer.reset(token)
+        tracer.close()
+
+
+def trace_path(name: str, traces_dir: str = TRACES_DIR) -> str:
+    """A new trace file for a run, e.g., of an issue"""
+    return os.path.join(traces_dir, f"{name}__{time.strftime('%Y%m%d-%H%M%S')}.jsonl")
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Any]:
+    """
+    Time the block as a span of the current trace. Gives NOOP_SPAN when tracing is off,
+    so code can always call .set() on what it gets back
+    """
+    tracer = _tracer.get()
+    if tracer is None:
+        yield NOOP_SPAN
+        return
+
+    current = Span(tracer, name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set(error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def current_span() -> Any:
+    """The innermost open span, or NOOP_SPAN if there isn't one"""
+    if _tracer.get() is None:
+        return NOOP_SPAN
+    return _current_span.get() or NOOP_SPAN
+
+
+def redact(command: Any) -> str:
+    """A command as text for a span, without any credentials in urls (e.g., a token in a clone url)"""
+    text = command if isinstance(command, str) else " ".join(str(arg) for arg in command)
+    return re.sub(r"://[^/@\s]+@", "://***@", text)
+
+
+def run(args: Any, **kwargs: Any) -> CompletedProcess:
+    """subprocess.run in a "subprocess" span, with the command, its exit code and how much it printed"""
+    if _tracer.get() is None:
+        return subprocess_run(args, **kwargs)
+    with span("subprocess", command=redact(args)) as current:
+        cmd = subprocess_run(args, **kwargs)
+        if current.recording:
+            current.set(returncode=cmd.returncode)
+            for name, output in (("stdout_bytes", cmd.stdout), ("stderr_bytes", cmd.stderr)):
+                if output is not None:
+                    current.set(**{name: len(output)})
+        return cmd
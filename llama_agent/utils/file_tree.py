@@ -1,22 +1,38 @@
 import os
-from typing import List
-from subprocess import run
+from functools import partial
+from typing import Iterable, Iterator, List, Optional
+from subprocess import PIPE, Popen
+from llama_agent.tracing import span
+
+# How much of git's output to read at a time. The whole listing of a big repo can be hundreds of MB
+READ_CHUNK_SIZE = 1 << 16
+
 
 class Directory:
+    """
+    A node in the file tree trie. Children are looked up by name in O(1),
+    and __slots__ keeps nodes small since big repos have hundreds of thousands of them.
+    """
+
+    __slots__ = ("name", "files", "directories")
+
     name: str
     files: set[str]
-    directories: set["Directory"]
+    directories: dict[str, "Directory"]
 
     def __init__(self, name: str):
         self.name = name
         self.files = set()
-        self.directories = set()
+        self.directories = {}
 
     def add_file(self, file: str):
         self.files.add(file)
 
     def add_directory(self, directory: "Directory"):
-        self.directories.add(directory)
+        self.directories[directory.name] = directory
+
+    def get_directory(self, name: str) -> Optional["Directory"]:
+        return self.directories.get(name)
 
     def __str__(self):
         return f"{self.name} ({len(self.files)} files, {len(self.directories)} directories)"
@@ -24,12 +40,6 @@ class Directory:
     def __repr__(self):
         return f"{self.name} ({len(self.files)} files, {len(self.directories)} directories)"
 
-    def __eq__(self, other):
-        return self.name == other.name
-
-    def __hash__(self):
-        return hash(self.name)
-
 
 def list_files_in_repo(path: str, depth: int = 1) -> List[str]:
     """
@@ -47,50 +57,122 @@ def list_files_in_repo(path: str, depth: int = 1) -> List[str]:
     if os.path.isfile(path):
         return [path]
 
-    # We use git ls-tree to ignore any files like .git/
-    cmd = run(
-        f"cd {path} && git ls-tree -r --name-only HEAD",
-        shell=True,
-        text=True,
-        capture_output=True,
+    with span("list_files", depth=depth) as current:
+        files = FileIndex.from_repo(path).list(depth=depth)
+        current.set(files=len(files))
+        return files
+
+
+def git_ls_files(path: str) -> List[str]:
+    """All the files tracked at HEAD under `path`, relative to `path`"""
+    return list(iter_git_ls_files(path))
+
+
+def iter_git_ls_files(path: str) -> Iterator[str]:
+    """
+    Stream the files tracked at HEAD under `path`, relative to `path`, without holding git's whole output in memory
+    We use git ls-tree to ignore any files like .git/
+    """
+    # -z separates names with NUL and turns off quoting, so names with spaces, quotes or unicode come through as-is
+    process = Popen(
+        ["git", "ls-tree", "-r", "-z", "--name-only", "HEAD"],
+        cwd=path,
+        stdout=PIPE,
+        stderr=PIPE,
     )
-    files = cmd.stdout
-    if cmd.returncode != 0:
-        raise AssertionError(f"Failed to list files in repo: {cmd.stderr}")
+    with process:
+        yield from split_nul_stream(
+            iter(partial(process.stdout.read, READ_CHUNK_SIZE), b"")
+        )
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise AssertionError(
+                f"Failed to list files in repo: {stderr.decode(errors='replace')}"
+            )
+
+
+def split_nul_stream(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Split a stream of NUL separated names that arrives in arbitrary chunks"""
+    remainder = b""
+    for chunk in chunks:
+        names = (remainder + chunk).split(b"\0")
+        # The last name may continue in the next chunk
+        remainder = names.pop()
+        for name in names:
+            if name:
+                yield name.decode("utf-8", errors="surrogateescape")
+    if remainder:
+        yield remainder.decode("utf-8", errors="surrogateescape")
+
+
+class FileIndex:
+    """
+    The file tree of a repo at HEAD, read once with a single `git ls-tree`.
+    Answers listings of any directory at any depth without going back to git,
+    so an agent run can list directories as often as it likes.
+    """
+
+    # Bump when the format changes, so cached copies are rebuilt
+    CACHE_VERSION = 1
+
+    path: str
+    root: Directory
+
+    def __init__(self, path: str, files: Iterable[str]):
+        self.path = path
+        self.root = Directory(path)
+        for file in files:
+            self.add_file(file)
 
-    files = files.splitlines()
+    @classmethod
+    def from_repo(cls, path: str) -> "FileIndex":
+        return cls(path, iter_git_ls_files(path))
 
-    root = Directory(path)
-    for file in files:
-        # Sometimes git ls-tree returns files with quotes around them
-        # E.g., for files with spaces in their name
-        file = file.strip('"')
+    def add_file(self, file: str) -> None:
+        """Add a file, e.g., one the agent wrote. `file` is relative to the repo root. Adding an existing file is a no-op"""
         parts = file.split("/")
-        cur = root
-        for i in range(len(parts)):
-            if i + 1 > depth:
-                break
-            if i == len(parts) - 1:
-                cur.add_file(parts[i])
-            else:
-                if Directory(parts[i]) not in cur.directories:
-                    temp = Directory(parts[i])
-                    cur.add_directory(temp)
-                    cur = temp
-                else:
-                    cur = next(d for d in cur.directories if d.name == parts[i])
-    res = []
-
-    def dfs(directory: Directory, path=""):
-        # Recursively process subdirectories
-        for subdir in sorted(directory.directories, key=lambda x: x.name):
-            subdir_path = os.path.join(path, subdir.name)
-            res.append(subdir_path + "/")  # Add trailing slash for directories
-            dfs(subdir, subdir_path)
+        cur = self.root
+        for part in parts[:-1]:
+            directory = cur.directories.get(part)
+            if directory is None:
+                directory = cur.directories[part] = Directory(part)
+            cur = directory
+        cur.files.add(parts[-1])
+
+    def find_directory(self, path: str = "") -> Optional[Directory]:
+        """The directory at `path`, relative to the repo root. None if there are no files under it"""
+        cur = self.root
+        for part in path.split("/"):
+            if part in ("", "."):
+                continue
+            cur = cur.directories.get(part)
+            if cur is None:
+                return None
+        return cur
+
+    def list(self, path: str = "", depth: int = 1) -> List[str]:
+        """
+        Same output as list_files_in_repo(os.path.join(self.path, path), depth)
+        Paths are relative to `path`
+        """
+        directory = self.find_directory(path)
+        if directory is None:
+            return []
+
+        res = []
+
+        def dfs(directory: Directory, path: str, level: int):
+            # Recursively process subdirectories
+            for name in sorted(directory.directories):
+                subdir = directory.directories[name]
+                subdir_path = os.path.join(path, name)
+                res.append(subdir_path + "/")  # Add trailing slash for directories
+                if level < depth:
+                    dfs(subdir, subdir_path, level + 1)
 
             # Add all files in current directory
-        for file in sorted(directory.files):
-            res.append(os.path.join(path, file))
+            for file in sorted(directory.files):
+                res.append(os.path.join(path, file))
 
-    dfs(root)
-    return res
+        dfs(directory, "", 1)
+        return res
@@ -0,0 +1,296 @@
+import os
+import threading
+from typing import Callable, List, Literal, Optional, Tuple, TypeVar, Union
+from llama_agent import SANDBOX_DIR
+from llama_agent.file_cache import FILE_CACHE_BYTES, FileCache
+from llama_agent.index_cache import IndexCache, repo_state
+from llama_agent.file_view import (
+    SNIFF_BYTES,
+    VIEW_MAX_BYTES,
+    VIEW_PAGE_LINES,
+    LineIndex,
+    clamp_range,
+    is_binary,
+    page_header,
+)
+from llama_agent.search import SEARCH_PAGE_SIZE, SearchMatch, TrigramIndex
+from llama_agent.symbols import Symbol, SymbolIndex
+from llama_agent.utils.file_tree import FileIndex, list_files_in_repo
+
+Index = TypeVar("Index", FileIndex, TrigramIndex, SymbolIndex)
+
+
+class Workspace:
+    """
+    The sandbox a single agent run works in. The agent's /workspace/ maps to `sandbox_dir`,
+    and repositories are checked out directly under it, e.g., `sandbox_dir/<repo>`.
+
+    Each concurrent run needs its own Workspace so runs can't see or clobber each other's changes.
+    The workspace also holds per-run state about its repos, like the file index and the contents of viewed files,
+    so they are only read once per run.
+    """
+
+    sandbox_dir: str
+    file_cache: FileCache
+    view_max_bytes: int
+    view_page_lines: int
+    # Every file a tool has written to this run
+    written_files: set[str]
+
+    def __init__(
+        self,
+        sandbox_dir: str = SANDBOX_DIR,
+        file_cache_bytes: int = FILE_CACHE_BYTES,
+        view_max_bytes: int = VIEW_MAX_BYTES,
+        view_page_lines: int = VIEW_PAGE_LINES,
+        index_cache: Optional[IndexCache] = None,
+    ):
+        """
+        Args:
+            sandbox_dir (str): The directory /workspace/ maps to
+            file_cache_bytes (int): How much file content to keep cached for view_file
+            view_max_bytes (int): Files bigger than this are shown a page at a time
+            view_page_lines (int): How many lines of a big file to show when no line range is given
+            index_cache (Optional[IndexCache]): Where to load repo indexes from, and save them to, instead of
+                rebuilding them every run. None to always build them
+        """
+        self.sandbox_dir = sandbox_dir
+        self.file_cache = FileCache(file_cache_bytes)
+        self.view_max_bytes = view_max_bytes
+        self.view_page_lines = view_page_lines
+        self.index_cache = index_cache
+        self.written_files = set()
+        # Guards the dicts below. Never held while reading the repo
+        self._lock = threading.Lock()
+        # One per (repo, index kind), so only one tool call builds each index and the rest don't wait on it
+        self._build_locks: dict[Tuple[str, str], threading.Lock] = {}
+        self._file_indexes: dict[str, FileIndex] = {}
+        self._line_indexes: dict[str, LineIndex] = {}
+        self._search_indexes: dict[str, TrigramIndex] = {}
+        self._symbol_indexes: dict[str, SymbolIndex] = {}
+
+    def wrote_to(self, path: str) -> bool:
+        """True if a tool has written to `path`, or to a file under it, this run"""
+        path = os.path.abspath(path)
+        with self._lock:
+            written_files = list(self.written_files)
+        return any(written == path or written.startswith(path + os.sep) for written in written_files)
+
+    def repo_root(self, path: str) -> Optional[str]:
+        """The repo `path` is in, i.e., the top level directory under the sandbox. None for the sandbox itself"""
+        relative = os.path.relpath(os.path.abspath(path), os.path.abspath(self.sandbox_dir))
+        if relative == "." or relative.startswith(".."):
+            return None
+        return os.path.join(self.sandbox_dir, relative.split(os.sep)[0])
+
+    def load_or_build_index(self, repo_path: str, kind: str, index_class: type[Index]) -> Index:
+        """
+        Load an index of the repo from the index cache, or build it with `index_class.from_repo` and cache it.
+        Only repos whose tracked files match HEAD are cached
+        """
+        state = repo_state(repo_path) if self.index_cache is not None else None
+        if state is None:
+            return index_class.from_repo(repo_path)
+
+        repo, sha = state
+        index = self.index_cache.get(repo, sha, kind, index_class.CACHE_VERSION)
+        if index is not None:
+            # The same commit may have been indexed in a different worktree
+            index.path = repo_path
+            return index
+        index = index_class.from_repo(repo_path)
+        self.index_cache.put(repo, sha, kind, index_class.CACHE_VERSION, index)
+        return index
+
+    def split_repo_path(self, path: str) -> Tuple[str, str]:
+        """
+        The repo `path` is in, and `path` relative to it with / separators ("" for the repo itself)
+
+        Raises:
+            ValueError: If `path` isn't in a repo under the sandbox
+        """
+        repo_root = self.repo_root(path)
+        if repo_root is None:
+            raise ValueError(f"{path} is not in a repo")
+        relative = os.path.relpath(os.path.abspath(path), os.path.abspath(repo_root))
+        return repo_root, "" if relative == "." else relative.replace(os.sep, "/")
+
+    def file_index(self, repo_path: str) -> FileIndex:
+        """The file index of the repo at `repo_path`, built on first use"""
+        return self.index(self._file_indexes, repo_path, "files", FileIndex)
+
+    def search_index(self, repo_path: str) -> TrigramIndex:
+        """The code search index of the repo at `repo_path`, built on first use"""
+        return self.index(self._search_indexes, repo_path, "search", TrigramIndex)
+
+    def index(self, indexes: dict[str, Index], repo_path: str, kind: str, index_class: type[Index]) -> Index:
+        """
+        The `kind` index of the repo at `repo_path` from `indexes`, loaded or built on first use.
+        Tool calls run concurrently, so only the first to need an index builds it and the others wait for it,
+        while tool calls that need other indexes (or none) carry on
+        """
+        with self._lock:
+            index = indexes.get(repo_path)
+            if index is not None:
+                return index
+            build_lock = self._build_locks.setdefault((repo_path, kind), threading.Lock())
+
+        with build_lock:
+            with self._lock:
+                index = indexes.get(repo_path)
+                written_before = set(self.written_files)
+            if index is not None:
+                return index
+            index = self.load_or_build_index(repo_path, kind, index_class)
+            with self._lock:
+                # Catch up on files written while the index was being built
+                for path in self.written_files - written_before:
+                    if self.repo_root(path) == repo_path:
+                        update_index(index, os.path.relpath(path, os.path.abspath(repo_path)).replace(os.sep, "/"))
+                indexes[repo_path] = index
+            return index
+
+    def search_code(
+        self,
+        path: str,
+        query: str,
+        regex: bool = False,
+        case_sensitive: bool = True,
+        limit: int = SEARCH_PAGE_SIZE,
+        offset: int = 0,
+    ) -> Tuple[List[SearchMatch], bool]:
+        """
+        Search the files under the directory `path` with the repo's search index. See TrigramIndex.search
+
+        Returns:
+            Tuple[List[SearchMatch], bool]: The matches, with paths relative to the sandbox, and whether there are more
+        """
+        repo_root, path_prefix = self.split_repo_path(path)
+        matches, more = self.search_index(repo_root).search(
+            query, regex, case_sensitive, path_prefix, limit, offset
+        )
+        repo_name = os.path.basename(repo_root)
+        for match in matches:
+            match.path = f"{repo_name}/{match.path}"
+        return matches, more
+
+    def symbol_index(self, repo_path: str) -> SymbolIndex:
+        """The Python symbol index of the repo at `repo_path`, built on first use"""
+        return self.index(self._symbol_indexes, repo_path, "symbols", SymbolIndex)
+
+    def find_symbols(
+        self, path: str, name: str, kind: Literal["definitions", "references"]
+    ) -> List[Symbol]:
+        """
+        Definitions of, or references to, `name` in the files under the directory `path`. See SymbolIndex
+
+        Returns:
+            List[Symbol]: The symbols, with paths relative to the sandbox
+        """
+        repo_root, path_prefix = self.split_repo_path(path)
+        index = self.symbol_index(repo_root)
+        if kind == "definitions":
+            symbols = index.find_definitions(name, path_prefix)
+        else:
+            symbols = index.find_references(name, path_prefix)
+        repo_name = os.path.basename(repo_root)
+        return [
+            Symbol(symbol.name, f"{repo_name}/{symbol.path}", symbol.line_number, symbol.kind)
+            for symbol in symbols
+        ]
+
+    def list_files(self, path: str, depth: int = 1) -> List[str]:
+        """Same as list_files_in_repo, but answered from the repo's file index"""
+        repo_root = self.repo_root(path)
+        if repo_root is None or os.path.isfile(path) or not os.path.exists(path):
+            return list_files_in_repo(path, depth)
+
+        index = self.file_index(repo_root)
+        relative = os.path.relpath(os.path.abspath(path), os.path.abspath(repo_root))
+        return index.list(relative.replace(os.sep, "/"), depth)
+
+    def read_file(self, path: str) -> str:
+        return self.file_cache.read(path)
+
+    def view_file(
+        self, path: str, start_line: Optional[int] = None, end_line: Optional[int] = None
+    ) -> Union[Tuple[Literal["success"], str], Tuple[Literal["error"], str]]:
+        """
+        The contents of a file for the view_file tool. Small files are shown in full unless a line range is given.
+        Big files are shown a page at a time, without reading the whole file into memory. Binary files aren't shown.
+
+        Args:
+            path (str): The file to view
+            start_line (Optional[int]): The first line to show, 1-indexed
+            end_line (Optional[int]): The last line to show, inclusive
+        """
+        size = os.path.getsize(path)
+        if size > self.view_max_bytes:
+            if is_binary(path):
+                return ("success", binary_summary(size))
+            index = self.line_index(path)
+            line_count = index.line_count
+            read_lines = lambda start, end: index.read_lines(start, end).removesuffix("\n")
+        else:
+            try:
+                content = self.read_file(path)
+            except UnicodeDecodeError:
+                return ("success", binary_summary(size))
+            if "\0" in content[:SNIFF_BYTES]:
+                return ("success", binary_summary(size))
+            if start_line is None and end_line is None:
+                return ("success", content)
+            lines = content.split("\n")
+            if lines[-1] == "":
+                lines.pop()
+            line_count = len(lines)
+            read_lines = lambda start, end: "\n".join(lines[start - 1 : end])
+
+        if line_count == 0:
+            return ("success", "")
+        if start_line is not None and start_line > line_count:
+            return (
+                "error",
+                f"ERROR - start_line {start_line} is past the end of the file, which has {line_count} lines",
+            )
+        start, end = clamp_range(start_line, end_line, line_count, self.view_page_lines)
+        return ("success", page_header(start, end, line_count) + read_lines(start, end))
+
+    def line_index(self, path: str) -> LineIndex:
+        """The line index of the file at `path`, rebuilt if the file changed since it was built"""
+        key = os.path.realpath(path)
+        stat = os.stat(key)
+        with self._lock:
+            index = self._line_indexes.get(key)
+        if index is None or index.version != (stat.st_mtime_ns, stat.st_size):
+            index = LineIndex.from_file(key)
+            with self._lock:
+                self._line_indexes[key] = index
+        return index
+
+    def file_written(self, path: str) -> None:
+        """Keep per-run state in sync after a tool writes to `path`"""
+        self.file_cache.invalidate(path)
+        repo_root = self.repo_root(path)
+        with self._lock:
+            self.written_files.add(os.path.abspath(path))
+            self._line_indexes.pop(os.path.realpath(path), None)
+            if repo_root is None:
+                return
+            relative = os.path.relpath(os.path.abspath(path), os.path.abspath(repo_root)).replace(os.sep, "/")
+            for indexes in (self._file_indexes, self._search_indexes, self._symbol_indexes):
+                index = indexes.get(repo_root)
+                if index is not None:
+                    update_index(index, relative)
+
+
+def update_index(index: Index, file: str) -> None:
+    """Bring a repo index up to date with a file a tool wrote. `file` is relative to the repo root"""
+    if isinstance(index, FileIndex):
+        index.add_file(file)
+    else:
+        index.update_file(file)
+
+
+def binary_summary(size: int) -> str:
+    return f"Binary file ({size} bytes). Its contents can't be shown"
@@ -0,0 +1,34 @@
+import pytest
+from tests.benchmarks.harness import BenchmarkRecorder, Measurement
+
+
+@pytest.fixture(scope="session")
+def benchmark_recorder(request):
+    config = request.config
+    recorder = BenchmarkRecorder(
+        config.getoption("--benchmark-compare"), config.getoption("--benchmark-threshold")
+    )
+    yield recorder
+    path = config.getoption("--benchmark-json")
+    if path and recorder.results:
+        recorder.save(path)
+
+
+@pytest.fixture
+def bench(benchmark_recorder):
+    """
+    Times a function, prints the result and fails if it's slower than the baseline given with --benchmark-compare.
+
+        bench("parse_tool_calls[large]", lambda: parse_tool_calls(content))
+    """
+
+    def measure(name: str, fn, rounds: int = 7) -> Measurement:
+        measurement = benchmark_recorder.measure(name, fn, rounds)
+        print()
+        print(measurement)
+        message = benchmark_recorder.regression(name)
+        if message:
+            pytest.fail(message)
+        return measurement
+
+    return measure
@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Callable, Optional
+
+# A benchmark regresses when its median is this much slower than the baseline's
+REGRESSION_THRESHOLD = 0.2
+# Each round runs the function enough times to take at least this long, so timer resolution doesn't matter
+MIN_ROUND_TIME = 0.01
+
+
+class Measurement:
+    """Seconds per call of a benchmarked function, over `rounds` rounds of `loops` calls each"""
+
+    name: str
+    rounds: int
+    loops: int
+    min: float
+    median: float
+    mean: float
+    stdev: float
+
+    def __init__(self, name: str, times: list[float], loops: int):
+        self.name = name
+        self.rounds = len(times)
+        self.loops = loops
+        self.min = min(times)
+        self.median = statistics.median(times)
+        self.mean = statistics.mean(times)
+        self.stdev = statistics.stdev(times) if len(times) > 1 else 0.0
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "rounds": self.rounds,
+            "loops": self.loops,
+            "min": self.min,
+            "median": self.median,
+            "mean": self.mean,
+            "stdev": self.stdev,
+        }
+
+    def __str__(self) -> str:
+        return f"{self.name}: {format_time(self.median)} median, {format_time(self.min)} min ({self.rounds}x{self.loops})"
+
+
+class BenchmarkRecorder:
+    """
+    Times benchmarks, keeps their results for the session and checks them against a baseline from an earlier run.
+    Results are saved as JSON (see save) so CI can keep the last run and compare the next one to it
+    """
+
+    results: dict[str, Measurement]
+    baseline: Optional[dict[str, Any]]
+    threshold: float
+
+    def __init__(self, baseline_path: Optional[str] = None, threshold: float = REGRESSION_THRESHOLD):
+        self.results = {}
+        self.baseline = load(baseline_path) if baseline_path else None
+        self.threshold = threshold
+
+    def measure(self, name: str, fn: Callable[[], Any], rounds: int = 7) -> Measurement:
+        """
+        Time `fn`, calling it as many times per round as it takes to fill MIN_ROUND_TIME
+
+        Raises:
+            ValueError: If a benchmark with the same name was already measured this session
+        """
+        if name in self.results:
+            raise ValueError(f"Benchmark {name} was already measured")
+
+        loops = 1
+        while True:
+            elapsed = time_loops(fn, loops)
+            if elapsed >= MIN_ROUND_TIME:
+                break
+            loops *= 10 if elapsed < MIN_ROUND_TIME / 10 else 2
+
+        times = [elapsed / loops] + [time_loops(fn, loops) / loops for _ in range(rounds - 1)]
+        measurement = Measurement(name, times, loops)
+        self.results[name] = measurement
+        return measurement
+
+    def regression(self, name: str) -> Optional[str]:
+        """Describes how `name` regressed against the baseline, or None if it didn't (or isn't in the baseline)"""
+        if self.baseline is None:
+            return None
+        return regression(name, self.baseline["benchmarks"].get(name), self.results[name].to_json(), self.threshold)
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "created": time.time(),
+            "machine": {
+                "python": platform.python_version(),
+                "implementation": platform.python_implementation(),
+                "platform": platform.platform(),
+                "processor": platform.processor(),
+                "cpus": os.cpu_count(),
+            },
+            "benchmarks": {name: result.to_json() for name, result in sorted(self.results.items())},
+        }
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_json(), f, indent=2)
+
+
+def time_loops(fn: Callable[[], Any], loops: int) -> float:
+    start = time.perf_counter()
+    for _ in range(loops):
+        fn()
+    return time.perf_counter() - start
+
+
+def regression(
+    name: str, baseline: Optional[dict[str, Any]], result: dict[str, Any], threshold: float
+) -> Optional[str]:
+    if baseline is None:
+        return None
+    ratio = result["median"] / baseline["median"]
+    if ratio <= 1 + threshold:
+        return None
+    return (
+        f"{name} regressed: {format_time(result['median'])} median vs {format_time(baseline['median'])} "
+        f"in the baseline ({ratio:.2f}x, threshold {1 + threshold:.2f}x)"
+    )
+
+
+def compare(baseline: dict[str, Any], results: dict[str, Any], threshold: float = REGRESSION_THRESHOLD) -> list[str]:
+    """The regressions from `baseline` to `results`, both as saved by BenchmarkRecorder.save"""
+    regressions = []
+    for name, result in sorted(results["benchmarks"].items()):
+        message = regression(name, baseline["benchmarks"].get(name), result, threshold)
+        if message:
+            regressions.append(message)
+    return regressions
+
+
+def load(path: str) -> dict[str, Any]:
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two benchmark runs and exit 1 if any benchmark regressed")
+    parser.add_argument("baseline", help="Results of the earlier run, from --benchmark-json")
+    parser.add_argument("results", help="Results of the run to check")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    regressions = compare(load(args.baseline), load(args.results), args.threshold)
+    for message in regressions:
+        print(message)
+    if regressions:
+        sys.exit(1)
+    print("No regressions")
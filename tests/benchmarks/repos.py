@@ -0,0 +1,71 @@
+import os
+import random
+from subprocess import run
+
+
+def synthetic_paths(num_files: int, fanout: int = 20, max_depth: int = 6, seed: int = 0) -> list[str]:
+    """
+    Deterministic, repo-like file paths: a directory tree where each directory has up to `fanout` subdirectories
+    """
+    rng = random.Random(seed)
+    extensions = [".py", ".md", ".txt", ".json", ".js", ".rs"]
+    paths = set()
+    while len(paths) < num_files:
+        depth = rng.randint(0, max_depth)
+        parts = [f"dir_{rng.randrange(fanout)}" for _ in range(depth)]
+        parts.append(f"file_{rng.randrange(num_files * 2)}{rng.choice(extensions)}")
+        paths.add("/".join(parts))
+    return sorted(paths)
+
+
+def make_synthetic_repo(
+    path: str,
+    num_files: int = 1000,
+    num_commits: int = 1,
+    files_per_commit: int = 50,
+    file_size: int = 1024,
+    seed: int = 0,
+) -> list[str]:
+    """
+    Create a git repo at `path` with `num_files` files and `num_commits` commits of history, without a working tree checkout.
+    Uses `git fast-import` so even very large repos are created in seconds.
+
+    Returns:
+        list[str]: The paths of the files in the repo
+    """
+    rng = random.Random(seed)
+    paths = synthetic_paths(num_files, seed=seed)
+    os.makedirs(path, exist_ok=True)
+    run(["git", "init", "-q", "-b", "main", path], check=True)
+
+    def blob(i: int, commit: int) -> bytes:
+        line = f"# file {i} at commit {commit} {rng.random()}\n".encode()
+        return (line * (file_size // len(line) + 1))[:file_size]
+
+    stream = bytearray()
+    for commit in range(num_commits):
+        message = f"Commit {commit}".encode()
+        stream += b"commit refs/heads/main\n"
+        stream += f"committer Bench <bench@example.com> {1700000000 + commit} +0000\n".encode()
+        stream += b"data %d\n%s\n" % (len(message), message)
+        if commit == 0:
+            changed = range(len(paths))
+        else:
+            changed = rng.sample(range(len(paths)), min(files_per_commit, len(paths)))
+        for i in changed:
+            data = blob(i, commit)
+            stream += b"M 100644 inline %s\ndata %d\n%s\n" % (paths[i].encode(), len(data), data)
+
+    run(["git", "fast-import", "--quiet"], cwd=path, input=bytes(stream), check=True)
+    return paths
+
+
+def directory_size(path: str) -> int:
+    """Bytes used by all the files under `path`"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            file_path = os.path.join(root, name)
+            if not os.path.islink(file_path):
+                total += os.path.getsize(file_path)
+    return total
@@ -0,0 +1,120 @@
+import asyncio
+import io
+import os
+import statistics
+import time
+from contextlib import redirect_stdout
+from subprocess import run
+import pytest
+from llama_agent.agent import run_agent_async
+from llama_agent.workspace import Workspace
+from tests.benchmarks.repos import make_synthetic_repo
+from tests.fake_inference import FakeInferenceClient, LatencyModel, scripted_agent, thinking
+
+# Roughly a hosted 70B model: 100 tokens/s decode, 50k tokens/s prefill
+LATENCY = LatencyModel(time_to_first_token=0.1, prefill_per_token=1 / 50_000, decode_per_token=1 / 100)
+# What the model says after a tool call when nothing stops it, which streaming cuts off
+CHATTER = " I will wait for the result of the tool call before continuing." * 8
+
+
+def steps(paths: list[str]) -> list[str]:
+    directory = os.path.dirname(paths[0])
+    return [
+        thinking(60) + f'<tool>[list_files(path="/workspace/repo/{directory}")]</tool>' + CHATTER,
+        thinking(60) + f'<tool>[view_file(path="/workspace/repo/{paths[0]}")]</tool>' + CHATTER,
+        thinking(60) + '<tool>[search_code(path="/workspace/repo", query="file 1 at commit")]</tool>' + CHATTER,
+        thinking(60) + f'<tool>[view_file(path="/workspace/repo/{paths[1]}")]</tool>' + CHATTER,
+        thinking(60)
+        + f'<tool>[edit_file(path="/workspace/repo/{paths[0]}", old_str="# file", new_str="# changed file")]</tool>'
+        + CHATTER,
+        thinking(20) + "<tool>[finish()]</tool>" + CHATTER,
+    ]
+
+
+def make_sandboxes(root: str, count: int) -> list[str]:
+    """`count` copies of a 2000 file repo, each in its own sandbox"""
+    source = os.path.join(root, "source")
+    if not os.path.exists(source):
+        make_synthetic_repo(source, num_files=2000, file_size=2048)
+    sandboxes = []
+    for i in range(len(os.listdir(root)), len(os.listdir(root)) + count):
+        sandbox_dir = os.path.join(root, f"sandbox{i}")
+        run(["git", "clone", "-q", source, os.path.join(sandbox_dir, "repo")], check=True)
+        sandboxes.append(sandbox_dir)
+    return sandboxes
+
+
+def repo_files(sandbox_dir: str) -> list[str]:
+    listing = run(["git", "ls-files"], cwd=os.path.join(sandbox_dir, "repo"), check=True, capture_output=True, text=True)
+    return sorted(listing.stdout.split())
+
+
+def solve(client: FakeInferenceClient, sandbox_dir: str, stream: bool = False):
+    return run_agent_async(
+        client, "repo", "Issue title", "Issue body", stream=stream, workspace=Workspace(sandbox_dir)
+    )
+
+
+@pytest.mark.benchmark
+class TestAgentLoop:
+    """
+    run_agent against a fake inference server with a fixed latency model, so timings are the same from run to run.
+    Splits each run into time waiting on the model and time spent everywhere else (tools, prompt building)
+
+    pytest tests/benchmarks/test_agent_loop.py --benchmark -s
+    """
+
+    def test_iterations(self, tmp_path):
+        [sandbox_dir] = make_sandboxes(str(tmp_path), 1)
+        script = steps(repo_files(sandbox_dir))
+
+        print()
+        print(f"{'mode':<10}{'iters':>6}{'wall s':>8}{'s/iter':>8}{'model s':>9}{'other s':>9}{'prompt tok':>12}{'output tok':>12}")
+        for stream in (False, True):
+            client = FakeInferenceClient(scripted_agent(script), LATENCY)
+            run(["git", "checkout", "-q", "--", "."], cwd=os.path.join(sandbox_dir, "repo"), check=True)
+
+            start = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                res = asyncio.run(solve(client, sandbox_dir, stream=stream))
+            wall = time.perf_counter() - start
+
+            assert res[0] == "changes_made"
+            # The last two requests are the PR title and body, which run at the same time
+            loop_calls = client.calls[:-2]
+            model = sum(call.duration for call in loop_calls) + max(call.duration for call in client.calls[-2:])
+            print(
+                f"{'stream' if stream else 'complete':<10}{len(loop_calls):>6}{wall:>8.2f}"
+                f"{wall / len(loop_calls):>8.2f}{model:>9.2f}{wall - model:>9.2f}"
+                f"{sum(call.prompt_tokens for call in client.calls):>12}"
+                f"{sum(call.completion_tokens for call in client.calls):>12}"
+            )
+
+    def test_concurrent_agents(self, tmp_path):
+        print()
+        print(f"{'agents':>7}{'wall s':>8}{'mean s':>8}{'max s':>8}{'agents/min':>12}{'queued s':>10}")
+        for agents in (1, 8, 32):
+            sandboxes = make_sandboxes(str(tmp_path), agents)
+            # A server that batches up to 8 requests at once
+            client = FakeInferenceClient(scripted_agent(steps(repo_files(sandboxes[0]))), LATENCY, slots=8)
+            durations = []
+
+            async def timed(sandbox_dir: str) -> tuple:
+                start = time.perf_counter()
+                res = await solve(client, sandbox_dir, stream=True)
+                durations.append(time.perf_counter() - start)
+                return res
+
+            async def run_all() -> list[tuple]:
+                return await asyncio.gather(*(timed(sandbox_dir) for sandbox_dir in sandboxes))
+
+            start = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                results = asyncio.run(run_all())
+            wall = time.perf_counter() - start
+
+            assert all(res[0] == "changes_made" for res in results)
+            print(
+                f"{agents:>7}{wall:>8.2f}{statistics.mean(durations):>8.2f}{max(durations):>8.2f}"
+                f"{agents / wall * 60:>12.1f}{statistics.mean(call.queued for call in client.calls):>10.2f}"
+            )
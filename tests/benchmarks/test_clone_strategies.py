@@ -0,0 +1,58 @@
+import os
+import time
+import pytest
+from subprocess import run
+from llama_agent.sandbox import CLONE_STRATEGIES, clone
+from tests.benchmarks.repos import make_synthetic_repo, directory_size
+
+
+@pytest.mark.benchmark
+class TestCloneStrategies:
+    """
+    Compares first-time setup of a repo with each clone strategy: clone + checkout time and disk use.
+    A local bare repo serves as the remote, so this measures git's work rather than the network.
+
+    pytest tests/benchmarks/test_clone_strategies.py --benchmark -s
+    """
+
+    def test_clone_strategies(self, tmp_path):
+        source = str(tmp_path / "source")
+        make_synthetic_repo(
+            source, num_files=2000, num_commits=300, files_per_commit=100, file_size=4096
+        )
+        remote = str(tmp_path / "remote.git")
+        run(["git", "clone", "-q", "--bare", source, remote], check=True)
+        # Partial clones need the server to allow filters
+        run(["git", "config", "uploadpack.allowFilter", "true"], cwd=remote, check=True)
+        remote_url = f"file://{remote}"
+
+        # The reference strategy borrows from an existing local clone, e.g., a cache from a previous run
+        reference = str(tmp_path / "cache")
+        clone(remote_url, reference)
+
+        rows = []
+        for strategy in CLONE_STRATEGIES:
+            path = str(tmp_path / f"clone-{strategy}")
+            start = time.perf_counter()
+            clone(remote_url, path, strategy=strategy, reference=reference)
+            elapsed = time.perf_counter() - start
+
+            assert os.path.exists(os.path.join(path, ".git"))
+            files = run(
+                ["git", "ls-files"], cwd=path, check=True, capture_output=True, text=True
+            ).stdout.splitlines()
+            assert len(files) == 2000
+
+            rows.append(
+                (strategy, elapsed, directory_size(os.path.join(path, ".git")), directory_size(path))
+            )
+
+        print()
+        print(f"{'strategy':<12}{'seconds':>10}{'.git MB':>10}{'total MB':>10}")
+        for strategy, elapsed, git_size, total_size in rows:
+            print(f"{strategy:<12}{elapsed:>10.2f}{git_size / 1e6:>10.1f}{total_size / 1e6:>10.1f}")
+
+        sizes = {strategy: git_size for strategy, _, git_size, _ in rows}
+        assert sizes["shallow"] < sizes["full"]
+        assert sizes["blobless"] < sizes["full"]
+        assert sizes["reference"] < sizes["full"]
@@ -0,0 +1,77 @@
+import asyncio
+import io
+import statistics
+import time
+from contextlib import redirect_stdout
+import pytest
+from llama_agent.github import GitHubClient
+from llama_agent.index_cache import IndexCache
+from llama_agent.main import solve_issue_async
+from tests.fake_github import FakeGitHub, Latency
+from tests.test_main import scripted_agent
+
+
+@pytest.mark.benchmark
+class TestEndToEnd:
+    """
+    The whole pipeline main() runs (fetch issue -> clone -> agent -> commit -> push -> PR) on N issues at once,
+    against FakeGitHub with GitHub-like API latency, a local bare repo as the remote, and a scripted agent.
+
+    pytest tests/benchmarks/test_end_to_end.py --benchmark -s
+    """
+
+    def test_concurrency(self, tmp_path, monkeypatch):
+        files = {f"src/module_{i}.py": f"value = {i}\n" * 50 for i in range(200)}
+        files["file.txt"] = "old content"
+
+        with FakeGitHub(
+            str(tmp_path / "github"),
+            latency=Latency(0.3, jitter=0.1),
+            pr_latency=Latency(1.0, jitter=0.3),
+        ) as github:
+            for name, value in github.env().items():
+                monkeypatch.setenv(name, value)
+            github.add_repo("owner", "repo", files)
+
+            print()
+            print(f"{'issues':>8}{'wall s':>10}{'mean s':>10}{'max s':>10}{'issues/s':>10}")
+            for concurrency in (1, 4, 16):
+                issue_urls = [
+                    github.add_issue("owner", "repo", 1000 * concurrency + n, f"Issue {n}", "Body")
+                    for n in range(concurrency)
+                ]
+                durations = []
+
+                async def solve(client: GitHubClient, issue_url: str, sandbox_dir: str) -> dict:
+                    start = time.perf_counter()
+                    res = await solve_issue_async(
+                        scripted_agent(delay=0.5),
+                        "token",
+                        issue_url,
+                        sandbox_dir=sandbox_dir,
+                        github=client,
+                        index_cache=IndexCache(str(tmp_path / "index_cache.sqlite")),
+                    )
+                    durations.append(time.perf_counter() - start)
+                    return res
+
+                async def run() -> list[dict]:
+                    async with GitHubClient("token") as client:
+                        return await asyncio.gather(
+                            *(
+                                solve(client, issue_url, str(tmp_path / f"sandbox-{concurrency}-{i}"))
+                                for i, issue_url in enumerate(issue_urls)
+                            )
+                        )
+
+                start = time.perf_counter()
+                # Keep the agents' output out of the table
+                with redirect_stdout(io.StringIO()):
+                    results = asyncio.run(run())
+                wall = time.perf_counter() - start
+
+                assert all(res["status"] == "changes_made" for res in results)
+                print(
+                    f"{concurrency:>8}{wall:>10.2f}{statistics.mean(durations):>10.2f}"
+                    f"{max(durations):>10.2f}{concurrency / wall:>10.2f}"
+                )
@@ -0,0 +1,64 @@
+import time
+import pytest
+from llama_agent.utils.file_tree import FileIndex, READ_CHUNK_SIZE, split_nul_stream
+from tests.benchmarks.repos import make_synthetic_repo, synthetic_paths
+
+
+def nul_chunks(paths: list[str]) -> list[bytes]:
+    """`paths` as `git ls-tree -z` would print them, in the chunks iter_git_ls_files reads"""
+    data = b"".join(path.encode() + b"\0" for path in paths)
+    return [data[i : i + READ_CHUNK_SIZE] for i in range(0, len(data), READ_CHUNK_SIZE)]
+
+
+@pytest.mark.benchmark
+class TestFileTree:
+    """
+    Time to build the file index from git's NUL separated output, and to list from it,
+    over synthetic trees of increasing size.
+
+    pytest tests/benchmarks/test_file_tree.py --benchmark -s
+    """
+
+    @pytest.mark.parametrize("num_files", [10_000, 100_000, 1_000_000])
+    def test_build_and_list(self, num_files):
+        paths = synthetic_paths(num_files)
+        chunks = nul_chunks(paths)
+
+        start = time.perf_counter()
+        index = FileIndex("/repo", split_nul_stream(chunks))
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        listing = index.list(depth=3)
+        list_time = time.perf_counter() - start
+
+        assert len(index.list(depth=100)) >= num_files
+        print()
+        print(
+            f"{num_files:>9} paths: build {build:.2f}s ({build / num_files * 1e6:.2f}us/path), "
+            f"list depth 3 {list_time * 1000:.1f}ms ({len(listing)} entries)"
+        )
+
+    def test_wide_directory(self):
+        # Child lookup used to be a linear scan, so this was quadratic in the number of siblings
+        paths = [f"packages/pkg_{i}/index.js" for i in range(100_000)]
+
+        start = time.perf_counter()
+        index = FileIndex("/repo", split_nul_stream(nul_chunks(paths)))
+        build = time.perf_counter() - start
+
+        assert len(index.find_directory("packages").directories) == 100_000
+        print()
+        print(f"100000 sibling directories: build {build:.2f}s")
+
+    def test_from_repo(self, tmp_path):
+        repo = str(tmp_path / "repo")
+        make_synthetic_repo(repo, num_files=100_000, file_size=16)
+
+        start = time.perf_counter()
+        index = FileIndex.from_repo(repo)
+        elapsed = time.perf_counter() - start
+
+        assert len(index.list(depth=100)) >= 100_000
+        print()
+        print(f"100000 files from git: {elapsed:.2f}s")
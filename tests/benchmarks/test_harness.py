@@ -0,0 +1,43 @@
+import json
+import pytest
+from tests.benchmarks.harness import BenchmarkRecorder, compare
+
+
+def results(**medians: float) -> dict:
+    return {"benchmarks": {name: {"median": median} for name, median in medians.items()}}
+
+
+class TestBenchmarkRecorder:
+    def test_measure(self):
+        recorder = BenchmarkRecorder()
+
+        measurement = recorder.measure("sum", lambda: sum(range(100)), rounds=3)
+
+        assert measurement.rounds == 3
+        assert measurement.loops > 1
+        assert 0 < measurement.min <= measurement.median
+        with pytest.raises(ValueError):
+            recorder.measure("sum", lambda: None)
+
+    def test_save_and_compare(self, tmp_path):
+        path = tmp_path / "baseline.json"
+        path.write_text(json.dumps(results(sum=1e-9)))
+        recorder = BenchmarkRecorder(str(path))
+
+        recorder.measure("sum", lambda: sum(range(100)), rounds=3)
+        recorder.measure("new", lambda: None, rounds=3)
+        recorder.save(str(tmp_path / "results.json"))
+
+        assert "sum regressed" in recorder.regression("sum")
+        assert recorder.regression("new") is None
+        saved = json.loads((tmp_path / "results.json").read_text())
+        assert set(saved["benchmarks"]) == {"sum", "new"}
+
+
+def test_compare():
+    baseline = results(fast=1.0, slow=1.0, removed=1.0)
+
+    regressions = compare(baseline, results(fast=1.1, slow=1.5, added=9.0), threshold=0.2)
+
+    assert len(regressions) == 1
+    assert regressions[0].startswith("slow regressed: 1.50s median vs 1.00s")
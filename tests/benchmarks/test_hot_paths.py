@@ -0,0 +1,142 @@
+import os
+import pytest
+from llama_agent.agent import (
+    parse_tool_calls,
+    validate_directory_exists,
+    validate_file_exists,
+    validate_not_a_directory,
+    validate_not_symlink,
+    validate_path_in_sandbox,
+)
+from llama_agent.context import ContextBudget
+from llama_agent.conversation import Conversation
+from llama_agent.utils.file_tree import list_files_in_repo
+from tests.benchmarks.repos import make_synthetic_repo, synthetic_paths
+
+# A typical file view: ~250 lines of code
+FILE_VIEW = "".join(f"{i}: def function_{i}(argument):\n" f"{i}:     return argument * {i}\n" for i in range(125))
+
+
+@pytest.mark.benchmark
+class TestParseToolCalls:
+    """
+    Microbenchmarks of parsing the model's tool calls. Save and compare runs with
+
+    pytest tests/benchmarks/test_hot_paths.py --benchmark -s --benchmark-json new.json --benchmark-compare old.json
+    """
+
+    def test_large_call(self, bench):
+        # Rewriting a whole 2000 line file in one edit
+        new_str = "\\n".join(f"line {i} = 'value {i}'" for i in range(2000))
+        content = f'<thinking>Rewrite it</thinking><tool>[edit_file(path="/workspace/repo/big.py", new_str="{new_str}")]</tool>'
+
+        assert parse_tool_calls(content)[0][0] == "edit_file"
+        bench("parse_tool_calls[large_call]", lambda: parse_tool_calls(content))
+
+    def test_many_calls(self, bench):
+        calls = ", ".join(f'view_file(path="/workspace/repo/src/module_{i}.py")' for i in range(100))
+        content = f"<tool>[{calls}]</tool>"
+
+        assert len(parse_tool_calls(content)) == 100
+        bench("parse_tool_calls[many_calls]", lambda: parse_tool_calls(content))
+
+    def test_many_blocks(self, bench):
+        content = "\n".join(
+            f'Looking at module {i}\n<tool>[view_file(path="/workspace/repo/src/module_{i}.py")]</tool>'
+            for i in range(50)
+        )
+
+        assert len(parse_tool_calls(content)) == 50
+        bench("parse_tool_calls[many_blocks]", lambda: parse_tool_calls(content))
+
+
+@pytest.mark.benchmark
+class TestListFiles:
+    """Listing a repo the way the list_files tool and the first prompt do, on synthetic repos of increasing size"""
+
+    @pytest.mark.parametrize("num_files", [1_000, 10_000, 50_000])
+    def test_list_files_in_repo(self, bench, tmp_path, num_files):
+        repo = str(tmp_path / "repo")
+        make_synthetic_repo(repo, num_files=num_files, file_size=16)
+
+        assert len(list_files_in_repo(repo, depth=1)) > 0
+        bench(f"list_files_in_repo[{num_files}-depth1]", lambda: list_files_in_repo(repo, depth=1), rounds=5)
+        bench(f"list_files_in_repo[{num_files}-depth3]", lambda: list_files_in_repo(repo, depth=3), rounds=5)
+
+
+@pytest.mark.benchmark
+class TestPromptAssembly:
+    """Building the prompt over the agent's 15 iterations, with an assistant turn and a file view each time"""
+
+    def run_iterations(self, context_budget: ContextBudget) -> Conversation:
+        conversation = Conversation()
+        conversation.append("system", "You are an expert software engineer. " * 200)
+        conversation.append("user", "<file_tree>\n" + "\n".join(synthetic_paths(200)) + "\n</file_tree>")
+        for i in range(15):
+            context_budget.enforce(conversation)
+            conversation.prompt_token_count("assistant")
+            conversation.prompt("assistant")
+            conversation.append(
+                "assistant",
+                f'<thinking>The bug is probably in module {i}, let me look at it</thinking>'
+                f'<tool>[view_file(path="/workspace/repo/src/module_{i}.py")]</tool>',
+            )
+            conversation.append(
+                "tool",
+                f'Executing tool call: [view_file(path="/workspace/repo/src/module_{i}.py")]\nResult: {FILE_VIEW}\n',
+                {"tool_name": "view_file", "tool_params": {"path": f"/workspace/repo/src/module_{i}.py"}, "result": "success"},
+            )
+        return conversation
+
+    def test_within_budget(self, bench):
+        assert self.run_iterations(ContextBudget()).token_count < ContextBudget().max_tokens
+        bench("prompt_assembly[15_iterations]", lambda: self.run_iterations(ContextBudget()), rounds=5)
+
+    def test_over_budget(self, bench):
+        # Small enough that old file views are compacted on most iterations
+        budget = 20_000
+        assert self.run_iterations(ContextBudget(max_tokens=budget)).token_count < 2 * budget
+        bench(
+            "prompt_assembly[15_iterations_compacting]",
+            lambda: self.run_iterations(ContextBudget(max_tokens=budget)),
+            rounds=5,
+        )
+
+
+@pytest.mark.benchmark
+class TestValidatePaths:
+    """The path checks every file tool call runs before touching the file system"""
+
+    def test_file_checks(self, bench, tmp_path):
+        sandbox_dir = str(tmp_path)
+        os.makedirs(tmp_path / "repo" / "src")
+        (tmp_path / "repo" / "src" / "module.py").write_text("x = 1\n")
+        path = "/workspace/repo/src/module.py"
+
+        def validate():
+            return (
+                validate_path_in_sandbox(path, sandbox_dir)
+                or validate_not_symlink(path, sandbox_dir)
+                or validate_file_exists(path, sandbox_dir)
+                or validate_not_a_directory(path, sandbox_dir)
+            )
+
+        assert validate() is None
+        bench("validate[file]", validate)
+
+    def test_directory_checks(self, bench, tmp_path):
+        sandbox_dir = str(tmp_path)
+        os.makedirs(tmp_path / "repo" / "src")
+        path = "/workspace/repo/src"
+
+        def validate():
+            return validate_path_in_sandbox(path, sandbox_dir) or validate_directory_exists(path, sandbox_dir)
+
+        assert validate() is None
+        bench("validate[directory]", validate)
+
+    def test_escape_attempt(self, bench, tmp_path):
+        path = "/workspace/repo/../../../etc/passwd"
+
+        assert validate_path_in_sandbox(path, str(tmp_path)) is not None
+        bench("validate[outside_sandbox]", lambda: validate_path_in_sandbox(path, str(tmp_path)))
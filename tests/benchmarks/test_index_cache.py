@@ -0,0 +1,38 @@
+import time
+import pytest
+from subprocess import run
+from llama_agent.index_cache import IndexCache
+from llama_agent.search import TrigramIndex
+from llama_agent.utils.file_tree import FileIndex
+from tests.benchmarks.repos import make_synthetic_repo
+
+
+@pytest.mark.benchmark
+class TestIndexCache:
+    """
+    Building each repo index from scratch vs loading it from the index cache, for a 10k file repo.
+
+    pytest tests/benchmarks/test_index_cache.py --benchmark -s
+    """
+
+    def test_build_vs_load(self, tmp_path):
+        repo = str(tmp_path / "repo")
+        make_synthetic_repo(repo, num_files=10_000, file_size=2048)
+        run(["git", "reset", "-q", "--hard"], cwd=repo, check=True)
+        cache = IndexCache(str(tmp_path / "index_cache.sqlite"))
+
+        print()
+        print(f"{'index':<10}{'build s':>10}{'load s':>10}{'MB':>10}")
+        for kind, index_class in (("files", FileIndex), ("search", TrigramIndex)):
+            start = time.perf_counter()
+            index = index_class.from_repo(repo)
+            build = time.perf_counter() - start
+            cache.put("owner/repo", "sha", kind, index_class.CACHE_VERSION, index)
+
+            start = time.perf_counter()
+            loaded = cache.get("owner/repo", "sha", kind, index_class.CACHE_VERSION)
+            load = time.perf_counter() - start
+
+            assert loaded is not None
+            print(f"{kind:<10}{build:>10.3f}{load:>10.3f}{cache.size() / 1e6:>10.1f}")
+            assert load < build
@@ -0,0 +1,39 @@
+import time
+import pytest
+from subprocess import run
+from llama_agent.search import TrigramIndex
+from tests.benchmarks.repos import make_synthetic_repo
+
+
+@pytest.mark.benchmark
+class TestSearch:
+    """
+    Time to build the code search index of a checked out repo, and to answer selective and broad queries from it.
+
+    pytest tests/benchmarks/test_search.py --benchmark -s
+    """
+
+    def test_search(self, tmp_path):
+        repo = str(tmp_path / "repo")
+        paths = make_synthetic_repo(repo, num_files=10_000, file_size=4096)
+        run(["git", "reset", "-q", "--hard"], cwd=repo, check=True)
+
+        start = time.perf_counter()
+        index = TrigramIndex.from_repo(repo)
+        build = time.perf_counter() - start
+        assert len(index) == len(paths)
+
+        queries = [
+            ("literal, selective", "# file 1234 at commit", False),
+            ("regex, selective", r"file 1234 at \w+", True),
+            ("literal, no match", "no such text", False),
+            ("regex, full scan", r"\d{5} at", True),
+        ]
+        print()
+        print(f"Indexed {len(paths)} files ({len(paths) * 4096 / 1e6:.0f} MB) in {build:.2f}s")
+        print(f"{'query':<20}{'ms':>10}{'matches':>10}")
+        for name, query, regex in queries:
+            start = time.perf_counter()
+            matches, _ = index.search(query, regex=regex)
+            elapsed = time.perf_counter() - start
+            print(f"{name:<20}{elapsed * 1000:>10.1f}{len(matches):>10}")
@@ -0,0 +1,39 @@
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmark",
+        action="store_true",
+        default=False,
+        help="Run the benchmarks in tests/benchmarks. They are slow, so they are skipped by default",
+    )
+    parser.addoption(
+        "--benchmark-json",
+        help="Save the timings of the microbenchmarks to this file",
+    )
+    parser.addoption(
+        "--benchmark-compare",
+        help="Fail microbenchmarks that are slower than in this file, saved by an earlier run with --benchmark-json",
+    )
+    parser.addoption(
+        "--benchmark-threshold",
+        type=float,
+        default=0.2,
+        help="How much slower than the baseline a microbenchmark can be before it fails, e.g., 0.2 for 20%%",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "benchmark: slow benchmark, only runs with --benchmark"
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark"):
+        return
+    skip = pytest.mark.skip(reason="Benchmarks only run with --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
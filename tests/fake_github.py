@@ -0,0 +1,144 @@
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from subprocess import run
+from typing import Optional
+from tests.github_stub import StubGitHub, StubRequest, StubResponse
+
+
+class Latency:
+    """
+    How long the fake takes to answer: `seconds` plus uniform jitter of up to `jitter` either way.
+    Seeded, so a benchmark sees the same delays on every run
+    """
+
+    def __init__(self, seconds: float = 0, jitter: float = 0, seed: int = 0):
+        self.seconds = seconds
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def delay(self) -> float:
+        if not self.jitter:
+            return self.seconds
+        with self.lock:
+            return max(0.0, self.seconds + self.rng.uniform(-self.jitter, self.jitter))
+
+
+class FakeGitHub(StubGitHub):
+    """
+    A local stand-in for the parts of GitHub that main() uses: fetching an issue, cloning and pushing to the repo,
+    and opening a PR. Repos are bare repos under `root`, so git talks to them over the file protocol.
+
+    Point main() at it with the environment it returns from env(). API requests take `latency` to answer,
+    and creating a PR `pr_latency`, to model GitHub's response times. Git operations are local and take no extra time.
+    """
+
+    root: str
+    latency: Latency
+    pr_latency: Latency
+    # The PRs opened so far, in order, with the request that opened each
+    pulls: list[dict]
+
+    def __init__(
+        self, root: str, latency: Optional[Latency] = None, pr_latency: Optional[Latency] = None
+    ):
+        super().__init__()
+        self.root = root
+        self.latency = latency or Latency()
+        self.pr_latency = pr_latency or self.latency
+        self.pulls = []
+
+    @property
+    def git_url(self) -> str:
+        return f"file://{os.path.join(self.root, 'remotes')}"
+
+    def env(self) -> dict[str, str]:
+        return {"GITHUB_API_URL": self.url, "GITHUB_GIT_URL": self.git_url}
+
+    def remote_path(self, owner: str, repo: str) -> str:
+        return os.path.join(self.root, "remotes", owner, f"{repo}.git")
+
+    def add_repo(self, owner: str, repo: str, files: dict[str, str], default_branch: str = "main") -> str:
+        """
+        Create a bare repo with one commit of `files` on `default_branch`, and serve its PR endpoint
+
+        Returns:
+            str: The path of the bare repo
+        """
+        remote = self.remote_path(owner, repo)
+        with tempfile.TemporaryDirectory() as work:
+            for path, content in files.items():
+                os.makedirs(os.path.dirname(os.path.join(work, path)), exist_ok=True)
+                with open(os.path.join(work, path), "w") as f:
+                    f.write(content)
+            git("init", "-q", "-b", default_branch, cwd=work)
+            git("add", "--all", cwd=work)
+            git("commit", "-q", "-m", "Initial commit", cwd=work)
+            git("clone", "-q", "--bare", work, remote)
+
+        self.handle(
+            "POST", f"/repos/{owner}/{repo}/pulls", lambda request: self.create_pull(owner, repo, request)
+        )
+        return remote
+
+    def add_issue(self, owner: str, repo: str, number: int, title: str, body: str) -> str:
+        """
+        Returns:
+            str: The issue's url
+        """
+        url = f"https://github.com/{owner}/{repo}/issues/{number}"
+        self.route(
+            "GET",
+            f"/repos/{owner}/{repo}/issues/{number}",
+            StubResponse(
+                200,
+                {"number": number, "title": title, "body": body, "state": "open", "html_url": url},
+                headers={"ETag": f'"{owner}-{repo}-{number}"'},
+            ),
+        )
+        return url
+
+    def branch_files(self, owner: str, repo: str, branch: str) -> dict[str, str]:
+        """The files on a branch of the remote, by path"""
+        remote = self.remote_path(owner, repo)
+        paths = git("ls-tree", "-r", "--name-only", branch, cwd=remote).splitlines()
+        return {path: git("show", f"{branch}:{path}", cwd=remote) for path in paths}
+
+    def create_pull(self, owner: str, repo: str, request: StubRequest) -> StubResponse:
+        time.sleep(self.pr_latency.delay())
+        data = request.json()
+        for field in ("title", "head", "base"):
+            if not data.get(field):
+                return StubResponse(422, {"message": "Validation Failed", "errors": [{"field": field, "code": "missing_field"}]})
+
+        remote = self.remote_path(owner, repo)
+        for field in ("head", "base"):
+            if not re.fullmatch(r"[\w./-]+", data[field]) or run(
+                ["git", "rev-parse", "--verify", "--quiet", f"refs/heads/{data[field]}"], cwd=remote, capture_output=True
+            ).returncode != 0:
+                return StubResponse(422, {"message": "Validation Failed", "errors": [{"field": field, "code": "invalid"}]})
+
+        with self.lock:
+            number = len(self.pulls) + 1
+            pull = {
+                "number": number,
+                "html_url": f"https://github.com/{owner}/{repo}/pull/{number}",
+                "owner": owner,
+                "repo": repo,
+                **data,
+            }
+            self.pulls.append(pull)
+        return StubResponse(201, {"number": number, "html_url": pull["html_url"]})
+
+    def respond(self, request: StubRequest) -> StubResponse:
+        if not request.path.endswith("/pulls"):
+            time.sleep(self.latency.delay())
+        return super().respond(request)
+
+
+def git(*args: str, cwd: Optional[str] = None) -> str:
+    return run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout
@@ -0,0 +1,213 @@
+import asyncio
+import time
+from typing import Any, Callable, Optional
+from llama_models.llama3.api.tokenizer import Tokenizer
+from llama_agent.agent import MODEL_ID
+from llama_agent.completion_cache import CompletionCache, CompletionCacheMiss, completion_key
+from llama_agent.conversation import encode, header
+
+# Answers a completion request (the kwargs the agent called completion with) with the response text
+Responder = Callable[[dict], str]
+
+
+class LatencyModel:
+    """
+    How long the fake server takes: `time_to_first_token` of fixed overhead, plus `prefill_per_token` seconds
+    for each prompt token before the first token is sent, then `decode_per_token` seconds for each token generated
+    """
+
+    def __init__(
+        self, time_to_first_token: float = 0, prefill_per_token: float = 0, decode_per_token: float = 0
+    ):
+        self.time_to_first_token = time_to_first_token
+        self.prefill_per_token = prefill_per_token
+        self.decode_per_token = decode_per_token
+
+    def prefill(self, prompt_tokens: int) -> float:
+        return self.time_to_first_token + prompt_tokens * self.prefill_per_token
+
+    def decode(self, tokens: int) -> float:
+        return tokens * self.decode_per_token
+
+
+class CompletionRecord:
+    """One request to the fake server. Times are time.perf_counter() values"""
+
+    prompt_tokens: int
+    # Tokens sent back. Less than the response if the client closed the stream early
+    completion_tokens: int
+    stream: bool
+    requested: float
+    # When a slot on the server was free and prefill started
+    started: float
+    first_token: Optional[float]
+    finished: Optional[float]
+
+    def __init__(self, prompt_tokens: int, stream: bool, requested: float):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = 0
+        self.stream = stream
+        self.requested = requested
+        self.started = requested
+        self.first_token = None
+        self.finished = None
+
+    @property
+    def queued(self) -> float:
+        return self.started - self.requested
+
+    @property
+    def duration(self) -> float:
+        return (self.finished or self.started) - self.requested
+
+
+class Response:
+    def __init__(self, content: str, stop_reason: str = "end_of_turn"):
+        self.content = content
+        self.stop_reason = stop_reason
+
+
+class Chunk:
+    def __init__(self, delta: str, stop_reason: Optional[str] = None):
+        self.delta = delta
+        self.stop_reason = stop_reason
+
+
+class Model:
+    def __init__(self, identifier: str):
+        self.identifier = identifier
+
+
+class Models:
+    def list(self) -> list[Model]:
+        return [Model(MODEL_ID)]
+
+
+class FakeInferenceClient:
+    """
+    A local stand-in for AsyncLlamaStackClient's completion endpoint, with the timing of a real server but no noise.
+
+    Responses come from `responder`. Requests wait on asyncio.sleep for the time `latency` gives them, and at most
+    `slots` are served at once (like a server's batch size), the rest queue. Streams are sent a token at a time,
+    and stop generating when the client closes them. Every request is recorded in `calls`
+    """
+
+    responder: Responder
+    latency: LatencyModel
+    calls: list[CompletionRecord]
+
+    def __init__(
+        self, responder: Responder, latency: Optional[LatencyModel] = None, slots: Optional[int] = None
+    ):
+        self.responder = responder
+        self.latency = latency or LatencyModel()
+        self.slots = asyncio.Semaphore(slots) if slots else None
+        self.calls = []
+        self.models = Models()
+        self.inference = self
+
+    async def completion(self, model_id: str, content: str, stream: bool = False, **kwargs):
+        request = {"model_id": model_id, "content": content, **kwargs}
+        record = CompletionRecord(len(encode(content)), stream, time.perf_counter())
+        self.calls.append(record)
+        tokens = response_tokens(self.responder(request), kwargs.get("sampling_params"))
+
+        if stream:
+            return self.stream(record, tokens)
+        async with self.slot(record):
+            await asyncio.sleep(self.latency.prefill(record.prompt_tokens) + self.latency.decode(len(tokens)))
+            record.first_token = time.perf_counter()
+            record.completion_tokens = len(tokens)
+        return Response(decode(tokens))
+
+    async def stream(self, record: CompletionRecord, tokens: list[int]):
+        async with self.slot(record):
+            await asyncio.sleep(self.latency.prefill(record.prompt_tokens))
+            for i, token in enumerate(tokens):
+                if i:
+                    await asyncio.sleep(self.latency.decode(1))
+                else:
+                    record.first_token = time.perf_counter()
+                record.completion_tokens += 1
+                yield Chunk(decode([token]))
+            yield Chunk("", stop_reason="end_of_turn")
+
+    def slot(self, record: CompletionRecord) -> "Slot":
+        return Slot(self.slots, record)
+
+
+class Slot:
+    """Holds one of the server's slots for a request, and records when it started and finished"""
+
+    def __init__(self, semaphore: Optional[asyncio.Semaphore], record: CompletionRecord):
+        self.semaphore = semaphore
+        self.record = record
+
+    async def __aenter__(self) -> None:
+        if self.semaphore is not None:
+            await self.semaphore.acquire()
+        self.record.started = time.perf_counter()
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.record.finished = time.perf_counter()
+        if self.semaphore is not None:
+            self.semaphore.release()
+
+
+def response_tokens(text: str, sampling_params: Optional[dict[str, Any]]) -> list[int]:
+    """The tokens the server would send: the response up to (not including) the first stop sequence"""
+    for stop in (sampling_params or {}).get("stop") or []:
+        index = text.find(stop)
+        if index != -1:
+            text = text[:index]
+    return Tokenizer.get_instance().encode(text, bos=False, eos=False)
+
+
+def decode(tokens: list[int]) -> str:
+    return Tokenizer.get_instance().decode(tokens)
+
+
+def scripted_agent(
+    steps: list[str],
+    title: str = "Update file",
+    body: str = "Changed old to new",
+    explanation: str = "Nothing needed to change",
+) -> Responder:
+    """
+    Plays back `steps` as the agent's turns, then answers the finalization prompts.
+    The step is picked from the number of assistant turns already in the prompt, not from how many requests
+    came before, so any number of agents can share one responder and each sees the same script
+    """
+    assistant = header("assistant")
+
+    def respond(request: dict) -> str:
+        prompt = request["content"]
+        if prompt.endswith("## PR Body\n\n"):
+            return body
+        last_message = prompt[: prompt.rfind(assistant)]
+        if "explain your reasoning for not making any changes" in last_message[-500:]:
+            return explanation
+        if "create a PR title" in last_message[-500:]:
+            return title
+        turn = prompt.count(assistant) - 1
+        return steps[min(turn, len(steps) - 1)]
+
+    return respond
+
+
+def recorded(cache: CompletionCache) -> Responder:
+    """Answers with completions recorded by `--completion-cache record`"""
+
+    def respond(request: dict) -> str:
+        cached = cache.get(completion_key(request))
+        if cached is None:
+            raise CompletionCacheMiss(f"No recorded completion for this request to {request.get('model_id')}")
+        return cached[0]
+
+    return respond
+
+
+def thinking(tokens: int) -> str:
+    """About `tokens` tokens of filler reasoning, to give scripted steps a realistic length"""
+    words = " first I need to look at the file and then make the change".split()
+    return "<thinking>" + " ".join(words[i % len(words)] for i in range(tokens)) + "</thinking>\n"
@@ -0,0 +1,120 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Optional, Union
+
+
+class StubRequest:
+    method: str
+    path: str
+    headers: dict[str, str]
+    body: bytes
+    # The client's (host, port). Requests sent over a kept-alive connection share it
+    client_address: tuple
+
+    def __init__(self, method: str, path: str, headers: dict[str, str], body: bytes, client_address: tuple):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+        self.client_address = client_address
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+
+class StubResponse:
+    status: int
+    headers: dict[str, str]
+    body: bytes
+
+    def __init__(self, status: int = 200, json_body: Any = None, headers: Optional[dict[str, str]] = None, body: bytes = b""):
+        self.status = status
+        self.headers = dict(headers or {})
+        self.body = body
+        if json_body is not None:
+            self.body = json.dumps(json_body).encode()
+            self.headers.setdefault("Content-Type", "application/json")
+
+
+Route = Union[list[StubResponse], Callable[[StubRequest], StubResponse]]
+
+
+class StubGitHub:
+    """
+    A local stand-in for the GitHub API, served from a background thread.
+
+    Each (method, path) is answered either by a function of the request, or by a list of scripted responses
+    that are used in order, repeating the last one. Unknown paths get a 404. Every request is recorded.
+    """
+
+    def __init__(self):
+        self.routes: dict[tuple[str, str], Route] = {}
+        self.requests: list[StubRequest] = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler_class())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.01,), daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def route(self, method: str, path: str, *responses: StubResponse) -> None:
+        self.routes[(method, path)] = list(responses)
+
+    def handle(self, method: str, path: str, handler: Callable[[StubRequest], StubResponse]) -> None:
+        self.routes[(method, path)] = handler
+
+    def requests_to(self, method: str, path: str) -> list[StubRequest]:
+        with self.lock:
+            return [r for r in self.requests if r.method == method and r.path == path]
+
+    def respond(self, request: StubRequest) -> StubResponse:
+        with self.lock:
+            self.requests.append(request)
+            route = self.routes.get((request.method, request.path))
+            if route is None:
+                return StubResponse(404, {"message": "Not Found"})
+            if callable(route):
+                handler = route
+            else:
+                return route.pop(0) if len(route) > 1 else route[0]
+        return handler(request)
+
+    def handler_class(self) -> type:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keeps connections open between requests, like api.github.com
+            protocol_version = "HTTP/1.1"
+
+            def do(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                path = self.path.split("?", 1)[0]
+                request = StubRequest(
+                    self.command, path, dict(self.headers), self.rfile.read(length), self.client_address
+                )
+                response = stub.respond(request)
+                self.send_response(response.status)
+                for name, value in response.headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(response.body)))
+                self.end_headers()
+                self.wfile.write(response.body)
+
+            do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = do
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self) -> "StubGitHub":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,14 +1,24 @@
+import asyncio
 import pytest
+import threading
+import time
 from subprocess import run
+import llama_agent.agent as agent
 from llama_agent.agent import (
     display_tool_params,
     parse_tool_calls,
     translate_path,
     SANDBOX_DIR,
     execute_tool_call,
+    execute_tool_calls,
+    run_agent,
+    run_agent_async,
     REPO_DIR,
 )
-from llama_agent.utils.file_tree import list_files_in_repo
+import llama_agent.utils.file_tree as file_tree
+from llama_agent.utils.file_tree import list_files_in_repo, FileIndex, split_nul_stream
+from llama_agent.search import TrigramIndex
+from llama_agent.workspace import Workspace
 import tempfile
 import os
 import shutil
@@ -151,6 +161,141 @@ class TestFileTree:
             "file1.txt",
         ]
 
+    def test_names_with_spaces_and_quotes(self):
+        open(os.path.join(self.test_dir, "file with spaces.txt"), "w").close()
+        open(os.path.join(self.test_dir, 'quote"d.txt'), "w").close()
+        add_to_git(self.test_dir)
+
+        res = list_files_in_repo(self.test_dir)
+
+        assert res == ["file with spaces.txt", 'quote"d.txt']
+
+
+class TestFileIndex:
+    def test_list_root(self):
+        index = FileIndex("/repo", ["a.txt", "dir1/b.txt", "dir1/dir2/c.txt"])
+
+        assert index.list() == ["dir1/", "a.txt"]
+        assert index.list(depth=3) == [
+            "dir1/",
+            "dir1/dir2/",
+            "dir1/dir2/c.txt",
+            "dir1/b.txt",
+            "a.txt",
+        ]
+
+    def test_list_subdirectory(self):
+        index = FileIndex("/repo", ["a.txt", "dir1/b.txt", "dir1/dir2/c.txt"])
+
+        assert index.list("dir1") == ["dir2/", "b.txt"]
+        assert index.list("dir1/dir2") == ["c.txt"]
+        assert index.list("does_not_exist") == []
+
+    def test_add_file(self):
+        index = FileIndex("/repo", ["a.txt"])
+
+        index.add_file("dir1/new.txt")
+        index.add_file("a.txt")
+
+        assert index.list(depth=2) == ["dir1/", "dir1/new.txt", "a.txt"]
+
+    def test_wide_directory(self):
+        files = [f"dir_{i}/file.txt" for i in range(20000)]
+
+        index = FileIndex("/repo", files)
+
+        assert len(index.list()) == 20000
+        assert index.list("dir_19999") == ["file.txt"]
+
+
+class TestSplitNulStream:
+    def test_names_split_across_chunks(self):
+        chunks = [b"a.txt\0dir/b", b".txt\0", b"c with space.txt\0d", b".txt"]
+
+        assert list(split_nul_stream(chunks)) == [
+            "a.txt",
+            "dir/b.txt",
+            "c with space.txt",
+            "d.txt",
+        ]
+
+    def test_unicode_split_across_chunks(self):
+        data = "café.txt\0naïve.py\0".encode()
+        chunks = [data[i : i + 1] for i in range(len(data))]
+
+        assert list(split_nul_stream(chunks)) == ["café.txt", "naïve.py"]
+
+
+class TestWorkspaceListFiles:
+    @pytest.fixture(autouse=True)
+    def setup_method(self, tmp_path):
+        self.workspace = Workspace(str(tmp_path))
+        self.repo = os.path.join(str(tmp_path), "repo")
+        os.makedirs(os.path.join(self.repo, "dir1"))
+        open(os.path.join(self.repo, "file1.txt"), "w").close()
+        open(os.path.join(self.repo, "dir1", "file2.txt"), "w").close()
+        add_to_git(self.repo)
+
+    def test_reads_git_once(self, monkeypatch):
+        calls = []
+        original = file_tree.iter_git_ls_files
+
+        def counting_iter_git_ls_files(path):
+            calls.append(path)
+            return original(path)
+
+        monkeypatch.setattr(file_tree, "iter_git_ls_files", counting_iter_git_ls_files)
+
+        assert self.workspace.list_files(self.repo, depth=2) == [
+            "dir1/",
+            "dir1/file2.txt",
+            "file1.txt",
+        ]
+        assert self.workspace.list_files(os.path.join(self.repo, "dir1")) == ["file2.txt"]
+        assert calls == [self.repo]
+
+    def test_file_written(self):
+        self.workspace.list_files(self.repo)
+        path = os.path.join(self.repo, "dir1", "new.txt")
+        open(path, "w").close()
+
+        self.workspace.file_written(path)
+
+        assert self.workspace.list_files(os.path.join(self.repo, "dir1")) == [
+            "file2.txt",
+            "new.txt",
+        ]
+
+    def test_slow_index_build_does_not_block_other_tools(self, monkeypatch):
+        building = threading.Event()
+        release = threading.Event()
+        original = TrigramIndex.from_repo
+
+        def slow_from_repo(path):
+            building.set()
+            release.wait(5)
+            return original(path)
+
+        monkeypatch.setattr(TrigramIndex, "from_repo", slow_from_repo)
+        search = threading.Thread(target=self.workspace.search_code, args=(self.repo, "anything"))
+        search.start()
+        assert building.wait(5)
+
+        # The search index is still being built
+        start = time.perf_counter()
+        assert self.workspace.list_files(self.repo) == ["dir1/", "file1.txt"]
+        assert time.perf_counter() - start < 2
+        path = os.path.join(self.repo, "dir1", "file2.txt")
+        with open(path, "w") as f:
+            f.write("written during the build\n")
+        self.workspace.file_written(path)
+        release.set()
+        search.join()
+
+        # The write made during the build isn't lost
+        matches, _ = self.workspace.search_code(self.repo, "during the build")
+        assert [match.path for match in matches] == ["repo/dir1/file2.txt"]
+
 
 class TestTranslatePath:
 
@@ -342,15 +487,522 @@ class TestExecuteToolCall:
 
         assert res == ("success", "old content\n\nHello World")
     
+    def test_view_file_in_workspace(self, tmp_path):
+        os.makedirs(tmp_path / "other_repo")
+        (tmp_path / "other_repo" / "file.txt").write_text("other content")
+
+        res = execute_tool_call(
+            "view_file",
+            {"path": "/workspace/other_repo/file.txt"},
+            Workspace(str(tmp_path)),
+        )
+
+        assert res == ("success", "other content")
+
+    def test_view_file_after_edit_sees_new_content(self, tmp_path):
+        os.makedirs(tmp_path / "repo")
+        (tmp_path / "repo" / "file.txt").write_text("old content")
+        workspace = Workspace(str(tmp_path))
+        view = {"path": "/workspace/repo/file.txt"}
+
+        assert execute_tool_call("view_file", view, workspace) == ("success", "old content")
+        assert execute_tool_call("view_file", view, workspace) == ("success", "old content")
+        execute_tool_call(
+            "edit_file",
+            {"path": "/workspace/repo/file.txt", "old_str": "old", "new_str": "new"},
+            workspace,
+        )
+
+        assert execute_tool_call("view_file", view, workspace) == ("success", "new content")
+        assert workspace.file_cache.hits == 1
+        assert workspace.file_cache.misses == 2
+
+    def test_view_file_line_range(self):
+        self.write_numbered_lines("lines.txt", 10)
+
+        res = execute_tool_call(
+            "view_file",
+            {"path": "/workspace/test_repo/lines.txt", "start_line": 3, "end_line": "5"},
+        )
+
+        assert res == (
+            "success",
+            "Showing lines 3-5 of 10. Use start_line and end_line to view other lines.\n"
+            "line 3\nline 4\nline 5",
+        )
+
+    def test_view_file_start_line_past_end(self):
+        self.write_numbered_lines("lines.txt", 10)
+
+        res = execute_tool_call(
+            "view_file", {"path": "/workspace/test_repo/lines.txt", "start_line": 11}
+        )
+
+        assert res == (
+            "error",
+            "ERROR - start_line 11 is past the end of the file, which has 10 lines",
+        )
+
+    def test_view_file_invalid_line_range(self):
+        self.write_numbered_lines("lines.txt", 10)
+
+        res = execute_tool_call(
+            "view_file",
+            {"path": "/workspace/test_repo/lines.txt", "start_line": 5, "end_line": 2},
+        )
+
+        assert res == ("error", "ERROR - end_line (2) is before start_line (5)")
+
+    def test_view_big_file_is_paged(self, tmp_path):
+        os.makedirs(tmp_path / "repo")
+        (tmp_path / "repo" / "big.txt").write_text(
+            "".join(f"line {i}\n" for i in range(1, 1001))
+        )
+        workspace = Workspace(str(tmp_path), view_max_bytes=1000, view_page_lines=2)
+        path = "/workspace/repo/big.txt"
+
+        first_page = execute_tool_call("view_file", {"path": path}, workspace)
+        later_page = execute_tool_call(
+            "view_file", {"path": path, "start_line": 999, "end_line": 2000}, workspace
+        )
+
+        assert first_page == (
+            "success",
+            "Showing lines 1-2 of 1000. Use start_line and end_line to view other lines.\n"
+            "line 1\nline 2",
+        )
+        assert later_page == (
+            "success",
+            "Showing lines 999-1000 of 1000. Use start_line and end_line to view other lines.\n"
+            "line 999\nline 1000",
+        )
+        # Big files are never loaded whole
+        assert len(workspace.file_cache) == 0
+
+    def test_view_big_file_after_edit(self, tmp_path):
+        os.makedirs(tmp_path / "repo")
+        (tmp_path / "repo" / "big.txt").write_text("old\n" * 100)
+        workspace = Workspace(str(tmp_path), view_max_bytes=10)
+        path = "/workspace/repo/big.txt"
+        execute_tool_call("view_file", {"path": path}, workspace)
+
+        execute_tool_call("edit_file", {"path": path, "new_str": "new\n" * 200}, workspace)
+
+        res = execute_tool_call("view_file", {"path": path, "start_line": 200}, workspace)
+        assert res == (
+            "success",
+            "Showing lines 200-200 of 200. Use start_line and end_line to view other lines.\nnew",
+        )
+
+    @pytest.mark.parametrize("view_max_bytes", [10, 1_000_000])
+    def test_view_binary_file(self, tmp_path, view_max_bytes):
+        os.makedirs(tmp_path / "repo")
+        (tmp_path / "repo" / "image.png").write_bytes(b"\x89PNG\r\n\x1a\n\0\0\0\rIHDR" * 10)
+        workspace = Workspace(str(tmp_path), view_max_bytes=view_max_bytes)
+
+        res = execute_tool_call(
+            "view_file", {"path": "/workspace/repo/image.png"}, workspace
+        )
+
+        assert res == ("success", "Binary file (160 bytes). Its contents can't be shown")
+
+    def test_edit_files(self):
+        self.write_numbered_lines("lines.txt", 3)
+        self.write_numbered_lines("other.txt", 3)
+
+        res = execute_tool_call(
+            "edit_files",
+            {
+                "edits": [
+                    {"path": "/workspace/test_repo/lines.txt", "old_str": "line 1", "new_str": "first"},
+                    {"path": "/workspace/test_repo/other.txt", "start_line": 2, "end_line": 3, "new_str": "rest"},
+                    {"path": "/workspace/test_repo/lines.txt", "start_line": "3", "new_str": "last"},
+                ]
+            },
+        )
+
+        assert res == ("success", "Successfully made 3 edits to 2 files")
+        self.assert_file_content("lines.txt", "first\nline 2\nlast\n")
+        self.assert_file_content("other.txt", "line 1\nrest\n")
+
+    def test_edit_files_is_all_or_nothing(self):
+        self.write_numbered_lines("lines.txt", 3)
+
+        res = execute_tool_call(
+            "edit_files",
+            {
+                "edits": [
+                    {"path": "/workspace/test_repo/lines.txt", "old_str": "line 1", "new_str": "first"},
+                    {"path": "/workspace/test_repo/lines.txt", "old_str": "line 4", "new_str": "fourth"},
+                ]
+            },
+        )
+
+        assert res == (
+            "error",
+            "ERROR - old_str not found in /workspace/test_repo/lines.txt: 'line 4'. No files were changed",
+        )
+        self.assert_file_content("lines.txt", "line 1\nline 2\nline 3\n")
+
+    def test_edit_files_invalid_edit(self):
+        self.write_numbered_lines("lines.txt", 3)
+
+        res = execute_tool_call(
+            "edit_files",
+            {
+                "edits": [
+                    {"path": "/workspace/test_repo/lines.txt", "old_str": "line 1", "new_str": "first"},
+                    {"path": "/workspace/test_repo/missing.txt", "old_str": "a", "new_str": "b"},
+                ]
+            },
+        )
+
+        assert res[0] == "error"
+        assert res[1].startswith("ERROR - Edit 2: File /workspace/test_repo/missing.txt does not exist")
+        self.assert_file_content("lines.txt", "line 1\nline 2\nline 3\n")
+
+    def test_edit_files_needs_old_str_or_lines(self):
+        self.write_numbered_lines("lines.txt", 3)
+
+        res = execute_tool_call(
+            "edit_files",
+            {"edits": [{"path": "/workspace/test_repo/lines.txt", "new_str": "first"}]},
+        )
+
+        assert res == ("error", "ERROR - Edit 1 must have either old_str or start_line")
+
+    def test_search_code(self):
+        with open(os.path.join(self.test_dir, "code.py"), "w") as f:
+            f.write("def find_me():\n    pass\n")
+        add_to_git(self.test_dir)
+
+        res = execute_tool_call(
+            "search_code", {"path": "/workspace/test_repo", "query": "def find_me"}
+        )
+
+        assert res == ("success", "Matches 1-1\n/workspace/test_repo/code.py:1: def find_me():")
+
+    def test_search_code_sees_edits(self, tmp_path):
+        repo = tmp_path / "repo"
+        os.makedirs(repo)
+        (repo / "code.py").write_text("x = 1\n")
+        add_to_git(str(repo))
+        workspace = Workspace(str(tmp_path))
+        search = {"path": "/workspace/repo", "query": r"[xy] = \d", "regex": "true"}
+        execute_tool_call("search_code", search, workspace)
+
+        execute_tool_call(
+            "edit_file",
+            {"path": "/workspace/repo/code.py", "new_str": "y = 2\n"},
+            workspace,
+        )
+
+        assert execute_tool_call("search_code", search, workspace) == (
+            "success",
+            "Matches 1-1\n/workspace/repo/code.py:1: y = 2",
+        )
+
+    def test_search_code_pages(self, monkeypatch):
+        monkeypatch.setattr(agent, "SEARCH_PAGE_SIZE", 2)
+        with open(os.path.join(self.test_dir, "code.py"), "w") as f:
+            f.write("match\n" * 3)
+        add_to_git(self.test_dir)
+        search = {"path": "/workspace/test_repo", "query": "match"}
+
+        first = execute_tool_call("search_code", search)
+        second = execute_tool_call("search_code", {**search, "page": 2})
+        third = execute_tool_call("search_code", {**search, "page": 3})
+
+        assert first[1].startswith("Matches 1-2. There are more matches, use page=2 to see them\n")
+        assert second == ("success", "Matches 3-3\n/workspace/test_repo/code.py:3: match")
+        assert third == ("success", "No more matches after page 2")
+
+    def test_search_code_invalid_regex(self):
+        add_to_git(self.test_dir)
+        workspace = Workspace(SANDBOX_DIR)
+
+        res = execute_tool_call(
+            "search_code",
+            {"path": "/workspace/test_repo", "query": "(", "regex": True},
+            workspace,
+        )
+
+        assert res[0] == "error"
+        assert res[1].startswith("ERROR - Invalid regex (:")
+        # Rejected without indexing the repo
+        assert not workspace._search_indexes
+
+    def test_find_definition(self):
+        with open(os.path.join(self.test_dir, "code.py"), "w") as f:
+            f.write("class Finder:\n    def find_me(self):\n        pass\n")
+        add_to_git(self.test_dir)
+
+        res = execute_tool_call(
+            "find_definition", {"path": "/workspace/test_repo", "name": "Finder.find_me"}
+        )
+
+        assert res == ("success", "/workspace/test_repo/code.py:2: function code.Finder.find_me")
+
+    def test_find_references_sees_edits(self, tmp_path):
+        repo = tmp_path / "repo"
+        os.makedirs(repo)
+        (repo / "code.py").write_text("def helper():\n    pass\n")
+        add_to_git(str(repo))
+        workspace = Workspace(str(tmp_path))
+        find = {"path": "/workspace/repo", "name": "helper"}
+        assert execute_tool_call("find_references", find, workspace) == (
+            "success",
+            "No references of helper found",
+        )
+
+        execute_tool_call(
+            "edit_file",
+            {"path": "/workspace/repo/code.py", "old_str": "    pass", "new_str": "    return helper()"},
+            workspace,
+        )
+
+        assert execute_tool_call("find_references", find, workspace) == (
+            "success",
+            "/workspace/repo/code.py:2: return helper()",
+        )
+
+    def write_numbered_lines(self, path: str, count: int) -> None:
+        with open(os.path.join(self.test_dir, path), "w") as f:
+            f.write("".join(f"line {i}\n" for i in range(1, count + 1)))
+
     def assert_file_content(self, path: str, expected_content: str) -> None:
         with open(os.path.join(self.test_dir, path), "r") as f:
             assert f.read() == expected_content
 
 
+class TestExecuteToolCalls:
+    def test_read_only_calls_run_concurrently(self, monkeypatch):
+        # Both calls have to be waiting at the barrier at the same time, otherwise it times out
+        barrier = threading.Barrier(2, timeout=5)
+
+        def fake_execute_tool_call(tool_name, tool_params, workspace=None):
+            barrier.wait()
+            return ("success", tool_params["path"])
+
+        monkeypatch.setattr(agent, "execute_tool_call", fake_execute_tool_call)
+
+        res = execute_tool_calls(
+            [("view_file", {"path": "a"}), ("list_files", {"path": "b"})]
+        )
+
+        assert res == [("success", "a"), ("success", "b")]
+
+    def test_edits_are_barriers(self, monkeypatch):
+        log = []
+        lock = threading.Lock()
+
+        def fake_execute_tool_call(tool_name, tool_params, workspace=None):
+            with lock:
+                log.append(tool_params["path"])
+            return ("success", tool_params["path"])
+
+        monkeypatch.setattr(agent, "execute_tool_call", fake_execute_tool_call)
+
+        res = execute_tool_calls(
+            [
+                ("view_file", {"path": "a"}),
+                ("view_file", {"path": "b"}),
+                ("edit_file", {"path": "c"}),
+                ("view_file", {"path": "d"}),
+            ]
+        )
+
+        assert res == [("success", p) for p in "abcd"]
+        assert sorted(log[:2]) == ["a", "b"]
+        assert log[2:] == ["c", "d"]
+
+    def test_exceptions_become_errors(self, monkeypatch):
+        def fake_execute_tool_call(tool_name, tool_params, workspace=None):
+            raise ValueError("boom")
+
+        monkeypatch.setattr(agent, "execute_tool_call", fake_execute_tool_call)
+
+        res = execute_tool_calls([("view_file", {}), ("view_file", {})])
+
+        assert res == [("error", "ERROR - Calling tool: view_file boom")] * 2
+
+
+class ScriptedClient:
+    """
+    Fake LlamaStackClient that replies with scripted responses and records the prompts it was sent.
+    The PR title and body are requested at the same time, so the body is always the last scripted response
+    """
+
+    class Response:
+        def __init__(self, content: str):
+            self.content = content
+
+    def __init__(self, responses: list[str]):
+        self.responses = list(responses)
+        self.prompts = []
+        self.inference = self
+        self.lock = threading.Lock()
+
+    def completion(self, model_id: str, content: str, **kwargs):
+        with self.lock:
+            self.prompts.append(content)
+            if content.endswith("## PR Body\n\n"):
+                return ScriptedClient.Response(self.responses.pop())
+            return ScriptedClient.Response(self.responses.pop(0))
+
+
+class TestRunAgent:
+    @pytest.fixture(autouse=True)
+    def setup_method(self):
+        self.test_dir = os.path.join(SANDBOX_DIR, "test_repo")
+        os.makedirs(self.test_dir)
+        with open(os.path.join(self.test_dir, "file.txt"), "w") as f:
+            f.write("old content")
+        add_to_git(self.test_dir)
+
+        yield
+
+        shutil.rmtree(self.test_dir)
+
+    def test_changes_made(self):
+        client = ScriptedClient(
+            [
+                '<tool>[view_file(path="/workspace/test_repo/file.txt")]</tool>',
+                '<tool>[edit_file(path="/workspace/test_repo/file.txt", old_str="old", new_str="new")]</tool>',
+                "<tool>[finish()]</tool>",
+                "Update file",
+                "Changed old to new",
+            ]
+        )
+
+        res = run_agent(client, "test_repo", "Issue title", "Issue body")
+
+        assert res == ("changes_made", "Update file", "Changed old to new")
+        assert "Result: old content" in client.prompts[1]
+        assert sum(prompt.endswith("## PR Body\n\n") for prompt in client.prompts) == 1
+        # Each prompt extends the previous one
+        for previous, prompt in zip(client.prompts[:3], client.prompts[1:4]):
+            assert prompt.startswith(previous)
+
+    def test_no_changes_made(self):
+        client = ScriptedClient(["<tool>[finish()]</tool>", "I could not fix it"])
+
+        res = run_agent(client, "test_repo", "Issue title", "Issue body")
+
+        assert res == ("no_changes_made", "I could not fix it", None)
+        # Nothing was written, so there's no PR title or body to ask for
+        assert len(client.prompts) == 2
+
+    def test_edits_that_change_nothing(self):
+        client = ScriptedClient(
+            [
+                '<tool>[edit_file(path="/workspace/test_repo/file.txt", old_str="old", new_str="old")]</tool>',
+                "<tool>[finish()]</tool>",
+                "Update file",
+                "I could not fix it",
+                "Changed nothing",
+            ]
+        )
+
+        res = run_agent(client, "test_repo", "Issue title", "Issue body")
+
+        assert res[0] == "no_changes_made"
+        assert any("explain your reasoning for not making any changes" in prompt for prompt in client.prompts)
+
+    def test_title_and_body_are_requested_concurrently(self):
+        client = AsyncScriptedClient(
+            [
+                '<tool>[edit_file(path="/workspace/test_repo/file.txt", old_str="old", new_str="new")]</tool>',
+                "<tool>[finish()]</tool>",
+                "Update file",
+                "Changed old to new",
+            ],
+            delay=0.5,
+        )
+
+        start = time.perf_counter()
+        res = asyncio.run(run_agent_async(client, "test_repo", "Issue title", "Issue body"))
+
+        assert res == ("changes_made", "Update file", "Changed old to new")
+        # Two iterations and one round of finalization
+        assert time.perf_counter() - start < 4 * 0.5
+
+
+
+class AsyncScriptedClient(ScriptedClient):
+    """ScriptedClient for run_agent_async. Each completion takes `delay` seconds"""
+
+    def __init__(self, responses: list[str], delay: float = 0):
+        super().__init__(responses)
+        self.delay = delay
+
+    async def completion(self, model_id: str, content: str, **kwargs):
+        await asyncio.sleep(self.delay)
+        return super().completion(model_id, content, **kwargs)
+
+
+class TestRunAgentAsync:
+    def test_changes_made(self, tmp_path):
+        repo_dir = tmp_path / "test_repo"
+        repo_dir.mkdir()
+        (repo_dir / "file.txt").write_text("old content")
+        add_to_git(str(repo_dir))
+        client = AsyncScriptedClient(
+            [
+                '<tool>[edit_file(path="/workspace/test_repo/file.txt", old_str="old", new_str="new")]</tool>',
+                "<tool>[finish()]</tool>",
+                "Update file",
+                "Changed old to new",
+            ]
+        )
+
+        res = asyncio.run(
+            run_agent_async(
+                client, "test_repo", "Issue title", "Issue body", workspace=Workspace(str(tmp_path))
+            )
+        )
+
+        assert res == ("changes_made", "Update file", "Changed old to new")
+        assert (repo_dir / "file.txt").read_text() == "new content"
+
+    def test_agents_share_one_event_loop(self, tmp_path):
+        agents = 20
+        delay = 0.2
+        workspaces = []
+        for i in range(agents):
+            repo_dir = tmp_path / str(i) / "test_repo"
+            repo_dir.mkdir(parents=True)
+            (repo_dir / "file.txt").write_text("content")
+            add_to_git(str(repo_dir))
+            workspaces.append(Workspace(str(tmp_path / str(i))))
+
+        async def run_all():
+            return await asyncio.gather(
+                *(
+                    run_agent_async(
+                        AsyncScriptedClient(["<tool>[finish()]</tool>", "Nothing to do"], delay),
+                        "test_repo",
+                        "Issue title",
+                        "Issue body",
+                        workspace=workspace,
+                    )
+                    for workspace in workspaces
+                )
+            )
+
+        start = time.perf_counter()
+        res = asyncio.run(run_all())
+
+        assert res == [("no_changes_made", "Nothing to do", None)] * agents
+        # Each agent waits 2 * delay on inference. Run one after the other, that would take 8s
+        assert time.perf_counter() - start < agents * 2 * delay / 2
+
+
 def add_to_git(dir: str) -> None:
     run(
-        f"cd {dir} && git init && git add . && git commit -m 'Initial commit'",
+        "git init && git add . && git commit -m 'Initial commit'",
         shell=True,
+        cwd=dir,
         check=True,
         capture_output=True,
     )
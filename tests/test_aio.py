@@ -0,0 +1,67 @@
+import asyncio
+import time
+import pytest
+from subprocess import CalledProcessError
+from llama_agent.aio import ThreadedClient, as_async_client, is_async_client, run_shell
+
+
+class SyncClient:
+    def __init__(self):
+        self.inference = self
+
+    def completion(self, **kwargs):
+        if kwargs.get("stream"):
+            return iter(["a", "b"])
+        return "response"
+
+
+class AsyncClient:
+    def __init__(self):
+        self.inference = self
+
+    async def completion(self, **kwargs):
+        return "response"
+
+
+class TestAsAsyncClient:
+    def test_wraps_sync_clients(self):
+        assert not is_async_client(SyncClient())
+        assert isinstance(as_async_client(SyncClient()), ThreadedClient)
+
+    def test_leaves_async_clients_alone(self):
+        client = AsyncClient()
+
+        assert is_async_client(client)
+        assert as_async_client(client) is client
+
+    def test_threaded_completion(self):
+        client = as_async_client(SyncClient())
+
+        async def complete():
+            response = await client.inference.completion(content="x")
+            stream = await client.inference.completion(content="x", stream=True)
+            return response, [chunk async for chunk in stream]
+
+        assert asyncio.run(complete()) == ("response", ["a", "b"])
+
+
+class TestRunShell:
+    def test_captures_output(self):
+        res = asyncio.run(run_shell("echo hello && echo oops >&2"))
+
+        assert res.returncode == 0
+        assert res.stdout == b"hello\n"
+        assert res.stderr == b"oops\n"
+
+    def test_check(self):
+        with pytest.raises(CalledProcessError):
+            asyncio.run(run_shell("exit 3", check=True))
+
+    def test_commands_run_concurrently(self):
+        async def run_many():
+            await asyncio.gather(*(run_shell("sleep 0.2") for _ in range(10)))
+
+        start = time.perf_counter()
+        asyncio.run(run_many())
+
+        assert time.perf_counter() - start < 1
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import sys
+import os
+import threading
+import time
+import pytest
+import llama_agent.batch as batch
+from llama_agent.batch import (
+    AsyncConcurrencyLimitedClient,
+    ConcurrencyLimitedClient,
+    JobOutput,
+    read_issue_urls,
+    job_id,
+    run_job,
+    run_job_async,
+)
+
+
+class FakeModels:
+    pass
+
+
+class FakeInference:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def completion(self, **kwargs):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.01)
+        with self.lock:
+            self.in_flight -= 1
+        if kwargs.get("stream"):
+            return iter(["a", "b"])
+        return "response"
+
+
+class FakeClient:
+    def __init__(self):
+        self.models = FakeModels()
+        self.inference = FakeInference()
+
+
+class TestConcurrencyLimitedClient:
+    def test_limits_requests_in_flight(self):
+        client = FakeClient()
+        limited = ConcurrencyLimitedClient(client, threading.BoundedSemaphore(2))
+
+        threads = [
+            threading.Thread(target=limited.inference.completion, kwargs={"content": "x"})
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert client.inference.max_in_flight <= 2
+
+    def test_stream_holds_slot_until_closed(self):
+        semaphore = threading.BoundedSemaphore(1)
+        limited = ConcurrencyLimitedClient(FakeClient(), semaphore)
+
+        stream = limited.inference.completion(content="x", stream=True)
+        assert not semaphore.acquire(blocking=False)
+
+        assert list(stream) == ["a", "b"]
+        assert semaphore.acquire(blocking=False)
+
+
+
+class FakeAsyncInference(FakeInference):
+    async def completion(self, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        if kwargs.get("stream"):
+            return FakeAsyncStream(["a", "b"])
+        return "response"
+
+
+class FakeAsyncStream:
+    def __init__(self, chunks: list[str]):
+        self.chunks = chunks
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+class FakeAsyncClient:
+    def __init__(self):
+        self.models = FakeModels()
+        self.inference = FakeAsyncInference()
+
+
+class TestAsyncConcurrencyLimitedClient:
+    def test_limits_requests_in_flight(self):
+        client = FakeAsyncClient()
+
+        async def run_all():
+            limited = AsyncConcurrencyLimitedClient(client, asyncio.Semaphore(2))
+            await asyncio.gather(*(limited.inference.completion(content="x") for _ in range(8)))
+
+        asyncio.run(run_all())
+
+        assert client.inference.max_in_flight == 2
+
+    def test_stream_holds_slot_until_read(self):
+        async def run():
+            semaphore = asyncio.Semaphore(1)
+            limited = AsyncConcurrencyLimitedClient(FakeAsyncClient(), semaphore)
+
+            stream = await limited.inference.completion(content="x", stream=True)
+            assert semaphore.locked()
+
+            assert [chunk async for chunk in stream] == ["a", "b"]
+            assert not semaphore.locked()
+
+        asyncio.run(run())
+
+
+class TestReadIssueUrls:
+    def test_combines_and_dedupes(self, tmp_path):
+        issues_file = tmp_path / "issues.txt"
+        issues_file.write_text(
+            "# nightly queue\n"
+            "https://github.com/owner/repo/issues/1\n"
+            "\n"
+            "https://github.com/owner/repo/issues/2\n"
+        )
+
+        res = read_issue_urls(
+            ["https://github.com/owner/repo/issues/2"], str(issues_file)
+        )
+
+        assert res == [
+            "https://github.com/owner/repo/issues/2",
+            "https://github.com/owner/repo/issues/1",
+        ]
+
+
+class TestRunJob:
+    def test_job_id(self):
+        assert job_id("https://github.com/owner/repo/issues/12") == "owner__repo__12"
+
+    def test_writes_result(self, tmp_path, monkeypatch):
+        def fake_solve_issue(client, github_api_key, issue_url, **options):
+            print("agent output")
+            return {"status": "changes_made", "pr_url": "https://example.com/pr/1", "branch": "b"}
+
+        monkeypatch.setattr(batch, "solve_issue", fake_solve_issue)
+
+        res = run_job(
+            "https://github.com/owner/repo/issues/12",
+            results_dir=str(tmp_path / "results"),
+        )
+
+        assert res["ok"]
+        assert res["pr_url"] == "https://example.com/pr/1"
+        with open(tmp_path / "results" / "owner__repo__12.json") as f:
+            assert json.load(f)["status"] == "changes_made"
+        with open(tmp_path / "results" / "owner__repo__12.log") as f:
+            assert f.read() == "agent output\n"
+
+    def test_records_failures(self, tmp_path, monkeypatch):
+        def fake_solve_issue(*args, **kwargs):
+            raise ValueError("Failed to create PR")
+
+        monkeypatch.setattr(batch, "solve_issue", fake_solve_issue)
+
+        res = run_job(
+            "https://github.com/owner/repo/issues/12",
+            results_dir=str(tmp_path / "results"),
+        )
+
+        assert not res["ok"]
+        assert res["error"] == "ValueError: Failed to create PR"
+
+    def test_invalid_url(self, tmp_path):
+        res = run_job("https://gitlab.com/owner/repo/issues/12", results_dir=str(tmp_path))
+
+        assert not res["ok"]
+        assert "Expected github.com as the domain" in res["error"]
+
+
+class TestRunJobAsync:
+    def test_each_job_logs_to_its_own_file(self, tmp_path, monkeypatch):
+        async def fake_solve_issue_async(client, github_api_key, issue_url, github=None, **options):
+            for i in range(3):
+                print(f"{issue_url} step {i}")
+                await asyncio.sleep(0)
+            return {"status": "changes_made", "pr_url": f"{issue_url}/pr", "branch": "b"}
+
+        monkeypatch.setattr(batch, "solve_issue_async", fake_solve_issue_async)
+        issue_urls = [f"https://github.com/owner/repo/issues/{i}" for i in range(3)]
+        results_dir = str(tmp_path / "results")
+
+        async def run_all():
+            return await asyncio.gather(
+                *(run_job_async(issue_url, None, None, results_dir=results_dir) for issue_url in issue_urls)
+            )
+
+        monkeypatch.setattr(sys, "stdout", JobOutput(sys.stdout))
+        res = asyncio.run(run_all())
+
+        assert all(result["ok"] for result in res)
+        for i, issue_url in enumerate(issue_urls):
+            with open(tmp_path / "results" / f"owner__repo__{i}.log") as f:
+                assert f.read() == "".join(f"{issue_url} step {step}\n" for step in range(3))
+
+    def test_records_failures(self, tmp_path, monkeypatch):
+        async def fake_solve_issue_async(*args, **kwargs):
+            raise ValueError("Failed to create PR")
+
+        monkeypatch.setattr(batch, "solve_issue_async", fake_solve_issue_async)
+
+        res = asyncio.run(
+            run_job_async(
+                "https://github.com/owner/repo/issues/12", None, None, results_dir=str(tmp_path)
+            )
+        )
+
+        assert not res["ok"]
+        assert res["error"] == "ValueError: Failed to create PR"
+        with open(tmp_path / "owner__repo__12.log") as f:
+            assert "ValueError: Failed to create PR" in f.read()
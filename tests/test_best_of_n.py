@@ -0,0 +1,170 @@
+import asyncio
+import os
+import time
+import pytest
+from llama_agent.agent import run_agent_async
+from llama_agent.best_of_n import (
+    Attempt,
+    collect_changes,
+    command_scorer,
+    diff_scorer,
+    syntax_scorer,
+    working_copy,
+)
+from llama_agent.workspace import Workspace
+from tests.test_agent import add_to_git
+
+
+class TemperatureClient:
+    """
+    Fake async client that behaves differently at each temperature:
+        greedy: thinks for a long time, then finishes without changes
+        0.7:    edits the file, then finishes
+        1.0:    finishes straight away without changes
+    """
+
+    class Response:
+        def __init__(self, content: str):
+            self.content = content
+
+    def __init__(self, slow_delay: float = 10):
+        self.slow_delay = slow_delay
+        self.inference = self
+
+    async def completion(self, model_id: str, content: str, sampling_params=None, **kwargs):
+        if sampling_params is None:
+            # Finalization
+            if content.rstrip().endswith("## PR Body"):
+                return self.Response("Changed old to new")
+            if "explain your reasoning for not making any changes" in content:
+                return self.Response("Nothing to change")
+            return self.Response("Update file")
+
+        temperature = sampling_params["strategy"].get("temperature", 0)
+        if temperature == 0:
+            await asyncio.sleep(self.slow_delay)
+        elif temperature == 0.7 and "File successfully updated" not in content:
+            return self.Response(
+                '<tool>[edit_file(path="/workspace/test_repo/file.py", old_str="old", new_str="new")]</tool>'
+            )
+        return self.Response("<tool>[finish()]</tool>")
+
+
+@pytest.fixture
+def repo_dir(tmp_path):
+    # Spaces and shell metacharacters in the path mustn't break commands run in the repo
+    repo_dir = tmp_path / "my sandbox; $(touch pwned)" / "test_repo"
+    repo_dir.mkdir(parents=True)
+    (repo_dir / "file.py").write_text("x = 'old'\n")
+    add_to_git(str(repo_dir))
+    return repo_dir
+
+
+class TestWorkingCopy:
+    def test_checks_out_head_and_cleans_up(self, repo_dir, tmp_path):
+        async def use():
+            async with working_copy(str(repo_dir), str(tmp_path / "attempts")) as sandbox_dir:
+                copy = os.path.join(sandbox_dir, "test_repo")
+                with open(os.path.join(copy, "file.py")) as f:
+                    assert f.read() == "x = 'old'\n"
+                with open(os.path.join(copy, "file.py"), "w") as f:
+                    f.write("x = 'new'\n")
+                return sandbox_dir
+
+        sandbox_dir = asyncio.run(use())
+
+        assert not os.path.exists(sandbox_dir)
+        assert (repo_dir / "file.py").read_text() == "x = 'old'\n"
+
+
+class TestScorers:
+    def score(self, repo_dir, tmp_path, content: str, scorer):
+        async def run():
+            async with working_copy(str(repo_dir), str(repo_dir.parent / "attempts")) as sandbox_dir:
+                attempt = Attempt(1, sandbox_dir, os.path.join(sandbox_dir, "test_repo"), 0)
+                if content is not None:
+                    with open(os.path.join(attempt.repo_path, "file.py"), "w") as f:
+                        f.write(content)
+                await collect_changes(attempt)
+                return await scorer(attempt)
+
+        return asyncio.run(run())
+
+    def test_no_changes(self, repo_dir, tmp_path):
+        assert self.score(repo_dir, tmp_path, None, diff_scorer) == 0
+        assert self.score(repo_dir, tmp_path, None, syntax_scorer) == 0
+
+    def test_syntax(self, repo_dir, tmp_path):
+        assert self.score(repo_dir, tmp_path, "x = 'new'\n", syntax_scorer) == 1
+        assert self.score(repo_dir, tmp_path, "x = (\n", syntax_scorer) == 0.5
+
+    def test_command(self, repo_dir, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        scorer = command_scorer("grep -q new file.py")
+
+        assert self.score(repo_dir, tmp_path, "x = 'new'\n", scorer) == 1
+        assert self.score(repo_dir, tmp_path, "x = 'other'\n", scorer) == 0.5
+        # The repo path wasn't run as part of the command
+        assert not (tmp_path / "pwned").exists()
+
+    def test_command_timeout_kills_the_command(self, repo_dir, tmp_path):
+        pid_file = tmp_path / "pid"
+        # The shell starts sleep in the background, so it has to be killed as part of the group
+        scorer = command_scorer(f"sleep 30 & echo $! > {pid_file}; wait", timeout=0.5)
+
+        start = time.perf_counter()
+        assert self.score(repo_dir, tmp_path, "x = 'new'\n", scorer) == 0.5
+
+        assert time.perf_counter() - start < 5
+        assert not is_running(int(pid_file.read_text()))
+
+
+def is_running(pid: int) -> bool:
+    """True if the process exists and isn't a zombie waiting to be reaped"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+class TestBestOfN:
+    def test_first_qualifying_attempt_wins(self, repo_dir, tmp_path):
+        client = TemperatureClient(slow_delay=10)
+
+        start = time.perf_counter()
+        res = asyncio.run(
+            run_agent_async(
+                client,
+                "test_repo",
+                "Issue title",
+                "Issue body",
+                workspace=Workspace(str(repo_dir.parent)),
+                attempts=3,
+                attempts_dir=str(tmp_path / "attempts"),
+            )
+        )
+
+        assert res == ("changes_made", "Update file", "Changed old to new")
+        assert (repo_dir / "file.py").read_text() == "x = 'new'\n"
+        # The slow greedy attempt was cancelled rather than waited for
+        assert time.perf_counter() - start < 5
+        assert os.listdir(tmp_path / "attempts") == []
+
+    def test_best_attempt_wins_when_none_qualify(self, repo_dir):
+        # Without attempts_dir, the working copies go next to the repo
+        res = asyncio.run(
+            run_agent_async(
+                TemperatureClient(slow_delay=0),
+                "test_repo",
+                "Issue title",
+                "Issue body",
+                workspace=Workspace(str(repo_dir.parent)),
+                attempts=2,
+                temperatures=[0.0, 1.0],
+            )
+        )
+
+        assert res == ("no_changes_made", "Nothing to change", None)
+        assert (repo_dir / "file.py").read_text() == "x = 'old'\n"
+        assert os.listdir(repo_dir.parent / ".attempts") == []
@@ -0,0 +1,161 @@
+import os
+import shutil
+import pytest
+from llama_agent.agent import SANDBOX_DIR, run_agent
+from llama_agent.completion_cache import (
+    CachingClient,
+    CompletionCache,
+    CompletionCacheMiss,
+    completion_key,
+)
+from llama_agent.streaming import stream_completion
+from tests.test_agent import ScriptedClient, add_to_git
+
+
+class Chunk:
+    def __init__(self, delta: str):
+        self.delta = delta
+
+
+class StreamingClient:
+    """Fake client that streams its scripted responses a few characters at a time"""
+
+    def __init__(self, responses: list[str]):
+        self.responses = list(responses)
+        self.inference = self
+        self.calls = 0
+
+    def completion(self, model_id: str, content: str, stream: bool = False, **kwargs):
+        self.calls += 1
+        response = self.responses.pop(0)
+        return iter([Chunk(response[i : i + 3]) for i in range(0, len(response), 3)])
+
+
+class TestCompletionKey:
+    def test_ignores_stream(self):
+        assert completion_key({"model_id": "m", "content": "p"}) == completion_key(
+            {"model_id": "m", "content": "p", "stream": True}
+        )
+
+    def test_depends_on_model_prompt_and_sampling_params(self):
+        keys = {
+            completion_key({"model_id": "m", "content": "p"}),
+            completion_key({"model_id": "other", "content": "p"}),
+            completion_key({"model_id": "m", "content": "other"}),
+            completion_key({"model_id": "m", "content": "p", "sampling_params": {"stop": ["</tool>"]}}),
+        }
+        assert len(keys) == 4
+
+
+class TestCachingClient:
+    @pytest.fixture(autouse=True)
+    def setup_method(self, tmp_path):
+        self.cache = CompletionCache(str(tmp_path / "completions.sqlite"))
+
+    def test_record_then_replay(self):
+        recorder = CachingClient(ScriptedClient(["hello"]), self.cache, "record")
+        recorded = recorder.inference.completion(model_id="m", content="prompt")
+
+        replayed = CachingClient(None, self.cache, "replay").inference.completion(
+            model_id="m", content="prompt"
+        )
+
+        assert recorded.content == replayed.content == "hello"
+
+    def test_replay_miss(self):
+        replayer = CachingClient(None, self.cache, "replay")
+
+        with pytest.raises(CompletionCacheMiss):
+            replayer.completion(model_id="m", content="never recorded")
+        assert replayer.misses == 1
+
+    def test_record_replaces_saved_response(self):
+        CachingClient(ScriptedClient(["first"]), self.cache, "record").completion(model_id="m", content="p")
+        CachingClient(ScriptedClient(["second"]), self.cache, "record").completion(model_id="m", content="p")
+
+        assert CachingClient(None, self.cache, "replay").completion(model_id="m", content="p").content == "second"
+        assert len(self.cache) == 1
+
+    def test_passthrough_leaves_cache_alone(self):
+        client = CachingClient(ScriptedClient(["hello"]), self.cache, "passthrough")
+
+        assert client.completion(model_id="m", content="p").content == "hello"
+        assert len(self.cache) == 0
+
+    def test_record_and_replay_stream(self):
+        response = '<thinking>Look</thinking><tool>[view_file(path="/workspace/a.py")]</tool> and more'
+        recorder = CachingClient(StreamingClient([response]), self.cache, "record")
+        recorded = stream_completion(recorder, "m", "prompt")
+
+        replayed = stream_completion(CachingClient(None, self.cache, "replay"), "m", "prompt")
+
+        assert recorded.stopped_early and replayed.stopped_early
+        assert recorded.content == replayed.content == response[: -len(" and more")]
+
+    def test_failed_stream_is_not_saved(self):
+        class BrokenClient:
+            def __init__(self):
+                self.inference = self
+
+            def completion(self, **kwargs):
+                def chunks():
+                    yield Chunk("<tool>[fin")
+                    raise ConnectionError("connection reset")
+
+                return chunks()
+
+        recorder = CachingClient(BrokenClient(), self.cache, "record")
+
+        with pytest.raises(ConnectionError):
+            stream_completion(recorder, "m", "prompt")
+        assert len(self.cache) == 0
+
+    def test_needs_a_client_to_record(self):
+        with pytest.raises(ValueError, match="needs a client"):
+            CachingClient(None, self.cache, "record")
+
+    def test_unknown_mode(self):
+        with pytest.raises(ValueError, match="Unknown completion cache mode"):
+            CachingClient(None, self.cache, "refresh")
+
+
+class TestReplayRunAgent:
+    @pytest.fixture(autouse=True)
+    def setup_method(self, tmp_path):
+        self.cache = CompletionCache(str(tmp_path / "completions.sqlite"))
+        self.test_dir = os.path.join(SANDBOX_DIR, "test_repo")
+        self.reset_repo()
+
+        yield
+
+        shutil.rmtree(self.test_dir)
+
+    def reset_repo(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        os.makedirs(self.test_dir)
+        with open(os.path.join(self.test_dir, "file.txt"), "w") as f:
+            f.write("old content")
+        add_to_git(self.test_dir)
+
+    def test_replayed_run_matches_recorded_run(self):
+        scripted = ScriptedClient(
+            [
+                '<tool>[view_file(path="/workspace/test_repo/file.txt")]</tool>',
+                '<tool>[edit_file(path="/workspace/test_repo/file.txt", old_str="old", new_str="new")]</tool>',
+                "<tool>[finish()]</tool>",
+                "Update file",
+                "Changed old to new",
+            ]
+        )
+        recorded = run_agent(
+            CachingClient(scripted, self.cache, "record"), "test_repo", "Issue title", "Issue body"
+        )
+        self.reset_repo()
+
+        replayed = run_agent(
+            CachingClient(None, self.cache, "replay"), "test_repo", "Issue title", "Issue body"
+        )
+
+        assert replayed == recorded == ("changes_made", "Update file", "Changed old to new")
+        with open(os.path.join(self.test_dir, "file.txt")) as f:
+            assert f.read() == "new content"
@@ -0,0 +1,158 @@
+from llama_agent.context import ContextBudget
+from llama_agent.conversation import Conversation
+
+
+def add_tool_result(conversation: Conversation, tool_name: str, path: str, result: str):
+    conversation.append(
+        "tool",
+        f'Executing tool call: [{tool_name}(path="{path}")]\nResult: {result}\n',
+        {"tool_name": tool_name, "tool_params": {"path": path}, "result": "success"},
+    )
+
+
+def add_tool_call(conversation: Conversation, tool_name: str, params: dict, result: str):
+    conversation.append(
+        "tool",
+        f"Executing tool call: [{tool_name}(...)]\nResult: {result}\n",
+        {"tool_name": tool_name, "tool_params": params, "result": "success"},
+    )
+
+
+def big_file(name: str, functions: int = 200) -> str:
+    return "\n".join(
+        f"def {name}_{i}():\n    return {i}" for i in range(functions)
+    )
+
+
+class TestContextBudget:
+    def test_under_budget_is_untouched(self):
+        conversation = Conversation()
+        add_tool_result(conversation, "view_file", "/workspace/a.py", big_file("a"))
+        before = conversation.render()
+
+        saved = ContextBudget(max_tokens=100_000).enforce(conversation)
+
+        assert saved == 0
+        assert conversation.render() == before
+
+    def test_folds_repeated_views(self):
+        conversation = Conversation()
+        add_tool_result(conversation, "view_file", "/workspace/a.py", big_file("a"))
+        add_tool_result(conversation, "view_file", "/workspace/a.py", big_file("a"))
+        budget = ContextBudget(
+            max_tokens=conversation.prompt_token_count() - 1, keep_recent=0
+        )
+
+        saved = budget.enforce(conversation)
+
+        assert saved > 0
+        assert "viewed again later" in conversation.segments[0].content
+        # The latest view is kept in full
+        assert conversation.segments[1].content.endswith("return 199\n")
+
+    def test_does_not_fold_views_of_different_lines(self):
+        conversation = Conversation()
+        for start_line in (1, 201):
+            conversation.append(
+                "tool",
+                f"Executing tool call: [view_file(...)]\nResult: {big_file(f'a{start_line}', 100)}\n",
+                {
+                    "tool_name": "view_file",
+                    "tool_params": {"path": "/workspace/a.py", "start_line": start_line},
+                    "result": "success",
+                },
+            )
+        budget = ContextBudget(
+            max_tokens=conversation.prompt_token_count() - 1, keep_recent=0
+        )
+
+        budget.enforce(conversation)
+
+        assert "viewed again later" not in conversation.segments[0].content
+
+    def test_elides_oldest_files_first(self):
+        conversation = Conversation()
+        add_tool_result(conversation, "view_file", "/workspace/a.py", big_file("a"))
+        add_tool_result(conversation, "view_file", "/workspace/b.py", big_file("b"))
+        add_tool_result(conversation, "view_file", "/workspace/c.py", big_file("c"))
+        budget = ContextBudget(
+            max_tokens=conversation.prompt_token_count() - 100, keep_recent=1
+        )
+
+        budget.enforce(conversation)
+
+        a, b, c = conversation.segments
+        assert "File body elided" in a.content
+        assert 'Executing tool call: [view_file(path="/workspace/a.py")]' in a.content
+        assert "Outline:" in a.content
+        assert "def a_30():" in a.content
+        assert "def a_150():" not in a.content
+        # Already under budget after eliding the first file
+        assert "File body elided" not in b.content
+        assert "File body elided" not in c.content
+        assert conversation.token_count == sum(s.token_count for s in conversation) + 1
+
+    def test_keeps_recent_results(self):
+        conversation = Conversation()
+        add_tool_result(conversation, "view_file", "/workspace/a.py", big_file("a"))
+        budget = ContextBudget(max_tokens=10, keep_recent=1)
+
+        saved = budget.enforce(conversation)
+
+        assert saved == 0
+
+    def test_elides_listings(self):
+        conversation = Conversation()
+        listing = "\n".join(f"file_{i}.py" for i in range(500))
+        add_tool_result(conversation, "list_files", "/workspace", listing)
+        add_tool_result(conversation, "view_file", "/workspace/a.py", "short")
+        budget = ContextBudget(max_tokens=100, keep_recent=1)
+
+        budget.enforce(conversation)
+
+        content = conversation.segments[0].content
+        assert "470 entries elided" in content
+        assert "file_0.py" in content
+        assert "file_499.py" in content
+
+    def test_never_compacts_edits(self):
+        conversation = Conversation()
+        add_tool_result(conversation, "edit_file", "/workspace/a.py", big_file("a"))
+        add_tool_result(conversation, "view_file", "/workspace/b.py", "short")
+        budget = ContextBudget(max_tokens=10, keep_recent=0)
+
+        assert budget.enforce(conversation) == 0
+
+    def test_folds_repeated_searches(self):
+        conversation = Conversation()
+        search = {"path": "/workspace", "query": "def a_"}
+        add_tool_call(conversation, "search_code", search, big_file("a"))
+        add_tool_call(conversation, "search_code", {**search, "page": 2}, big_file("b"))
+        add_tool_call(conversation, "search_code", search, big_file("a"))
+        budget = ContextBudget(
+            max_tokens=conversation.prompt_token_count() - 1, keep_recent=0
+        )
+
+        budget.enforce(conversation)
+
+        first, other_page, latest = conversation.segments
+        assert "same call is made again later" in first.content
+        assert "same call is made again later" not in other_page.content
+        assert latest.content.endswith("return 199\n")
+
+    def test_elides_search_and_symbol_results(self):
+        conversation = Conversation()
+        matches = "\n".join(f"/workspace/repo/file_{i}.py:1: import os" for i in range(300))
+        add_tool_call(conversation, "search_code", {"path": "/workspace", "query": "import os"}, matches)
+        add_tool_call(conversation, "find_references", {"path": "/workspace", "name": "os"}, matches)
+        add_tool_call(conversation, "find_definition", {"path": "/workspace", "name": "main"}, matches)
+        add_tool_result(conversation, "view_file", "/workspace/a.py", "short")
+        budget = ContextBudget(max_tokens=100, keep_recent=1)
+
+        budget.enforce(conversation)
+
+        search, references, definitions, _ = conversation.segments
+        assert "270 matches elided to save context. Run the search again to see them" in search.content
+        assert "270 references elided" in references.content
+        assert "270 definitions elided" in definitions.content
+        assert "file_299.py" in search.content
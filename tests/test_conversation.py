@@ -0,0 +1,92 @@
+import pytest
+from llama_agent.conversation import (
+    Conversation,
+    Segment,
+    chat_message,
+    encode,
+    header,
+)
+
+
+class TestSegment:
+    def test_renders_chat_message(self):
+        segment = Segment("user", "Hello")
+
+        assert segment.text == chat_message("user", "Hello")
+        assert list(segment.tokens) == encode(chat_message("user", "Hello"))
+
+    def test_immutable(self):
+        segment = Segment("user", "Hello")
+
+        with pytest.raises(AttributeError):
+            segment.content = "Goodbye"
+
+    def test_metadata_is_copied(self):
+        segment = Segment("tool", "Result", {"tool_name": "view_file"})
+
+        segment.metadata["tool_name"] = "edit_file"
+
+        assert segment.metadata == {"tool_name": "view_file"}
+
+
+class TestConversation:
+    def test_prompt_matches_string_concatenation(self):
+        conversation = Conversation()
+        conversation.append("system", "You are an expert")
+        conversation.append("user", "Fix the bug")
+
+        expected = (
+            "<|begin_of_text|>"
+            + chat_message("system", "You are an expert")
+            + chat_message("user", "Fix the bug")
+            + header("assistant")
+            + "## PR Body\n\n"
+        )
+        assert conversation.prompt("assistant", prefill="## PR Body\n\n") == expected
+
+    def test_token_count_matches_tokenizing_the_whole_prompt(self):
+        conversation = Conversation()
+        conversation.append("system", "You are an expert")
+        conversation.append("user", "def foo():\n    return 1\n")
+        conversation.append("assistant", '<tool>[view_file(path="/workspace/a.py")]</tool>')
+
+        assert conversation.token_count == len(encode(conversation.render()))
+        assert conversation.prompt_token_count("assistant") == len(
+            encode(conversation.prompt("assistant"))
+        )
+
+    def test_prefix_hash_is_stable(self):
+        a = Conversation()
+        b = Conversation()
+        for conversation in (a, b):
+            conversation.append("system", "You are an expert")
+            conversation.append("user", "Fix the bug")
+
+        assert a.prefix_hash() == b.prefix_hash()
+
+        a.append("assistant", "First")
+        b.append("assistant", "Second")
+
+        assert a.prefix_hash(2) == b.prefix_hash(2)
+        assert a.prefix_hash() != b.prefix_hash()
+
+    def test_fork(self):
+        conversation = Conversation()
+        conversation.append("system", "You are an expert")
+        fork = conversation.fork()
+
+        fork.append("user", "Write a PR title")
+        conversation.append("user", "Write a PR body")
+
+        assert len(fork) == len(conversation) == 2
+        assert fork.segments[0] is conversation.segments[0]
+        assert fork.prefix_hash(1) == conversation.prefix_hash(1)
+        assert fork.prefix_hash() != conversation.prefix_hash()
+        assert fork.token_count == len(encode(fork.render()))
+
+    def test_empty_conversation(self):
+        conversation = Conversation()
+
+        assert conversation.render() == "<|begin_of_text|>"
+        assert conversation.token_count == 1
+        assert len(conversation) == 0
@@ -0,0 +1,133 @@
+import os
+import pytest
+import llama_agent.edits as edits_module
+from llama_agent.edits import Edit, apply_edits, atomic_write, split_lines
+
+
+class TestEdit:
+    def test_replace(self):
+        edit = Edit("/workspace/a.py", "a.py", "x = 2", old_str="x = 1")
+
+        assert edit.apply("x = 1\ny = 1\n") == "x = 2\ny = 1\n"
+
+    def test_replace_not_found(self):
+        edit = Edit("/workspace/a.py", "a.py", "x = 2", old_str="z = 1")
+
+        with pytest.raises(ValueError, match="old_str not found in /workspace/a.py"):
+            edit.apply("x = 1\n")
+
+    def test_replace_ambiguous(self):
+        edit = Edit("/workspace/a.py", "a.py", "x = 2", old_str="x = 1")
+
+        with pytest.raises(ValueError, match="appears 2 times"):
+            edit.apply("x = 1\nx = 1\n")
+
+    def test_replace_lines(self):
+        edit = Edit("/workspace/a.py", "a.py", "two\nthree", start_line=2, end_line=3)
+
+        assert edit.apply("1\n2\n3\n4\n") == "1\ntwo\nthree\n4\n"
+
+    def test_replace_single_line(self):
+        edit = Edit("/workspace/a.py", "a.py", "last", start_line=2)
+
+        assert edit.apply("1\n2") == "1\nlast"
+
+    def test_delete_lines(self):
+        edit = Edit("/workspace/a.py", "a.py", "", start_line=1, end_line=2)
+
+        assert edit.apply("1\n2\n3\n") == "3\n"
+
+    def test_lines_out_of_range(self):
+        edit = Edit("/workspace/a.py", "a.py", "x", start_line=3, end_line=5)
+
+        with pytest.raises(ValueError, match="Lines 3-5 are out of range for /workspace/a.py, which has 4 lines"):
+            edit.apply("1\n2\n3\n4\n")
+
+    def test_split_lines(self):
+        assert split_lines("") == []
+        assert split_lines("a\r\nb") == ["a\r\n", "b"]
+        assert split_lines("a\n\n") == ["a\n", "\n"]
+
+
+class TestApplyEdits:
+    @pytest.fixture(autouse=True)
+    def setup_method(self, tmp_path):
+        self.tmp_path = tmp_path
+        self.a = self.write("a.py", "x = 1\ny = 1\n")
+        self.b = self.write("b.py", "z = 1\n")
+
+    def write(self, name: str, content: str) -> str:
+        path = str(self.tmp_path / name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def read(self, path: str) -> str:
+        with open(path) as f:
+            return f.read()
+
+    def test_edits_several_files(self):
+        files = apply_edits(
+            [
+                Edit("a.py", self.a, "x = 2", old_str="x = 1"),
+                Edit("b.py", self.b, "z = 2", old_str="z = 1"),
+                Edit("a.py", self.a, "y = 2", start_line=2),
+            ]
+        )
+
+        assert files == [self.a, self.b]
+        assert self.read(self.a) == "x = 2\ny = 2\n"
+        assert self.read(self.b) == "z = 2\n"
+
+    def test_failed_edit_changes_nothing(self):
+        with pytest.raises(ValueError):
+            apply_edits(
+                [
+                    Edit("a.py", self.a, "x = 2", old_str="x = 1"),
+                    Edit("b.py", self.b, "z = 2", old_str="missing"),
+                ]
+            )
+
+        assert self.read(self.a) == "x = 1\ny = 1\n"
+        assert self.read(self.b) == "z = 1\n"
+
+    def test_failed_write_restores_files(self, monkeypatch):
+        original_replace = os.replace
+        calls = []
+
+        def flaky_replace(src, dst):
+            calls.append(dst)
+            # Fail moving the second file into place
+            if len(calls) == 2:
+                raise OSError("disk full")
+            original_replace(src, dst)
+
+        monkeypatch.setattr(edits_module.os, "replace", flaky_replace)
+
+        with pytest.raises(OSError, match="disk full"):
+            apply_edits(
+                [
+                    Edit("a.py", self.a, "x = 2", old_str="x = 1"),
+                    Edit("b.py", self.b, "z = 2", old_str="z = 1"),
+                ]
+            )
+
+        assert self.read(self.a) == "x = 1\ny = 1\n"
+        assert self.read(self.b) == "z = 1\n"
+        # No temp files left behind
+        assert sorted(os.listdir(self.tmp_path)) == ["a.py", "b.py"]
+
+
+class TestAtomicWrite:
+    def test_keeps_permissions(self, tmp_path):
+        path = str(tmp_path / "script.sh")
+        with open(path, "w") as f:
+            f.write("echo old")
+        os.chmod(path, 0o755)
+
+        atomic_write(path, "echo new")
+
+        with open(path) as f:
+            assert f.read() == "echo new"
+        assert os.stat(path).st_mode & 0o777 == 0o755
+        assert os.listdir(tmp_path) == ["script.sh"]
@@ -0,0 +1,115 @@
+import asyncio
+import os
+import time
+from subprocess import run
+from llama_agent.agent import MODEL_ID, run_agent, run_agent_async
+from llama_agent.completion_cache import CachingClient, CompletionCache
+from llama_agent.streaming import stream_completion_async
+from llama_agent.workspace import Workspace
+from tests.fake_inference import FakeInferenceClient, LatencyModel, recorded, scripted_agent
+from tests.test_agent import ScriptedClient, add_to_git
+
+STEPS = [
+    '<tool>[edit_file(path="/workspace/repo/file.txt", old_str="old", new_str="new")]</tool>',
+    "<tool>[finish()]</tool>",
+]
+
+
+def make_repo(path) -> str:
+    repo_dir = path / "repo"
+    repo_dir.mkdir(parents=True)
+    (repo_dir / "file.txt").write_text("old content")
+    add_to_git(str(repo_dir))
+    return str(path)
+
+
+class TestFakeInferenceClient:
+    def test_latency_model(self):
+        client = FakeInferenceClient(
+            lambda request: "one two three", LatencyModel(time_to_first_token=0.05, decode_per_token=0.05)
+        )
+
+        start = time.perf_counter()
+        response = asyncio.run(client.inference.completion(model_id=MODEL_ID, content="prompt"))
+
+        assert response.content == "one two three"
+        [call] = client.calls
+        assert call.completion_tokens == 3
+        assert call.prompt_tokens == 1
+        assert time.perf_counter() - start >= 0.05 + 3 * 0.05
+
+    def test_stream_stops_generating_when_closed(self):
+        client = FakeInferenceClient(
+            lambda request: "<tool>[finish()]</tool>" + " and more" * 100, LatencyModel(decode_per_token=0.001)
+        )
+
+        response = asyncio.run(stream_completion_async(client, MODEL_ID, "prompt"))
+
+        assert response.content == "<tool>[finish()]</tool>"
+        assert response.stopped_early
+        assert client.calls[0].completion_tokens < 20
+
+    def test_stop_sequences(self):
+        client = FakeInferenceClient(lambda request: "<tool>[finish()]</tool> trailing")
+
+        response = asyncio.run(
+            stream_completion_async(client, MODEL_ID, "prompt", stop_at_tool_call=False, use_stop_sequences=True)
+        )
+
+        assert response.content == "<tool>[finish()]</tool>"
+
+    def test_slots_queue_requests(self):
+        client = FakeInferenceClient(lambda request: "ok", LatencyModel(time_to_first_token=0.1), slots=1)
+
+        async def run():
+            await asyncio.gather(
+                *(client.inference.completion(model_id=MODEL_ID, content="prompt") for _ in range(3))
+            )
+
+        asyncio.run(run())
+
+        assert sorted(round(call.queued, 1) for call in client.calls) == [0.0, 0.1, 0.2]
+
+
+class TestScriptedAgent:
+    def test_agents_share_one_script(self, tmp_path):
+        client = FakeInferenceClient(scripted_agent(STEPS), LatencyModel(time_to_first_token=0.01))
+        sandboxes = [make_repo(tmp_path / str(i)) for i in range(3)]
+
+        async def run():
+            return await asyncio.gather(
+                *(
+                    run_agent_async(client, "repo", "Issue title", "Issue body", workspace=Workspace(sandbox_dir))
+                    for sandbox_dir in sandboxes
+                )
+            )
+
+        results = asyncio.run(run())
+
+        assert results == [("changes_made", "Update file", "Changed old to new")] * 3
+        # Two turns, then the title and body
+        assert len(client.calls) == 3 * 4
+
+    def test_explains_no_changes(self, tmp_path):
+        client = FakeInferenceClient(scripted_agent(["<tool>[finish()]</tool>"]))
+
+        res = run_agent(client, "repo", "Issue title", "Issue body", workspace=Workspace(make_repo(tmp_path)))
+
+        assert res == ("no_changes_made", "Nothing needed to change", None)
+
+
+def test_replays_recorded_completions(tmp_path):
+    cache = CompletionCache(str(tmp_path / "cache.sqlite"))
+    sandbox_dir = make_repo(tmp_path / "sandbox")
+    scripted = ScriptedClient([*STEPS, "Update file", "Changed old to new"])
+    run_agent(
+        CachingClient(scripted, cache, "record"), "repo", "Issue title", "Issue body", workspace=Workspace(sandbox_dir)
+    )
+    # The prompts include the repo's path, so replay in the same place
+    run(["git", "checkout", "--", "."], cwd=os.path.join(sandbox_dir, "repo"), check=True)
+
+    client = FakeInferenceClient(recorded(cache))
+    res = run_agent(client, "repo", "Issue title", "Issue body", workspace=Workspace(sandbox_dir))
+
+    assert res == ("changes_made", "Update file", "Changed old to new")
+    assert len(client.calls) == len(scripted.prompts)
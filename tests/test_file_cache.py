@@ -0,0 +1,100 @@
+import os
+import pytest
+from llama_agent.file_cache import FileCache
+
+
+class TestFileCache:
+    @pytest.fixture(autouse=True)
+    def setup_method(self, tmp_path):
+        self.tmp_path = tmp_path
+
+    def write(self, name: str, content: str) -> str:
+        path = str(self.tmp_path / name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def test_second_read_is_a_hit(self):
+        path = self.write("a.txt", "hello")
+        cache = FileCache()
+
+        assert cache.read(path) == "hello"
+        assert cache.read(path) == "hello"
+
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_keyed_by_resolved_path(self):
+        path = self.write("a.txt", "hello")
+        os.symlink(path, self.tmp_path / "link.txt")
+        cache = FileCache()
+
+        cache.read(path)
+        cache.read(str(self.tmp_path / "link.txt"))
+
+        assert cache.hits == 1
+        assert len(cache) == 1
+
+    def test_rereads_file_changed_on_disk(self):
+        path = self.write("a.txt", "hello")
+        cache = FileCache()
+        cache.read(path)
+
+        self.write("a.txt", "hello world")
+
+        assert cache.read(path) == "hello world"
+        assert cache.misses == 2
+
+    def test_rereads_file_changed_with_same_size(self):
+        path = self.write("a.txt", "hello")
+        cache = FileCache()
+        cache.read(path)
+        stat = os.stat(path)
+
+        self.write("a.txt", "HELLO")
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+        assert cache.read(path) == "HELLO"
+
+    def test_invalidate(self):
+        path = self.write("a.txt", "hello")
+        cache = FileCache()
+        cache.read(path)
+
+        cache.invalidate(path)
+
+        assert len(cache) == 0
+        assert cache.size == 0
+        cache.read(path)
+        assert cache.misses == 2
+
+    def test_evicts_least_recently_used(self):
+        a = self.write("a.txt", "a" * 40)
+        b = self.write("b.txt", "b" * 40)
+        c = self.write("c.txt", "c" * 40)
+        cache = FileCache(max_bytes=100)
+
+        cache.read(a)
+        cache.read(b)
+        cache.read(a)
+        cache.read(c)
+
+        assert cache.size == 80
+        cache.read(a)
+        assert cache.hits == 2
+        cache.read(b)
+        assert cache.misses == 4
+
+    def test_file_bigger_than_budget_is_not_cached(self):
+        path = self.write("big.txt", "x" * 200)
+        cache = FileCache(max_bytes=100)
+
+        assert cache.read(path) == "x" * 200
+
+        assert len(cache) == 0
+        assert cache.size == 0
+
+    def test_missing_file(self):
+        cache = FileCache()
+
+        with pytest.raises(FileNotFoundError):
+            cache.read(str(self.tmp_path / "missing.txt"))
@@ -0,0 +1,60 @@
+import pytest
+from llama_agent.file_view import LineIndex, clamp_range, is_binary, parse_line_range
+
+
+class TestLineIndex:
+    @pytest.fixture(autouse=True)
+    def setup_method(self, tmp_path):
+        self.path = str(tmp_path / "file.txt")
+
+    def index(self, content: bytes) -> LineIndex:
+        with open(self.path, "wb") as f:
+            f.write(content)
+        return LineIndex.from_file(self.path)
+
+    def test_line_count(self):
+        assert self.index(b"a\nb\nc\n").line_count == 3
+        assert self.index(b"a\nb\nc").line_count == 3
+        assert self.index(b"").line_count == 0
+        assert self.index(b"\n").line_count == 1
+
+    def test_read_lines(self):
+        index = self.index(b"one\ntwo\nthree\nfour")
+
+        assert index.read_lines(1, 1) == "one\n"
+        assert index.read_lines(2, 3) == "two\nthree\n"
+        assert index.read_lines(3, 4) == "three\nfour"
+
+    def test_invalid_utf8_is_replaced(self):
+        index = self.index(b"ok\n\xff\xfe bad\n")
+
+        assert index.read_lines(2, 2) == "�� bad\n"
+
+
+class TestIsBinary:
+    def test_is_binary(self, tmp_path):
+        (tmp_path / "image.png").write_bytes(b"\x89PNG\r\n\x1a\n\0\0\0\rIHDR")
+        (tmp_path / "text.py").write_text("print('hello')\n")
+
+        assert is_binary(str(tmp_path / "image.png"))
+        assert not is_binary(str(tmp_path / "text.py"))
+
+
+class TestParseLineRange:
+    def test_parses_strings_and_ints(self):
+        assert parse_line_range("10", 20) == (10, 20, None)
+        assert parse_line_range(None, None) == (None, None, None)
+
+    def test_invalid(self):
+        assert "must be integers" in parse_line_range("ten", None)[2]
+        assert "at least 1" in parse_line_range(0, None)[2]
+        assert "before start_line" in parse_line_range(10, 5)[2]
+
+
+class TestClampRange:
+    def test_defaults_to_a_page(self):
+        assert clamp_range(None, None, 1000, 100) == (1, 100)
+        assert clamp_range(50, None, 1000, 100) == (50, 149)
+
+    def test_clamps_to_end_of_file(self):
+        assert clamp_range(950, 2000, 1000, 100) == (950, 1000)
@@ -1,5 +1,8 @@
+import asyncio
+import time
 import pytest
-from llama_agent.github import Issue
+from llama_agent.github import GitHubCache, GitHubClient, Issue
+from tests.github_stub import StubGitHub, StubResponse
 
 class TestIssue:
     def test_basic_url(self):
@@ -31,3 +34,149 @@ class TestIssue:
     def test_issue_number_is_not_integer(self):
         with pytest.raises(ValueError, match="Expected an integer issue number"):
             Issue("https://github.com/owner/repo/issues/not_an_integer")
+
+
+@pytest.fixture
+def stub():
+    with StubGitHub() as stub:
+        yield stub
+
+
+def fetch(stub: StubGitHub, *requests, cache=None, **options):
+    """Send each (method, path, kwargs) request with one client and return the responses"""
+
+    async def run():
+        async with GitHubClient("token", base_url=stub.url, cache=cache, max_backoff=0.01, **options) as github:
+            return [await github.request(method, path, **kwargs) for method, path, kwargs in requests]
+
+    return asyncio.run(run())
+
+
+ISSUE_PATH = "/repos/owner/repo/issues/1"
+ISSUE = {"title": "Bug", "body": "It's broken"}
+
+
+class TestGitHubClient:
+    def test_sends_token(self, stub):
+        stub.route("GET", ISSUE_PATH, StubResponse(200, ISSUE))
+
+        (res,) = fetch(stub, ("GET", ISSUE_PATH, {}))
+
+        assert res.json() == ISSUE
+        assert stub.requests[0].headers["Authorization"] == "Bearer token"
+
+    def test_reuses_connections(self, stub):
+        stub.route("GET", ISSUE_PATH, StubResponse(200, ISSUE))
+
+        fetch(stub, *[("GET", ISSUE_PATH, {})] * 5)
+
+        assert len({request.client_address for request in stub.requests}) == 1
+
+    def test_conditional_get_from_cache(self, stub, tmp_path):
+        def issue(request):
+            if request.headers.get("If-None-Match") == '"v1"':
+                return StubResponse(304)
+            return StubResponse(200, ISSUE, headers={"ETag": '"v1"'})
+
+        stub.handle("GET", ISSUE_PATH, issue)
+        cache = GitHubCache(str(tmp_path / "github.sqlite"))
+
+        first, second = fetch(
+            stub, ("GET", ISSUE_PATH, {"cached": True}), ("GET", ISSUE_PATH, {"cached": True}), cache=cache
+        )
+
+        assert first.json() == second.json() == ISSUE
+        assert second.status_code == 200
+        assert "If-None-Match" not in stub.requests[0].headers
+        assert stub.requests[1].headers["If-None-Match"] == '"v1"'
+
+    def test_retries_after_retry_after(self, stub):
+        stub.route(
+            "GET",
+            ISSUE_PATH,
+            StubResponse(403, {"message": "You have exceeded a secondary rate limit"}, {"Retry-After": "1"}),
+            StubResponse(200, ISSUE),
+        )
+
+        (res,) = fetch(stub, ("GET", ISSUE_PATH, {}))
+
+        assert res.json() == ISSUE
+        assert len(stub.requests) == 2
+
+    def test_retries_after_primary_rate_limit_reset(self, stub):
+        stub.route(
+            "POST",
+            "/repos/owner/repo/pulls",
+            StubResponse(
+                403,
+                {"message": "API rate limit exceeded"},
+                {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(time.time()) + 60)},
+            ),
+            StubResponse(201, {"html_url": "https://github.com/owner/repo/pull/2"}, {"X-RateLimit-Remaining": "4999"}),
+        )
+
+        async def run():
+            async with GitHubClient("token", base_url=stub.url, max_backoff=0.01) as github:
+                response = await github.post("/repos/owner/repo/pulls", json={"title": "Fix"})
+                return response, github.rate_limit_remaining
+
+        res, remaining = asyncio.run(run())
+
+        assert res.status_code == 201
+        assert remaining == 4999
+        assert [request.json() for request in stub.requests] == [{"title": "Fix"}] * 2
+
+    def test_retries_server_errors(self, stub):
+        stub.route("GET", ISSUE_PATH, StubResponse(502), StubResponse(503), StubResponse(200, ISSUE))
+
+        (res,) = fetch(stub, ("GET", ISSUE_PATH, {}))
+
+        assert res.json() == ISSUE
+        assert len(stub.requests) == 3
+
+    def test_does_not_resend_posts_after_server_errors(self, stub):
+        stub.route(
+            "POST",
+            "/repos/owner/repo/pulls",
+            StubResponse(502),
+            StubResponse(422, {"message": "A pull request already exists for owner:branch."}),
+        )
+
+        (res,) = fetch(stub, ("POST", "/repos/owner/repo/pulls", {"json": {"title": "Fix"}}))
+
+        assert res.status_code == 502
+        assert len(stub.requests_to("POST", "/repos/owner/repo/pulls")) == 1
+
+    def test_retries_graphql_queries_after_server_errors(self, stub):
+        stub.route("POST", "/graphql", StubResponse(502), StubResponse(200, {"data": {"viewer": {"login": "me"}}}))
+
+        async def run():
+            async with GitHubClient("token", base_url=stub.url, max_backoff=0.01) as github:
+                return await github.graphql("query { viewer { login } }")
+
+        assert asyncio.run(run()) == {"viewer": {"login": "me"}}
+        assert len(stub.requests) == 2
+
+    def test_gives_up_after_max_retries(self, stub):
+        stub.route("GET", ISSUE_PATH, StubResponse(502))
+
+        (res,) = fetch(stub, ("GET", ISSUE_PATH, {}), max_retries=2)
+
+        assert res.status_code == 502
+        assert len(stub.requests) == 3
+
+    def test_does_not_retry_permission_errors(self, stub):
+        stub.route("GET", ISSUE_PATH, StubResponse(403, {"message": "Resource not accessible by integration"}))
+
+        (res,) = fetch(stub, ("GET", ISSUE_PATH, {}))
+
+        assert res.status_code == 403
+        assert len(stub.requests) == 1
+
+    def test_get_issue_error(self, stub):
+        async def run():
+            async with GitHubClient("token", base_url=stub.url) as github:
+                await github.get_issue("owner", "repo", 404)
+
+        with pytest.raises(ValueError, match="Failed to fetch issue"):
+            asyncio.run(run())
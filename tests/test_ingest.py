@@ -0,0 +1,185 @@
+import asyncio
+import json
+import pytest
+from llama_agent.github import GitHubClient
+from llama_agent.ingest import HandledIssues, fetch_issues, parse_repo, read_repos
+from tests.github_stub import StubGitHub, StubRequest, StubResponse
+
+
+class FakeGraphQL:
+    """
+    Answers issues_query from a fixed set of issues per repo, paginated like GitHub with cursors.
+    Repos it doesn't know resolve to null with a NOT_FOUND error
+    """
+
+    def __init__(self, repos: dict[str, list[dict]]):
+        self.repos = repos
+
+    def __call__(self, request: StubRequest) -> StubResponse:
+        variables = request.json()["variables"]
+        data, errors = {}, []
+        i = 0
+        while f"owner{i}" in variables:
+            repo = f"{variables[f'owner{i}']}/{variables[f'name{i}']}"
+            if repo not in self.repos:
+                data[f"r{i}"] = None
+                errors.append({"type": "NOT_FOUND", "message": f"Could not resolve to a Repository with the name '{repo}'."})
+            else:
+                data[f"r{i}"] = {"issues": self.page(repo, variables, i)}
+            i += 1
+        body = {"data": data}
+        if errors:
+            body["errors"] = errors
+        return StubResponse(200, body)
+
+    def page(self, repo: str, variables: dict, i: int) -> dict:
+        issues = self.repos[repo]
+        if variables["labels"]:
+            issues = [issue for issue in issues if set(issue["labels"]) & set(variables["labels"])]
+        start = int(variables[f"after{i}"] or 0)
+        end = start + variables["pageSize"]
+        return {
+            "nodes": [
+                {
+                    "number": issue["number"],
+                    "url": issue.get("url", f"https://github.com/{repo}/issues/{issue['number']}"),
+                    "title": f"Issue {issue['number']}",
+                    "body": f"Body of {issue['number']}",
+                    "labels": {"nodes": [{"name": label} for label in issue["labels"]]},
+                }
+                for issue in issues[start:end]
+            ],
+            "pageInfo": {"hasNextPage": end < len(issues), "endCursor": str(end)},
+        }
+
+
+def issues(count: int, labels=("agent-ok",)) -> list[dict]:
+    return [{"number": n, "labels": list(labels)} for n in range(1, count + 1)]
+
+
+def fetch(stub: StubGitHub, repos, **options) -> list[dict]:
+    async def run():
+        async with GitHubClient("token", base_url=stub.url) as github:
+            return await fetch_issues(github, repos, **options)
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def stub():
+    with StubGitHub() as stub:
+        yield stub
+
+
+class TestFetchIssues:
+    def test_paginates(self, stub):
+        stub.handle("POST", "/graphql", FakeGraphQL({"owner/repo": issues(150)}))
+
+        res = fetch(stub, ["owner/repo"])
+
+        assert [issue["number"] for issue in res] == list(range(1, 151))
+        assert res[0] == {
+            "url": "https://github.com/owner/repo/issues/1",
+            "owner": "owner",
+            "repo": "repo",
+            "number": 1,
+            "title": "Issue 1",
+            "body": "Body of 1",
+            "labels": ["agent-ok"],
+        }
+        assert len(stub.requests_to("POST", "/graphql")) == 2
+
+    def test_batches_repos_into_one_query(self, stub):
+        repos = {f"owner/repo{n}": issues(3) for n in range(20)}
+        stub.handle("POST", "/graphql", FakeGraphQL(repos))
+
+        res = fetch(stub, list(repos), repos_per_query=10)
+
+        assert len(res) == 60
+        assert len(stub.requests_to("POST", "/graphql")) == 2
+
+    def test_only_requeries_repos_with_more_pages(self, stub):
+        stub.handle("POST", "/graphql", FakeGraphQL({"owner/big": issues(5), "owner/small": issues(1)}))
+
+        res = fetch(stub, ["owner/big", "owner/small"], page_size=2)
+
+        assert len(res) == 6
+        queried = [set(k for k in r.json()["variables"] if k.startswith("name")) for r in stub.requests]
+        assert queried == [{"name0", "name1"}, {"name0"}, {"name0"}]
+
+    def test_filters_by_label(self, stub):
+        stub.handle(
+            "POST",
+            "/graphql",
+            FakeGraphQL({"owner/repo": issues(2) + [{"number": 3, "labels": ["bug"]}]}),
+        )
+
+        res = fetch(stub, ["owner/repo"], labels=["agent-ok"])
+
+        assert [issue["number"] for issue in res] == [1, 2]
+        assert stub.requests[0].json()["variables"]["labels"] == ["agent-ok"]
+
+    def test_deduplicates(self, stub):
+        # A transferred issue is reported by both repos under the same url
+        moved = {"number": 9, "labels": [], "url": "https://github.com/owner/b/issues/9"}
+        stub.handle("POST", "/graphql", FakeGraphQL({"owner/a": [moved], "owner/b": [moved]}))
+
+        res = fetch(stub, ["owner/a", "owner/b", "https://github.com/owner/a"])
+
+        assert [issue["url"] for issue in res] == ["https://github.com/owner/b/issues/9"]
+        assert len(stub.requests[0].json()["variables"]) == 2 + 2 * 3
+
+    def test_missing_repo(self, stub):
+        stub.handle("POST", "/graphql", FakeGraphQL({}))
+
+        with pytest.raises(ValueError, match="Could not resolve to a Repository"):
+            fetch(stub, ["owner/missing"])
+
+    def test_http_error(self, stub):
+        stub.route("POST", "/graphql", StubResponse(401, {"message": "Bad credentials"}))
+
+        with pytest.raises(ValueError, match="Bad credentials"):
+            fetch(stub, ["owner/repo"])
+
+
+class TestParseRepo:
+    def test_parse(self):
+        assert parse_repo("owner/repo") == ("owner", "repo")
+        assert parse_repo("https://github.com/owner/repo/") == ("owner", "repo")
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            parse_repo("owner")
+        with pytest.raises(ValueError):
+            parse_repo("owner/repo/issues")
+
+
+def test_read_repos(tmp_path):
+    repos_file = tmp_path / "repos.txt"
+    repos_file.write_text("# comment\nowner/a\n\nowner/b\n")
+
+    assert read_repos(["owner/b", "owner/c"], str(repos_file)) == ["owner/b", "owner/c", "owner/a"]
+
+
+class TestHandledIssues:
+    def test_records_successful_jobs(self, tmp_path):
+        path = tmp_path / "results" / "handled.json"
+        state = HandledIssues(str(path))
+
+        state.record({"issue_url": "https://github.com/o/r/issues/1", "ok": True, "status": "changes_made", "pr_url": "pr"})
+        state.record({"issue_url": "https://github.com/o/r/issues/2", "ok": False, "error": "boom"})
+
+        saved = json.loads(path.read_text())
+        assert list(saved) == ["https://github.com/o/r/issues/1"]
+        assert saved["https://github.com/o/r/issues/1"]["pr_url"] == "pr"
+
+    def test_skips_handled_issues(self, tmp_path):
+        path = tmp_path / "handled.json"
+        HandledIssues(str(path)).record({"issue_url": "https://github.com/o/r/issues/1", "ok": True})
+
+        state = HandledIssues(str(path))
+
+        assert "https://github.com/o/r/issues/1" in state
+        assert state.unhandled(
+            ["https://github.com/o/r/issues/1", "https://github.com/o/r/issues/2"]
+        ) == ["https://github.com/o/r/issues/2"]
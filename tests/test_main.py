@@ -1,5 +1,12 @@
+import asyncio
+import os
+import time
 import pytest
-from llama_agent.main import main
+from llama_agent.github import GitHubClient
+from llama_agent.index_cache import IndexCache
+from llama_agent.main import main, solve_issue_async
+from tests.fake_github import FakeGitHub, Latency
+from tests.test_agent import AsyncScriptedClient
 
 class TestApp:
     @pytest.fixture(autouse=True)
@@ -27,4 +34,93 @@ class TestApp:
         ):
             main(
                 issue_url="https://github.com/aidando73/bitbucket-syntax-highlighting/issues/67"
-            )
\ No newline at end of file
+            )
+
+def scripted_agent(delay: float = 0) -> AsyncScriptedClient:
+    return AsyncScriptedClient(
+        [
+            '<tool>[edit_file(path="/workspace/repo/file.txt", old_str="old", new_str="new")]</tool>',
+            "<tool>[finish()]</tool>",
+            "Update file",
+            "Changed old to new",
+        ],
+        delay=delay,
+    )
+
+
+@pytest.fixture
+def fake_github(tmp_path, monkeypatch):
+    with FakeGitHub(str(tmp_path / "github")) as github:
+        for name, value in github.env().items():
+            monkeypatch.setenv(name, value)
+        github.add_repo("owner", "repo", {"file.txt": "old content"})
+        yield github
+
+
+def solve(fake_github: FakeGitHub, client, issue_url: str, sandbox_dir: str) -> dict:
+    async def run():
+        async with GitHubClient("token") as github:
+            return await solve_issue_async(
+                client,
+                "token",
+                issue_url,
+                sandbox_dir=sandbox_dir,
+                github=github,
+                index_cache=IndexCache(os.path.join(sandbox_dir, "index_cache.sqlite")),
+            )
+
+    return asyncio.run(run())
+
+
+class TestEndToEnd:
+    def test_opens_pr_with_changes(self, fake_github, tmp_path):
+        issue_url = fake_github.add_issue("owner", "repo", 1, "Fix file", "Replace old with new")
+
+        res = solve(fake_github, scripted_agent(), issue_url, str(tmp_path / "sandbox"))
+
+        assert res["status"] == "changes_made"
+        assert res["pr_url"] == "https://github.com/owner/repo/pull/1"
+        [pull] = fake_github.pulls
+        assert pull["title"] == "#1 - Update file"
+        assert pull["base"] == "main"
+        assert pull["head"] == res["branch"]
+        assert fake_github.branch_files("owner", "repo", res["branch"]) == {"file.txt": "new content"}
+        assert fake_github.branch_files("owner", "repo", "main") == {"file.txt": "old content"}
+
+    def test_opens_pr_without_changes(self, fake_github, tmp_path):
+        issue_url = fake_github.add_issue("owner", "repo", 2, "Question", "Is this right?")
+        client = AsyncScriptedClient(["<tool>[finish()]</tool>", "It is right"])
+
+        res = solve(fake_github, client, issue_url, str(tmp_path / "sandbox"))
+
+        assert res["status"] == "no_changes_made"
+        assert "It is right" in fake_github.pulls[0]["body"]
+        assert ".keep" in fake_github.branch_files("owner", "repo", res["branch"])
+
+    def test_concurrent_issues(self, fake_github, tmp_path):
+        fake_github.latency = fake_github.pr_latency = Latency(0.2)
+        issue_urls = [fake_github.add_issue("owner", "repo", n, f"Issue {n}", "Body") for n in range(1, 5)]
+
+        async def run():
+            async with GitHubClient("token") as github:
+                return await asyncio.gather(
+                    *(
+                        solve_issue_async(
+                            scripted_agent(delay=0.1),
+                            "token",
+                            issue_url,
+                            sandbox_dir=str(tmp_path / f"sandbox{i}"),
+                            github=github,
+                            index_cache=IndexCache(str(tmp_path / "index_cache.sqlite")),
+                        )
+                        for i, issue_url in enumerate(issue_urls)
+                    )
+                )
+
+        start = time.perf_counter()
+        results = asyncio.run(run())
+
+        assert len({res["branch"] for res in results}) == 4
+        assert sorted(pull["number"] for pull in fake_github.pulls) == [1, 2, 3, 4]
+        # Each run waits 0.4s on the API and 0.4s on inference. Run one after another they'd take over 3s
+        assert time.perf_counter() - start < 3
@@ -0,0 +1,140 @@
+import os
+import pytest
+from subprocess import run
+from llama_agent.sandbox import WorktreePool, clone, clone_args, git
+
+
+def commit_file(repo: str, name: str, content: str) -> None:
+    with open(os.path.join(repo, name), "w") as f:
+        f.write(content)
+    run(
+        f"cd {repo} && git add . && git commit -m 'Add {name}'",
+        shell=True,
+        check=True,
+        capture_output=True,
+    )
+
+
+class TestWorktreePool:
+    @pytest.fixture(autouse=True)
+    def setup_method(self, tmp_path):
+        # A local repo plays the part of the GitHub remote
+        self.remote = str(tmp_path / "remote")
+        os.makedirs(self.remote)
+        run(
+            f"cd {self.remote} && git init -b main",
+            shell=True,
+            check=True,
+            capture_output=True,
+        )
+        commit_file(self.remote, "file.txt", "hello")
+
+        self.pool = WorktreePool(
+            "owner",
+            "repo",
+            self.remote,
+            mirrors_dir=str(tmp_path / "mirrors"),
+            worktrees_dir=str(tmp_path / "worktrees"),
+        )
+
+    def test_acquire_checks_out_default_branch(self):
+        with self.pool.acquire() as worktree:
+            assert worktree.default_branch == "main"
+            assert worktree.path == os.path.join(worktree.sandbox_dir, "repo")
+            with open(os.path.join(worktree.path, "file.txt")) as f:
+                assert f.read() == "hello"
+
+    def test_concurrent_acquires_get_different_worktrees(self):
+        with self.pool.acquire() as first, self.pool.acquire() as second:
+            assert first.path != second.path
+            assert os.path.exists(os.path.join(second.path, "file.txt"))
+
+    def test_released_worktree_is_reset_and_reused(self):
+        with self.pool.acquire() as worktree:
+            path = worktree.path
+            with open(os.path.join(path, "file.txt"), "w") as f:
+                f.write("changed")
+            open(os.path.join(path, "untracked.txt"), "w").close()
+            git("checkout", "-b", "agent-branch", cwd=path)
+            git("commit", "-am", "Agent changes", cwd=path)
+
+        with self.pool.acquire() as worktree:
+            assert worktree.path == path
+            with open(os.path.join(path, "file.txt")) as f:
+                assert f.read() == "hello"
+            assert not os.path.exists(os.path.join(path, "untracked.txt"))
+
+    def test_fetches_new_commits(self):
+        with self.pool.acquire():
+            pass
+        commit_file(self.remote, "new.txt", "new")
+
+        with self.pool.acquire() as worktree:
+            assert os.path.exists(os.path.join(worktree.path, "new.txt"))
+
+    def test_push_from_worktree(self):
+        with self.pool.acquire() as worktree:
+            commit_file(worktree.path, "fix.txt", "fix")
+            git("checkout", "-b", "llama-agent-1", cwd=worktree.path)
+            git("push", "origin", "llama-agent-1", cwd=worktree.path)
+
+        branches = git("branch", "--list", cwd=self.remote)
+        assert "llama-agent-1" in branches
+
+
+class TestClone:
+    @pytest.fixture(autouse=True)
+    def setup_method(self, tmp_path):
+        self.tmp_path = tmp_path
+        source = str(tmp_path / "source")
+        os.makedirs(source)
+        run(f"cd {source} && git init -b main", shell=True, check=True, capture_output=True)
+        commit_file(source, "a.txt", "a")
+        commit_file(source, "b.txt", "b")
+        # git ignores --depth and --filter for local paths, so clone over file://
+        self.remote_url = f"file://{source}"
+
+    def test_unknown_strategy(self):
+        with pytest.raises(ValueError, match="Unknown clone strategy: sparse"):
+            clone_args("sparse")
+
+    def test_reference_needs_a_repo(self):
+        with pytest.raises(ValueError, match="needs a local repo"):
+            clone_args("reference")
+
+    @pytest.mark.parametrize("strategy", ["full", "shallow", "blobless"])
+    def test_clone(self, strategy):
+        path = str(self.tmp_path / strategy)
+
+        clone(self.remote_url, path, strategy=strategy)
+
+        assert os.path.exists(os.path.join(path, "b.txt"))
+        commits = git("rev-list", "--count", "HEAD", cwd=path)
+        assert commits == ("1" if strategy == "shallow" else "2")
+
+    def test_reference(self):
+        cache = str(self.tmp_path / "cache")
+        clone(self.remote_url, cache)
+        path = str(self.tmp_path / "clone")
+
+        clone(self.remote_url, path, strategy="reference", reference=cache)
+
+        with open(os.path.join(path, ".git", "objects", "info", "alternates")) as f:
+            assert cache in f.read()
+
+    def test_shallow_mirror_stays_shallow(self):
+        pool = WorktreePool(
+            "owner",
+            "repo",
+            self.remote_url,
+            mirrors_dir=str(self.tmp_path / "mirrors"),
+            worktrees_dir=str(self.tmp_path / "worktrees"),
+            clone_strategy="shallow",
+        )
+        with pool.acquire():
+            pass
+        commit_file(self.remote_url[len("file://") :], "c.txt", "c")
+
+        with pool.acquire() as worktree:
+            assert os.path.exists(os.path.join(worktree.path, "c.txt"))
+            assert pool.mirror.is_shallow()
@@ -0,0 +1,119 @@
+import os
+import re
+import pytest
+from subprocess import run
+from llama_agent.search import SearchMatch, TrigramIndex, required_literals, trigrams
+
+
+class TestTrigramIndex:
+    @pytest.fixture(autouse=True)
+    def setup_method(self, tmp_path):
+        self.repo = str(tmp_path / "repo")
+        os.makedirs(os.path.join(self.repo, "app", "views"))
+        self.write("app/models.py", "class User(Model):\n    name = CharField()\n\n\nclass Group(Model):\n    pass\n")
+        self.write("app/views/user.py", "from app.models import User\n\ndef user_view(request):\n    return User.objects.all()\n")
+        self.write("README.md", "# App\nSee app/models.py for the User model\n")
+        with open(os.path.join(self.repo, "logo.png"), "wb") as f:
+            f.write(b"\x89PNG\0\0User")
+        run(
+            f"cd {self.repo} && git init -q && git add . && git commit -q -m 'Initial commit'",
+            shell=True,
+            check=True,
+        )
+        self.index = TrigramIndex.from_repo(self.repo)
+
+    def write(self, path: str, content: str) -> None:
+        with open(os.path.join(self.repo, path), "w") as f:
+            f.write(content)
+
+    def test_literal(self):
+        matches, more = self.index.search("class Group")
+
+        assert matches == [SearchMatch("app/models.py", 5, "class Group(Model):")]
+        assert not more
+
+    def test_one_match_per_line_in_path_order(self):
+        matches, _ = self.index.search("User")
+
+        assert [(m.path, m.line_number) for m in matches] == [
+            ("README.md", 2),
+            ("app/models.py", 1),
+            ("app/views/user.py", 1),
+            ("app/views/user.py", 4),
+        ]
+
+    def test_case_insensitive(self):
+        matches, _ = self.index.search("USER_VIEW", case_sensitive=False)
+
+        assert [(m.path, m.line_number) for m in matches] == [("app/views/user.py", 3)]
+        assert self.index.search("USER_VIEW")[0] == []
+
+    def test_case_insensitive_non_ascii(self):
+        self.write("names.txt", "Élan vital\n")
+        self.index.update_file("names.txt")
+
+        matches, _ = self.index.search("élan vital", case_sensitive=False)
+
+        assert [(m.path, m.line) for m in matches] == [("names.txt", "Élan vital")]
+        assert self.index.search("élan vital")[0] == []
+
+    def test_regex(self):
+        matches, _ = self.index.search(r"^class \w+\(Model\)", regex=True)
+
+        assert [m.line for m in matches] == ["class User(Model):", "class Group(Model):"]
+
+    def test_regex_without_literals(self):
+        matches, _ = self.index.search(r"\w+_view", regex=True)
+
+        assert [m.path for m in matches] == ["app/views/user.py"]
+
+    def test_invalid_regex(self):
+        with pytest.raises(re.error):
+            self.index.search("(unclosed", regex=True)
+
+    def test_path_prefix(self):
+        matches, _ = self.index.search("User", path_prefix="app/views")
+
+        assert {m.path for m in matches} == {"app/views/user.py"}
+        assert self.index.search("User", path_prefix="app/view")[0] == []
+
+    def test_pages(self):
+        first, more = self.index.search("User", limit=3)
+        second, more_after_second = self.index.search("User", limit=3, offset=3)
+
+        assert len(first) == 3 and more
+        assert second == [SearchMatch("app/views/user.py", 4, "    return User.objects.all()")]
+        assert not more_after_second
+
+    def test_skips_binary_files(self):
+        assert "logo.png" not in {m.path for m in self.index.search("User")[0]}
+
+    def test_update_file(self):
+        self.write("app/models.py", "class Team(Model):\n    pass\n")
+
+        self.index.update_file("app/models.py")
+
+        assert self.index.search("class Group")[0] == []
+        assert [m.line for m in self.index.search("class Team")[0]] == ["class Team(Model):"]
+
+    def test_update_new_file(self):
+        self.write("app/forms.py", "class UserForm(Form):\n    pass\n")
+
+        self.index.update_file("app/forms.py")
+
+        assert [m.path for m in self.index.search("UserForm")[0]] == ["app/forms.py"]
+
+
+class TestRequiredLiterals:
+    def test_literals(self):
+        assert required_literals(r"def \w+_view\(") == ["def ", "_view("]
+
+    def test_alternation_needs_a_full_scan(self):
+        assert required_literals("foo|barbaz") == []
+
+    def test_short_and_optional_parts_are_dropped(self):
+        assert required_literals("abc?defg") == ["defg"]
+
+
+def test_trigrams_are_case_insensitive():
+    assert trigrams(b"AbCd") == trigrams(b"abcd") == {(97, 98, 99), (98, 99, 100)}
@@ -0,0 +1,140 @@
+import asyncio
+from llama_agent.aio import as_async_client
+from llama_agent.streaming import stream_completion, stream_completion_async, TOOL_CALL_END
+
+
+class FakeChunk:
+    def __init__(self, delta: str):
+        self.delta = delta
+
+
+class FakeStream:
+    def __init__(self, deltas: list[str]):
+        self.deltas = deltas
+        self.consumed = 0
+        self.closed = False
+
+    def __iter__(self):
+        for delta in self.deltas:
+            self.consumed += 1
+            yield FakeChunk(delta)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeInference:
+    def __init__(self, stream: FakeStream):
+        self.stream = stream
+        self.kwargs = None
+
+    def completion(self, **kwargs):
+        self.kwargs = kwargs
+        return self.stream
+
+
+class FakeClient:
+    def __init__(self, deltas: list[str]):
+        self.inference = FakeInference(FakeStream(deltas))
+
+
+class TestStreamCompletion:
+    def test_stops_after_tool_block(self):
+        client = FakeClient(
+            ["<thinking>hi</thinking>", "<tool>[finish()]", "</tool>", " more", " text"]
+        )
+
+        res = stream_completion(client, "model", "prompt")
+
+        assert res.content == "<thinking>hi</thinking><tool>[finish()]</tool>"
+        assert res.stopped_early
+        assert res.time_to_first_token is not None
+        assert res.time_to_tool_call is not None
+        assert client.inference.stream.consumed == 3
+        assert client.inference.stream.closed
+
+    def test_tag_split_across_chunks(self):
+        client = FakeClient(["<tool>[finish()]</to", "ol> trailing", "ignored"])
+
+        res = stream_completion(client, "model", "prompt")
+
+        assert res.content == "<tool>[finish()]</tool>"
+        assert client.inference.stream.consumed == 2
+
+    def test_no_tool_call_reads_whole_stream(self):
+        client = FakeClient(["I can't ", "solve ", "this"])
+
+        res = stream_completion(client, "model", "prompt")
+
+        assert res.content == "I can't solve this"
+        assert not res.stopped_early
+        assert res.time_to_tool_call is None
+
+    def test_closing_tag_without_opening_tag_does_not_stop(self):
+        client = FakeClient(["</tool> stray", " text"])
+
+        res = stream_completion(client, "model", "prompt")
+
+        assert res.content == "</tool> stray text"
+        assert not res.stopped_early
+
+    def test_stop_at_tool_call_disabled(self):
+        client = FakeClient(["<tool>[finish()]</tool>", " more"])
+
+        res = stream_completion(client, "model", "prompt", stop_at_tool_call=False)
+
+        assert res.content == "<tool>[finish()]</tool> more"
+
+    def test_stop_sequences_passed_and_tag_restored(self):
+        # The server strips the stop sequence from the output
+        client = FakeClient(["<tool>[finish()]"])
+
+        res = stream_completion(client, "model", "prompt", use_stop_sequences=True)
+
+        assert res.content == "<tool>[finish()]" + TOOL_CALL_END
+        assert client.inference.kwargs["stream"] is True
+        assert client.inference.kwargs["sampling_params"]["stop"] == [TOOL_CALL_END]
+
+
+class FakeAsyncStream(FakeStream):
+    async def __aiter__(self):
+        for delta in self.deltas:
+            self.consumed += 1
+            yield FakeChunk(delta)
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeAsyncInference(FakeInference):
+    async def completion(self, **kwargs):
+        self.kwargs = kwargs
+        return self.stream
+
+
+class FakeAsyncClient:
+    def __init__(self, deltas: list[str]):
+        self.inference = FakeAsyncInference(FakeAsyncStream(deltas))
+
+
+class TestStreamCompletionAsync:
+    def test_stops_after_tool_block(self):
+        client = FakeAsyncClient(["<tool>[finish()]</to", "ol> trailing", "ignored"])
+
+        res = asyncio.run(stream_completion_async(client, "model", "prompt"))
+
+        assert res.content == "<tool>[finish()]</tool>"
+        assert res.stopped_early
+        assert client.inference.stream.consumed == 2
+        assert client.inference.stream.closed
+
+    def test_sync_client_on_threads(self):
+        client = FakeClient(["<tool>[finish()]", "</tool>", " more"])
+
+        res = asyncio.run(
+            stream_completion_async(as_async_client(client), "model", "prompt")
+        )
+
+        assert res.content == "<tool>[finish()]</tool>"
+        assert client.inference.stream.consumed == 2
+        assert client.inference.stream.closed
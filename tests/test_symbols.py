@@ -0,0 +1,148 @@
+import asyncio
+import os
+import pytest
+from subprocess import run
+import llama_agent.symbols as symbols
+from llama_agent.symbols import Symbol, SymbolIndex, module_name, parse_symbols
+
+MODELS = """
+from django.db.models import Model
+
+DEFAULT_NAME = "user"
+
+
+class User(Model):
+    name: str = DEFAULT_NAME
+
+    def save(self, *args):
+        count = 0
+        return super().save(*args)
+
+    class Meta:
+        ordering = ["name"]
+
+
+def get_user(pk):
+    return User.objects.get(pk=pk)
+"""
+
+VIEWS = """
+from app.models import User, get_user
+
+
+def user_view(request, pk):
+    user = get_user(pk)
+    user.save()
+    return user
+"""
+
+
+class TestParseSymbols:
+    def test_definitions(self):
+        definitions, _ = parse_symbols("app/models.py", MODELS)
+
+        assert [(d.name, d.line_number, d.kind) for d in definitions] == [
+            ("app.models.DEFAULT_NAME", 4, "variable"),
+            ("app.models.User", 7, "class"),
+            ("app.models.User.name", 8, "variable"),
+            ("app.models.User.save", 10, "function"),
+            ("app.models.User.Meta", 14, "class"),
+            ("app.models.User.Meta.ordering", 15, "variable"),
+            ("app.models.get_user", 18, "function"),
+        ]
+
+    def test_references(self):
+        _, references = parse_symbols("app/views.py", VIEWS)
+
+        assert {(r.name, r.line_number) for r in references} >= {
+            ("User", 2),
+            ("get_user", 2),
+            ("get_user", 6),
+            ("save", 7),
+        }
+
+    def test_syntax_error(self):
+        with pytest.raises(SyntaxError):
+            parse_symbols("broken.py", "def broken(:\n")
+
+    def test_module_name(self):
+        assert module_name("app/models.py") == "app.models"
+        assert module_name("app/__init__.py") == "app"
+        assert module_name("__init__.py") == "__init__"
+
+
+class TestSymbolIndex:
+    @pytest.fixture(autouse=True)
+    def setup_method(self, tmp_path):
+        self.repo = str(tmp_path / "repo")
+        os.makedirs(os.path.join(self.repo, "app"))
+        self.write("app/models.py", MODELS)
+        self.write("app/views.py", VIEWS)
+        self.write("app/broken.py", "def broken(:\n")
+        self.write("README.md", "def not_python(): pass\n")
+        run(
+            f"cd {self.repo} && git init -q && git add . && git commit -q -m 'Initial commit'",
+            shell=True,
+            check=True,
+        )
+
+    def write(self, path: str, content: str) -> None:
+        with open(os.path.join(self.repo, path), "w") as f:
+            f.write(content)
+
+    def test_find_definitions(self):
+        index = SymbolIndex.from_repo(self.repo)
+
+        assert index.find_definitions("save") == [
+            Symbol("app.models.User.save", "app/models.py", 10, "function")
+        ]
+        assert index.find_definitions("User.save") == index.find_definitions("save")
+        assert index.find_definitions("app.models.User.save") == index.find_definitions("save")
+        assert index.find_definitions("Group.save") == []
+        assert index.find_definitions("not_python") == []
+
+    def test_find_references(self):
+        index = SymbolIndex.from_repo(self.repo)
+
+        assert [(r.path, r.line_number) for r in index.find_references("app.models.get_user")] == [
+            ("app/views.py", 2),
+            ("app/views.py", 6),
+        ]
+
+    def test_path_prefix(self):
+        index = SymbolIndex.from_repo(self.repo)
+
+        assert index.find_references("User", path_prefix="app/views.py") != []
+        assert index.find_references("User", path_prefix="lib") == []
+
+    def test_update_file(self):
+        index = SymbolIndex.from_repo(self.repo)
+        self.write("app/models.py", "class Group:\n    def save(self):\n        pass\n")
+
+        index.update_file("app/models.py")
+
+        assert index.find_definitions("User") == []
+        assert index.find_definitions("save") == [
+            Symbol("app.models.Group.save", "app/models.py", 2, "function")
+        ]
+        # Other files are untouched
+        assert len(index.find_references("get_user")) == 2
+
+    def test_parallel_matches_serial(self, monkeypatch):
+        serial = SymbolIndex.from_repo(self.repo, workers=1)
+        monkeypatch.setattr(symbols, "PARALLEL_PARSE_MIN_FILES", 0)
+
+        parallel = SymbolIndex.from_repo(self.repo, workers=2)
+
+        assert len(parallel) == len(serial) == 3
+        for name in ("User", "save", "get_user", "DEFAULT_NAME"):
+            assert parallel.find_definitions(name) == serial.find_definitions(name)
+            assert parallel.find_references(name) == serial.find_references(name)
+
+    def test_parallel_from_a_worker_thread(self, monkeypatch):
+        # How tool calls build it: on a worker thread, while the event loop's thread carries on
+        monkeypatch.setattr(symbols, "PARALLEL_PARSE_MIN_FILES", 0)
+
+        index = asyncio.run(asyncio.to_thread(SymbolIndex.from_repo, self.repo, 2))
+
+        assert len(index) == 3